@@ -119,6 +119,18 @@ export type ForgeBondTransferEvent = Event<
   }
 >;
 
+// On Tezos the instruments send their events in one list, each with the
+// name and payload it would have alone.
+export const FORGEBOND_CONTRACT_EVENT_EVENTS = 'events';
+export type ForgeBondEventsPayload = {
+  name: string;
+  payload: unknown;
+}[];
+export type ForgeBondEventsEvent = Event<
+  typeof FORGEBOND_CONTRACT_EVENT_EVENTS,
+  ForgeBondEventsPayload
+>;
+
 export type ForgeBondAllEvents =
   | ForgeBondSubscriptionInitiatedEvent
   | ForgeBondTradeInitiatedEvent
@@ -128,6 +140,15 @@ export type ForgeBondAllEvents =
   | ForgeBondSettlementTransactionCanceledEvent
   | ForgeBondTransferEvent;
 
+// The events of an events event, as if each had been sent alone.
+export const splitEvents = (
+  event: ForgeBondEventsEvent,
+): ForgeBondAllEvents[] =>
+  event.payload.map(
+    ({ name, payload }) =>
+      ({ ...event, eventName: name, payload } as ForgeBondAllEvents),
+  );
+
 export const OPERATION_TYPE_SUBSCRIPTION_VALUE = '1';
 export const OPERATION_TYPE_SUBSCRIPTION = 'Subscription';
 
@@ -627,6 +648,19 @@ export class ForgeBond<
     );
   }
 
+  public events(
+    from?: number,
+    listenBlockchainSpecificParams?: Partial<
+      BlockchainSpecificParamsOf<Driver>
+    >,
+  ): Observable<ForgeBondEventsEvent> {
+    return this._listen(
+      FORGEBOND_CONTRACT_EVENT_EVENTS,
+      listenBlockchainSpecificParams,
+      from,
+    );
+  }
+
   public allEvents(
     from?: number,
     listenBlockchainSpecificParams?: Partial<
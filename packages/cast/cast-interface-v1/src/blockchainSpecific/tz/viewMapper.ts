@@ -1,4 +1,4 @@
-import { MichelsonMap } from '@taquito/taquito';
+import { BigMapAbstraction, MichelsonMap } from '@taquito/taquito';
 import BigNumber from 'bignumber.js';
 import { EventMappers, ViewMappers } from '@castframework/blockchain-driver-tz';
 
@@ -68,8 +68,10 @@ export interface SettlementTransaction {
   txHash: string;
 }
 
+// big_maps are not loaded with the storage: their values are read by key.
 export interface SettlementTransactionRepository {
-  settlementTransactionById: MichelsonMap<string, SettlementTransaction>;
+  settlementTransactionById: BigMapAbstraction;
+  operationTypeByOperationId: BigMapAbstraction;
 }
 
 export interface Balance {
@@ -77,6 +79,13 @@ export interface Balance {
   locked: BigNumber;
 }
 
+// Addresses numbered in the order they were added, some more than once:
+// the big_maps keyed by address cannot be enumerated.
+export interface AddressIndex {
+  count: BigNumber;
+  addresses: BigMapAbstraction;
+}
+
 export interface ForgeTokenStorage extends ContractWithEventsStorage {
   owner: string;
   currentSupply: BigNumber;
@@ -85,9 +94,12 @@ export interface ForgeTokenStorage extends ContractWithEventsStorage {
   isinCode: string;
   symbol: string;
   name: string;
-  operatorsAuthorizations: MichelsonMap<string, BigNumber[]>;
+  // The roles of an operator, as a bit mask.
+  operatorsAuthorizations: BigMapAbstraction;
   settlementTransactionRepository: SettlementTransactionRepository;
-  balances: MichelsonMap<string, Balance>;
+  balances: BigMapAbstraction;
+  // The addresses holding a balance or a role, or that did.
+  accounts: AddressIndex;
 }
 
 export interface HoldValue {
@@ -158,40 +170,58 @@ export const ForgeTokenFactoryEventMappers: EventMappers = {
   },
 };
 
+const indexedAddresses = async (index: AddressIndex): Promise<string[]> => {
+  const addresses = await Promise.all(
+    Array.from({ length: index.count.toNumber() }, (_, i) =>
+      index.addresses.get<string>(i.toString()),
+    ),
+  );
+  return Array.from(
+    new Set(
+      addresses.filter((address): address is string => address !== undefined),
+    ),
+  );
+};
+
+// roles & (1 << role) != 0, BigNumber having no bitwise operators.
+const hasRole = (roles: BigNumber | undefined, role: number): boolean =>
+  roles !== undefined &&
+  !roles.dividedToIntegerBy(new BigNumber(2).pow(role)).mod(2).isZero();
+
+// The first operator of the accounts index holding the role.
+const operatorWithRole = async (
+  storage: ForgeTokenStorage,
+  role: number,
+): Promise<string | undefined> => {
+  for (const address of await indexedAddresses(storage.accounts)) {
+    const roles =
+      await storage.operatorsAuthorizations.get<BigNumber>(address);
+    if (hasRole(roles, role)) {
+      return address;
+    }
+  }
+  return undefined;
+};
+
 export const ForgeTokenViewMappers: ViewMappers<ForgeTokenStorage> = {
   isOperatorWithRoleAuthorized: async (
     storage: ForgeTokenStorage,
     methodParameters: unknown[],
-  ) => {
-    const operatorsAuthorizations = storage.operatorsAuthorizations;
-    const roleNameBN: BigNumber = new BigNumber(methodParameters[1] as number);
-
-    return (
-      operatorsAuthorizations.has(methodParameters[0] as string) &&
-      operatorsAuthorizations
-        .get(methodParameters[0] as string)
-        ?.some((value) => value.eq(roleNameBN))
-    );
-  },
+  ) =>
+    hasRole(
+      await storage.operatorsAuthorizations.get<BigNumber>(
+        methodParameters[0] as string,
+      ),
+      methodParameters[1] as number,
+    ),
   owner: async (storage: ForgeTokenStorage, methodParameters: unknown[]) =>
     storage.owner,
-  settler: async (storage: ForgeTokenStorage, methodParameters: unknown[]) => {
-    const entries = (await storage).operatorsAuthorizations.entries();
-    const obj = Array.from(entries).find(([, bb]) =>
-      bb.map((bn) => bn.toNumber()).includes(SETTLER_ROLE),
-    );
-    return obj === undefined ? undefined : obj[0];
-  },
+  settler: async (storage: ForgeTokenStorage, methodParameters: unknown[]) =>
+    operatorWithRole(await storage, SETTLER_ROLE),
   registrar: async (
     storage: ForgeTokenStorage,
     methodParameters: unknown[],
-  ) => {
-    const entries = (await storage).operatorsAuthorizations.entries();
-    const obj = Array.from(entries).find(([, bb]) =>
-      bb.map((bn) => bn.toNumber()).includes(REGISTRAR_ROLE),
-    );
-    return obj === undefined ? undefined : obj[0];
-  },
+  ) => operatorWithRole(await storage, REGISTRAR_ROLE),
   currentSupply: async (
     storage: ForgeTokenStorage,
     methodParameters: unknown[],
@@ -212,12 +242,22 @@ export const ForgeTokenViewMappers: ViewMappers<ForgeTokenStorage> = {
     storage: ForgeTokenStorage,
     methodParameters: unknown[],
   ) => {
-    const balances = Array.from(storage.balances.entries());
-    return balances.map(([address, balance]) => ({
-      _balance: balance.balance,
-      _address: address,
-      _locked: balance.locked,
-    }));
+    const addresses = await indexedAddresses(storage.accounts);
+    const balances = await Promise.all(
+      addresses.map((address) => storage.balances.get<Balance>(address)),
+    );
+    return addresses.flatMap((address, i) => {
+      const balance = balances[i];
+      return balance === undefined
+        ? []
+        : [
+            {
+              _balance: balance.balance,
+              _address: address,
+              _locked: balance.locked,
+            },
+          ];
+    });
   },
   denomination: async () => 1000, // TODO: map to real denomination
   divisor: async () => 100,
@@ -231,7 +271,7 @@ export const ForgeTokenViewMappers: ViewMappers<ForgeTokenStorage> = {
   softBulletPeriodInMonths: async () => 0,
   getCurrentState: async (storage: ForgeTokenStorage, [txId]: [string]) => {
     const tx =
-      storage.settlementTransactionRepository.settlementTransactionById.get(
+      await storage.settlementTransactionRepository.settlementTransactionById.get<SettlementTransaction>(
         txId,
       );
 
@@ -239,7 +279,58 @@ export const ForgeTokenViewMappers: ViewMappers<ForgeTokenStorage> = {
   },
 };
 
+// An address passed raw by the driver or already decoded.
+const addressOf = (value: RawBytes | string): string =>
+  typeof value === 'string' ? value : hexToAddress(value.bytes);
+
+// The value of an event of the events entry point as the parameters of the
+// entry point taking it alone: the leaves of its records, in field order.
+const eventParameters = (value: unknown): unknown[] =>
+  value === null ||
+  typeof value !== 'object' ||
+  BigNumber.isBigNumber(value) ||
+  'bytes' in (value as object)
+    ? [value]
+    : Object.values(value as object).flatMap(eventParameters);
+
+const settlementPayload = (
+  settlementId: BigNumber,
+  operationType: BigNumber,
+) => {
+  const payload = {
+    settlementTransactionId: settlementId.toFixed(),
+    settlementTransactionOperationType: operationType.toFixed(),
+  };
+  if (
+    !isSingleSettlementTransaction(payload) ||
+    !isSettlementTransactionOperationType(payload)
+  ) {
+    throw new Error(`Bad return value format: ${payload}`);
+  }
+  return payload;
+};
+
+const operatorPayload = (methodParameters: unknown[]) => ({
+  by: addressOf(methodParameters[0] as RawBytes | string),
+  operator: addressOf(methodParameters[1] as RawBytes | string),
+  operatorRole: (methodParameters[2] as BigNumber).toNumber(),
+});
+
 export const ForgeTokenEventMappers: EventMappers = {
+  // The instruments send their events in a list to the events entry point,
+  // each decoded as { [eventName]: value } and mapped by the mapper of the
+  // entry point of the same name.
+  events: (method, methodParameters) => {
+    const events = methodParameters[0] as Record<string, unknown>[];
+    return events.map((event) => {
+      const [[name, value]] = Object.entries(event);
+      const mapper = ForgeTokenEventMappers[name];
+      if (name === 'events' || mapper === undefined) {
+        throw new Error(`Unknown event: ${name}`);
+      }
+      return { name, payload: mapper(name, eventParameters(value)) };
+    });
+  },
   SubscriptionInitiated: (method, methodParameters) => {
     const rawBN = methodParameters[0] as BigNumber;
     const payload = {
@@ -251,49 +342,44 @@ export const ForgeTokenEventMappers: EventMappers = {
     }
     return payload;
   },
-  PaymentTransferred: (method, methodParameters) => {
-    const ptRawBN0 = methodParameters[0] as BigNumber;
-    const ptRawBN1 = methodParameters[1] as BigNumber;
-
-    const payload = {
-      settlementTransactionId: ptRawBN0.toFixed(),
-      settlementTransactionOperationType: ptRawBN1.toFixed(),
-    };
-    if (
-      !isSingleSettlementTransaction(payload) ||
-      !isSettlementTransactionOperationType(payload)
-    ) {
-      throw new Error(`Bad return value format: ${payload}`);
-    }
-    return payload;
-  },
-  PaymentReceived: (method, methodParameters) => {
-    const prRawBN0 = methodParameters[0] as BigNumber;
-    const prRawBN1 = methodParameters[1] as BigNumber;
-
-    const payload = {
-      settlementTransactionId: prRawBN0.toFixed(),
-      settlementTransactionOperationType: prRawBN1.toFixed(),
-    };
-    if (
-      !isSingleSettlementTransaction(payload) ||
-      !isSettlementTransactionOperationType(payload)
-    ) {
-      throw new Error(`Bad return value format: ${payload}`);
-    }
-    return payload;
-  },
+  PaymentTransferred: (method, methodParameters) =>
+    settlementPayload(
+      methodParameters[0] as BigNumber,
+      methodParameters[1] as BigNumber,
+    ),
+  PaymentReceived: (method, methodParameters) =>
+    settlementPayload(
+      methodParameters[0] as BigNumber,
+      methodParameters[1] as BigNumber,
+    ),
   Transfer: (method, methodParameters) => {
-    const ttRawBytes0 = methodParameters[0] as RawBytes;
-    const ttRawBytes1 = methodParameters[1] as RawBytes;
+    const ttRawBytes0 = methodParameters[0] as RawBytes | string;
+    const ttRawBytes1 = methodParameters[1] as RawBytes | string;
     const value = methodParameters[2];
 
-    const fromAddress = hexToAddress(ttRawBytes0.bytes);
-    const toAddress = hexToAddress(ttRawBytes1.bytes);
     return {
-      _from: fromAddress,
-      _to: toAddress,
+      _from: addressOf(ttRawBytes0),
+      _to: addressOf(ttRawBytes1),
       _value: value,
     };
   },
+  // payment, then transfer.
+  DvPSettled: (method, methodParameters) => ({
+    ...settlementPayload(
+      methodParameters[0] as BigNumber,
+      methodParameters[1] as BigNumber,
+    ),
+    transfer: ForgeTokenEventMappers.Transfer(
+      'Transfer',
+      methodParameters.slice(2),
+    ),
+  }),
+  // A settlement transaction a best effort batch skipped.
+  SettlementFailed: (method, methodParameters) => ({
+    settlementTransactionId: (methodParameters[0] as BigNumber).toFixed(),
+    error: methodParameters[1] as string,
+  }),
+  newOperator: (method, methodParameters) => operatorPayload(methodParameters),
+  revokeOperator: (method, methodParameters) =>
+    operatorPayload(methodParameters),
 };
@@ -5,7 +5,10 @@ from browser import alert, window
 import traceback
 import inspect
 import sys
+import bisect
 import datetime
+import time
+import io as pyIo
 from types import FunctionType
 
 pyRange = range
@@ -18,6 +21,86 @@ pyBytes = bytes
 pyMap = map
 
 pyLen = len
+pySum = sum
+
+
+SCRIPT_FILENAME = "SmartPy Script"
+
+# Line numbers can be recorded "eager"ly (default), "lazy"ly (resolved
+# when first printed) or turned "off" (every node gets -1).
+line_no_modes = ["eager", "lazy", "off"]
+line_no_mode = "eager"
+
+
+def set_line_no_mode(mode):
+    global line_no_mode
+    if mode not in line_no_modes:
+        raise Exception(
+            "Bad line number mode '%s', expected one of %s"
+            % (mode, ", ".join(line_no_modes))
+        )
+    line_no_mode = mode
+
+
+class LazyLineNo:
+    """Line number of a script instruction, resolved on first use."""
+
+    # Line tables of script code objects, indexed by id.
+    lineTables = {}
+
+    def __init__(self, code, lasti):
+        self.code = code
+        self.lasti = lasti
+        self.line = None
+
+    def resolve(self):
+        if self.line is None:
+            entry = LazyLineNo.lineTables.get(id(self.code))
+            if entry is None or entry[0] is not self.code:
+                lines = pyList(self.code.co_lines())
+                entry = (self.code, [start for (start, _, _) in lines], lines)
+                LazyLineNo.lineTables[id(self.code)] = entry
+            (_, starts, lines) = entry
+            i = bisect.bisect_right(starts, self.lasti) - 1
+            line = lines[i][2] if 0 <= i and self.lasti < lines[i][1] else None
+            self.line = -1 if line is None else line
+        return self.line
+
+    def __index__(self):
+        return self.resolve()
+
+    __int__ = __index__
+
+    def __str__(self):
+        return str(self.resolve())
+
+    __repr__ = __str__
+
+    def __format__(self, spec):
+        return format(self.resolve(), spec)
+
+    def __eq__(self, other):
+        return self.resolve() == other
+
+    def __hash__(self):
+        return hash(self.resolve())
+
+
+def get_script_frame():
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_filename == SCRIPT_FILENAME:
+            return frame
+        frame = frame.f_back
+    return None
+
+
+# Line numbers by script call site (code object, last instruction), the
+# keys keeping their code objects alive. The depth of the script frame is
+# not cached: a library call site is reached from the script through
+# different chains of calls.
+callSiteLines = {}
+callSiteLazyLines = {}
 
 
 def get_line_no():
@@ -27,21 +110,138 @@ def get_line_no():
             if "exec" in line_info:
                 return pyInt(line_info.split(",")[0])
         return -1
-    else:
-        for x in inspect.stack():
-            if x.filename == "SmartPy Script":
-                return x.lineno
+    if line_no_mode == "off":
+        return -1
+    frame = get_script_frame()
+    if frame is None:
         return -1
+    key = (frame.f_code, frame.f_lasti)
+    if line_no_mode == "lazy" and hasattr(frame.f_code, "co_lines"):
+        line = callSiteLazyLines.get(key)
+        if line is None:
+            line = callSiteLazyLines[key] = LazyLineNo(frame.f_code, frame.f_lasti)
+        return line
+    line = callSiteLines.get(key)
+    if line is None:
+        line = callSiteLines[key] = frame.f_lineno
+    return line
+
+
+# Export strings of immutable nodes, shared between structurally equal nodes.
+exportTable = {}
+
+
+def intern_export(s):
+    return exportTable.setdefault(s, s)
+
+
+def is_frozen(x):
+    """Whether x can no longer change once built, so its export can be cached."""
+    if isinstance(x, Expr):
+        return x._frozen
+    if x is None or isinstance(x, (str, pyInt, float, LazyLineNo)):
+        return True
+    return isinstance(x, (TType, ExprStr, Verbatim))
+
+
+def structural_hash(x):
+    if isinstance(x, Expr):
+        return x._h
+    if x is None or isinstance(x, (str, pyInt, float)):
+        return hash(x)
+    if isinstance(x, TType):
+        return hash(x.export())
+    if isinstance(x, LazyLineNo):
+        return hash((id(x.code), x.lasti))
+    # Mutable values (blocks, contracts, maps, ...) are only equal to themselves.
+    return id(x)
+
+
+def export_to(x, out):
+    """Writes the s-expression of x to the file-like out."""
+    if isinstance(x, str):
+        out.write('"%s"' % x)
+    elif hasattr(x, "export_to"):
+        x.export_to(out)
+    elif hasattr(x, "export"):
+        out.write(x.export())
+    else:
+        out.write(str(x))
+
+
+def export_to_string(x):
+    out = pyIo.StringIO()
+    x.export_to(out)
+    return out.getvalue()
+
+
+def output_size(out):
+    """Characters written to out so far, when out can tell."""
+    try:
+        return out.tell()
+    except (AttributeError, OSError):
+        return 0
+
+
+def export_all_to(xs, out, sep=" "):
+    first = True
+    for x in xs:
+        if not first:
+            out.write(sep)
+        first = False
+        export_to(x, out)
+
+
+# Number of Expr nodes built so far, read by the profiler.
+exprCount = 0
 
 
 class Expr:
+    # Attribute and open_variant caches, update handlers and the block bound
+    # by sp.for, sp.if_some, ... are only allocated when first needed.
+    __slots__ = (
+        "_f",
+        "_l",
+        "_h",
+        "_frozen",
+        "_export",
+        "_attributes",
+        "_opens",
+        "_onUpdateHandlers",
+        "_block",
+    )
+
     def __init__(self, f, l):
-        self._f = f
-        self._l = l
-        self.onUpdateHandlers = []
-        self.attributes = {}
-        self.opens = {}
-        setattr(self, "__initialized", True)
+        global exprCount
+        exprCount += 1
+        setSlot = object.__setattr__
+        setSlot(self, "_f", f)
+        setSlot(self, "_l", l)
+        setSlot(self, "_h", hash((f,) + pyTuple(structural_hash(x) for x in l)))
+        setSlot(self, "_frozen", all(is_frozen(x) for x in l))
+        setSlot(self, "_export", None)
+        setSlot(self, "_attributes", None)
+        setSlot(self, "_opens", None)
+        setSlot(self, "_onUpdateHandlers", None)
+        setSlot(self, "_block", None)
+
+    @property
+    def onUpdateHandlers(self):
+        if self._onUpdateHandlers is None:
+            object.__setattr__(self, "_onUpdateHandlers", [])
+        return self._onUpdateHandlers
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            object.__setattr__(self, "_attributes", {})
+        return self._attributes
+
+    @property
+    def opens(self):
+        if self._opens is None:
+            object.__setattr__(self, "_opens", {})
+        return self._opens
 
     def __eq__(self, other):
         return Expr("eq", [self, spExpr(other), get_line_no()])
@@ -145,7 +345,7 @@ class Expr:
         )
 
     def __hash__(self):
-        return hash(self.export())
+        return self._h
 
     def on_update(self, f):
         self.onUpdateHandlers.append(f)
@@ -158,10 +358,10 @@ class Expr:
         return self.__getitem__(item)
 
     def __enter__(self):
-        return getattr(self, "__asBlock").__enter__()
+        return self._block.__enter__()
 
     def __exit__(self, type, value, traceback):
-        getattr(self, "__asBlock").__exit__(type, value, traceback)
+        self._block.__exit__(type, value, traceback)
 
     def __iter__(self):
         raise Exception(
@@ -193,16 +393,18 @@ class Expr:
             return result
 
     def __setattr__(self, attr, value):
-        if "__" not in attr and hasattr(self, "__initialized"):
-            sp.set(getattr(self, attr), value)
-            if (
-                hasattr(getattr(self, attr), "onUpdateHandlers")
-                and getattr(self, attr).onUpdateHandlers
-            ):
-                for f in getattr(self, attr).onUpdateHandlers:
-                    f(getattr(self, attr), value)
-        else:
+        if "__" in attr:
+            if not attr.endswith("__asBlock"):
+                raise AttributeError("Cannot set attribute %s on an expression" % attr)
+            object.__setattr__(self, "_block", value)
+        elif attr in Expr.__slots__:
             object.__setattr__(self, attr, value)
+        else:
+            target = getattr(self, attr)
+            sp.set(target, value)
+            if isinstance(target, Expr) and target._onUpdateHandlers:
+                for f in target._onUpdateHandlers:
+                    f(target, value)
 
 
     def __delitem__(self, item):
@@ -325,11 +527,28 @@ class Expr:
             if isinstance(e, str):
                 return '"%s"' % e
             return str(e)
+        if self._export is not None:
+            return self._export
         if self._f == "invalid":
             raise Exception(" ".join(str(x) for x in self._l))
         if self._l:
-            return "(%s %s)" % (self._f, " ".join(ppe(x) for x in self._l))
-        return "(%s)" % (self._f)
+            result = "(%s %s)" % (self._f, " ".join(ppe(x) for x in self._l))
+        else:
+            result = "(%s)" % (self._f)
+        if self._frozen:
+            result = intern_export(result)
+            object.__setattr__(self, "_export", result)
+        return result
+
+    def export_to(self, out):
+        if self._export is not None or self._frozen or self._f == "invalid":
+            out.write(self.export())
+        elif self._l:
+            out.write("(%s " % self._f)
+            export_all_to(self._l, out)
+            out.write(")")
+        else:
+            out.write("(%s)" % self._f)
 
 
 def literal(t, l):
@@ -569,9 +788,16 @@ def spExpr(x, context = "expression"):
 
 
 class TType:
+    _exported = None
+
     def __repr__(self):
         return self.export()
 
+    def export(self):
+        if self._exported is None:
+            self._exported = intern_export(self.compute_export())
+        return self._exported
+
 
 class TRecord(TType):
     def __init__(self, **kargs):
@@ -605,7 +831,7 @@ class TRecord(TType):
             del result[k]
         return TRecord(**result)
 
-    def export(self):
+    def compute_export(self):
         fields = " ".join(
             "(%s %s)" % (x, y.export()) for (x, y) in sorted(self.kargs.items())
         )
@@ -664,13 +890,15 @@ class TVariant(TType):
 
     def layout(self, layout):
         self.layout_ = parse_layout(layout)
+        self._exported = None
         return self
 
     def right_comb(self):
         self.layout_ = "Right"
+        self._exported = None
         return self
 
-    def export(self):
+    def compute_export(self):
         fields = " ".join(
             "(%s %s)" % (x, y.export()) for (x, y) in sorted(self.kargs.items())
         )
@@ -686,7 +914,7 @@ class TSimple(TType):
     def __init__(self, name):
         self.name = name
 
-    def export(self):
+    def compute_export(self):
         return '"%s"' % self.name
 
 
@@ -715,7 +943,7 @@ class TUnknown(TType):
     def __init__(self, id):
         self.id = id
 
-    def export(self):
+    def compute_export(self):
         return '(unknown %i)' % self.id
 
 
@@ -723,7 +951,7 @@ class TList(TType):
     def __init__(self, t):
         self.t = sp.types.conv(t)
 
-    def export(self):
+    def compute_export(self):
         return "(list %s)" % self.t.export()
 
 
@@ -732,7 +960,7 @@ class TMap(TType):
         self.k = sp.types.conv(k)
         self.v = sp.types.conv(v)
 
-    def export(self):
+    def compute_export(self):
         return "(map %s %s)" % (self.k.export(), self.v.export())
 
 
@@ -740,7 +968,7 @@ class TSet(TType):
     def __init__(self, t):
         self.t = sp.types.conv(t)
 
-    def export(self):
+    def compute_export(self):
         return "(set %s)" % self.t.export()
 
 
@@ -749,7 +977,7 @@ class TBigMap(TType):
         self.k = sp.types.conv(k)
         self.v = sp.types.conv(v)
 
-    def export(self):
+    def compute_export(self):
         return "(bigmap %s %s)" % (self.k.export(), self.v.export())
 
 
@@ -758,7 +986,7 @@ class TPair(TType):
         self.t1 = t1
         self.t2 = t2
 
-    def export(self):
+    def compute_export(self):
         return "(pair %s %s)" % (
             sp.types.conv(self.t1).export(),
             sp.types.conv(self.t2).export(),
@@ -770,7 +998,7 @@ class TAnnots(TType):
         self.t = sp.types.conv(t)
         self.annots = annots
 
-    def export(self):
+    def compute_export(self):
         return "(annots %s (%s))" % (
             self.t.export(),
             " ".join('"%s"' % a for a in self.annots),
@@ -781,7 +1009,7 @@ class TOption(TType):
     def __init__(self, t):
         self.t = sp.types.conv(t)
 
-    def export(self):
+    def compute_export(self):
         return "(option %s)" % self.t.export()
 
 
@@ -789,7 +1017,7 @@ class TContract(TType):
     def __init__(self, t):
         self.t = sp.types.conv(t)
 
-    def export(self):
+    def compute_export(self):
         return "(contract %s)" % self.t.export()
 
 
@@ -798,7 +1026,7 @@ class TLambda(TType):
         self.t1 = sp.types.conv(t1)
         self.t2 = sp.types.conv(t2)
 
-    def export(self):
+    def compute_export(self):
         return "(lambda %s %s)" % (self.t1.export(), self.t2.export())
 
 
@@ -869,7 +1097,12 @@ class TreeBlock:
         self.locals.append(var)
 
     def export(self):
-        return "(%s)" % (" ".join(x.export() for x in self.commands))
+        return export_to_string(self)
+
+    def export_to(self, out):
+        out.write("(")
+        export_all_to(self.commands, out)
+        out.write(")")
 
 
 class CommandBlock:
@@ -889,19 +1122,131 @@ class CommandBlock:
     def export(self):
         return self.commands.export()
 
+    def export_to(self, out):
+        self.commands.export_to(out)
+
+
+class Profiler:
+    """Nested spans timed with time.perf_counter_ns.
+
+    Each span records the number of Expr nodes built while it was open and
+    can carry extra arguments (e.g. the exported size). Spans are exported
+    as a JSON tree (to_json) or in the Chrome trace event format
+    (to_chrome_trace), which chrome://tracing and Perfetto open.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter_ns()
+        self.roots = []
+        self.stack = []
+        self.marks = []
+
+    def begin(self, category, name):
+        if not self.enabled:
+            return
+        span = {
+            "name": name,
+            "category": category,
+            "start": time.perf_counter_ns(),
+            "nodes": exprCount,
+            "children": [],
+        }
+        (self.stack[-1]["children"] if self.stack else self.roots).append(span)
+        self.stack.append(span)
+
+    def end(self, **args):
+        if not self.enabled or not self.stack:
+            return
+        span = self.stack.pop()
+        span["end"] = time.perf_counter_ns()
+        span["nodes"] = exprCount - span["nodes"]
+        if args:
+            span["args"] = args
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((time.perf_counter_ns(), name))
+
+    def to_json(self):
+        def convert(span):
+            duration = span.get("end", span["start"]) - span["start"]
+            children = [convert(child) for child in span["children"]]
+            result = {
+                "name": span["name"],
+                "category": span["category"],
+                "time_ns": duration,
+                "self_ns": duration - pySum(child["time_ns"] for child in children),
+                "nodes": span["nodes"],
+            }
+            result.update(span.get("args", {}))
+            result["children"] = children
+            return result
+
+        return {
+            "spans": [convert(span) for span in self.roots],
+            "marks": [
+                {"name": name, "time_ns": t - self.start} for (t, name) in self.marks
+            ],
+        }
+
+    def to_chrome_trace(self):
+        events = []
+
+        def convert(span):
+            args = {"nodes": span["nodes"]}
+            args.update(span.get("args", {}))
+            events.append(
+                {
+                    "name": span["name"],
+                    "cat": span["category"],
+                    "ph": "X",
+                    "ts": (span["start"] - self.start) / 1000,
+                    "dur": (span.get("end", span["start"]) - span["start"]) / 1000,
+                    "pid": 0,
+                    "tid": 0,
+                    "args": args,
+                }
+            )
+            for child in span["children"]:
+                convert(child)
+
+        for span in self.roots:
+            convert(span)
+        for (t, name) in self.marks:
+            events.append(
+                {"name": name, "ph": "i", "s": "g", "ts": (t - self.start) / 1000, "pid": 0, "tid": 0}
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def logs(self):
+        """Marks as text lines, as shown by tests with profile=True."""
+        return ["%10.3fms %s" % ((t - self.start) / 1e6, name) for (t, name) in self.marks]
+
 
 class Sp:
     def __init__(self):
         self.types = SpTypes()
-        self.profiling = False
-        self.profilingLogs = []
+        self.profiler = Profiler()
         self.mb = None
 
-    def profile(self, s=""):
-        if self.profiling:
-            import datetime
+    @property
+    def profiling(self):
+        return self.profiler.enabled
 
-            self.profilingLogs.append(str(datetime.datetime.now()) + " " + s)
+    @profiling.setter
+    def profiling(self, b):
+        self.profiler.enabled = b
+
+    @property
+    def profilingLogs(self):
+        return self.profiler.logs()
+
+    def profile(self, s=""):
+        self.profiler.mark(s)
 
     def setMB(self, mb):
         self.mb = mb
@@ -956,6 +1301,9 @@ class MessageBuilder:
     def export(self):
         return self.commands.export()
 
+    def export_to(self, out):
+        self.commands.export_to(out)
+
     def __repr__(self):
         return "Commands:%s" % (" ".join(str(command) for command in self.commands))
 
@@ -1128,6 +1476,8 @@ class ExecMessage:
 
 
 class WouldBeValue:
+    __slots__ = ()
+
     def __repr__(self):
         try:
             return self.export()
@@ -1139,22 +1489,37 @@ class WouldBeValue:
 
 
 class record(WouldBeValue):
+    __slots__ = ("fields", "lineNo")
+
     def __init__(self, **fields):
         self.fields = {k: spExpr(v) for (k, v) in fields.items()}
-        for (k, v) in self.fields.items():
-            setattr(self, k, v)
         self.lineNo = get_line_no()
 
+    def __getattr__(self, attr):
+        if "__" in attr or attr == "fields":
+            raise AttributeError(attr)
+        try:
+            return self.fields[attr]
+        except KeyError:
+            raise AttributeError("Record has no field %s" % attr)
+
     def export(self):
-        return "(record %i %s)" % (
-            self.lineNo,
-            " ".join(
-                "(%s %s)" % (k, v.export()) for (k, v) in sorted(self.fields.items())
-            ),
-        )
+        return export_to_string(self)
+
+    def export_to(self, out):
+        out.write("(record %i " % self.lineNo)
+        first = True
+        for (k, v) in sorted(self.fields.items()):
+            out.write("(%s " % k if first else " (%s " % k)
+            first = False
+            export_to(v, out)
+            out.write(")")
+        out.write(")")
 
 
 class tuple(WouldBeValue):
+    __slots__ = ("l", "lineNo")
+
     def __init__(self, l = None):
         if l is None:
             l = []
@@ -1162,10 +1527,12 @@ class tuple(WouldBeValue):
         self.lineNo = get_line_no()
 
     def export(self):
-        return "(tuple %s %s)" % (
-            " ".join(spExpr(x).export() for x in self.l),
-            self.lineNo,
-        )
+        return export_to_string(self)
+
+    def export_to(self, out):
+        out.write("(tuple ")
+        export_all_to((spExpr(x) for x in self.l), out)
+        out.write(" %s)" % self.lineNo)
 
 
 def pair(e1, e2):
@@ -1173,6 +1540,8 @@ def pair(e1, e2):
 
 
 class build_list(WouldBeValue):
+    __slots__ = ("l", "lineNo")
+
     def __init__(self, l = None):
         if l is None:
             l = []
@@ -1186,10 +1555,12 @@ class build_list(WouldBeValue):
         return Expr("map_function", [self, spExpr(f), get_line_no()])
 
     def export(self):
-        return "(list %s %s)" % (
-            self.lineNo,
-            " ".join(spExpr(x).export() for x in self.l),
-        )
+        return export_to_string(self)
+
+    def export_to(self, out):
+        out.write("(list %s " % self.lineNo)
+        export_all_to((spExpr(x) for x in self.l), out)
+        out.write(")")
 
     def concat(self):
         return Expr("concat", [self, get_line_no()])
@@ -1199,6 +1570,8 @@ class build_list(WouldBeValue):
 
 
 class build_set(WouldBeValue):
+    __slots__ = ("l", "lineNo")
+
     def __init__(self, l = None):
         if l is None:
             l = []
@@ -1223,13 +1596,17 @@ class build_set(WouldBeValue):
         )
 
     def export(self):
-        return "(set %s %s)" % (
-            self.lineNo,
-            " ".join(spExpr(x).export() for x in self.l),
-        )
+        return export_to_string(self)
+
+    def export_to(self, out):
+        out.write("(set %s " % self.lineNo)
+        export_all_to((spExpr(x) for x in self.l), out)
+        out.write(")")
 
 
 class mapOrBigMap(WouldBeValue):
+    __slots__ = ("l", "lineNo")
+
     def __init__(self, l = None):
         if l is None:
             l = {}
@@ -1243,17 +1620,24 @@ class mapOrBigMap(WouldBeValue):
         return Expr("getItem", [self, spExpr(item), get_line_no()])
 
     def export(self):
-        return "(%s %s %s)" % (
-            self.name(),
-            self.lineNo,
-            " ".join(
-                "(%s %s)" % (spExpr(k).export(), spExpr(v).export())
-                for (k, v) in self.l.items()
-            ),
-        )
+        return export_to_string(self)
+
+    def export_to(self, out):
+        out.write("(%s %s " % (self.name(), self.lineNo))
+        first = True
+        for (k, v) in self.l.items():
+            out.write("(" if first else " (")
+            first = False
+            export_to(spExpr(k), out)
+            out.write(" ")
+            export_to(spExpr(v), out)
+            out.write(")")
+        out.write(")")
 
 
 class build_map(mapOrBigMap):
+    __slots__ = ()
+
     def name(self):
         return "map"
 
@@ -1276,6 +1660,8 @@ class build_map(mapOrBigMap):
         return Expr("rev_values", [self, get_line_no()])
 
 class build_big_map(mapOrBigMap):
+    __slots__ = ()
+
     def name(self):
         return "big_map"
 
@@ -1417,41 +1803,43 @@ class Contract:
         self.collectMessages()
 
     def addMessage(self, addedMessage):
-        sp.profile("addMessage begin " + addedMessage.name)
-        addedMessage.contract = self
-        mb = MessageBuilder(addedMessage)
-        self.mb = mb
-        sp.setMB(mb)
-        args = inspect.getargs(addedMessage.f.__code__).args
-        nargs = pyLen(args)
-        params = Expr("params", [addedMessage.lineNo])
-        if nargs == 0:
-            raise Exception("Entry point '%s' is missing a self parameter (line %i)." % (addedMessage.name, addedMessage.lineNo))
-        elif nargs == 1:
-            x = addedMessage.f(self)
-        elif nargs == 2:
-            x = addedMessage.f(self, params)
-        else:
-            args[0] = self
-            for i in pyRange(1, nargs):
-                args[i] = Expr("attr", [params, args[i], get_line_no()])
-            x = addedMessage.f(*args)
-        if x is not None:
-            raise Exception(
-                "Entry point failure for %s (line %i): entry points cannot have return statements."
-                % (addedMessage.name, addedMessage.lineNo)
-            )
-        self.mb = None
-        sp.setMB(None)
-        self.messages[addedMessage.name] = mb
-        mb.originate = addedMessage.originate
-        setattr(self, addedMessage.name, addedMessage)
-        # if not isinstance(self.data, Expr) or self.data._f != "data":
-        #     raise Exception(
-        #         "It's forbidden to change self.data directly.\n self.data = "
-        #         + str(self.data)
-        #     )
-        sp.profile("addMessage end " + addedMessage.name)
+        sp.profiler.begin("entry point", self.__class__.__name__ + "." + addedMessage.name)
+        try:
+            addedMessage.contract = self
+            mb = MessageBuilder(addedMessage)
+            self.mb = mb
+            sp.setMB(mb)
+            args = inspect.getargs(addedMessage.f.__code__).args
+            nargs = pyLen(args)
+            params = Expr("params", [addedMessage.lineNo])
+            if nargs == 0:
+                raise Exception("Entry point '%s' is missing a self parameter (line %i)." % (addedMessage.name, addedMessage.lineNo))
+            elif nargs == 1:
+                x = addedMessage.f(self)
+            elif nargs == 2:
+                x = addedMessage.f(self, params)
+            else:
+                args[0] = self
+                for i in pyRange(1, nargs):
+                    args[i] = Expr("attr", [params, args[i], get_line_no()])
+                x = addedMessage.f(*args)
+            if x is not None:
+                raise Exception(
+                    "Entry point failure for %s (line %i): entry points cannot have return statements."
+                    % (addedMessage.name, addedMessage.lineNo)
+                )
+            self.mb = None
+            sp.setMB(None)
+            self.messages[addedMessage.name] = mb
+            mb.originate = addedMessage.originate
+            setattr(self, addedMessage.name, addedMessage)
+            # if not isinstance(self.data, Expr) or self.data._f != "data":
+            #     raise Exception(
+            #         "It's forbidden to change self.data directly.\n self.data = "
+            #         + str(self.data)
+            #     )
+        finally:
+            sp.profiler.end()
 
     def buildExtraMessages(self):
         pass
@@ -1459,59 +1847,82 @@ class Contract:
     def collectMessages(self):
         if self.messages_collected:
             return
-        sp.profile("CollectMessages begin " + self.__class__.__name__)
-        self.data = sp.getData()
-        for f in dir(self):
-            attr = getattr(self, f)
-            if isinstance(attr, GlobalLambda):
-                attr._l = self.global_lambda(attr.name, attr.f)
-            if isinstance(attr, SubEntryPoint):
-                attr._l = self.global_lambda(attr.name, lambda x: attr.fg(self,x))
-                attr.contract = self
-        for f in dir(self):
-            attr = getattr(self, f)
-            if isinstance(attr, AddedMessage):
-                self.addMessage(
-                    AddedMessage(attr.name, attr.f, attr.originate, attr.lineNo)
-                )
-        self.buildExtraMessages()
-        # self.smartml = window.buildSmartlmJS(self)
-        self.smartml = Smartml(self)
-        sp.profile("CollectMessages smartml " + self.__class__.__name__)
-        self.data = Expr("contractData", [self.smartml.contractId, get_line_no()])
-        self.balance = Expr("contractBalance", [self.smartml.contractId, get_line_no()])
-        sp.profile("CollectMessages end " + self.__class__.__name__)
+        sp.profiler.begin("contract", self.__class__.__name__)
+        try:
+            self.data = sp.getData()
+            for f in dir(self):
+                attr = getattr(self, f)
+                if isinstance(attr, GlobalLambda):
+                    attr._l = self.global_lambda(attr.name, attr.f)
+                if isinstance(attr, SubEntryPoint):
+                    attr._l = self.global_lambda(attr.name, lambda x: attr.fg(self,x))
+                    attr.contract = self
+            for f in dir(self):
+                attr = getattr(self, f)
+                if isinstance(attr, AddedMessage):
+                    self.addMessage(
+                        AddedMessage(attr.name, attr.f, attr.originate, attr.lineNo)
+                    )
+            self.buildExtraMessages()
+            # self.smartml = window.buildSmartlmJS(self)
+            self.smartml = Smartml(self)
+            self.data = Expr("contractData", [self.smartml.contractId, get_line_no()])
+            self.balance = Expr("contractBalance", [self.smartml.contractId, get_line_no()])
+        finally:
+            sp.profiler.end()
         self.address = contract_address(self)
         self.baker = contract_baker(self)
 
     def export(self):
-        if self.exception_optimization_level is not None:
-            self.add_flag("Exception_%s" % self.exception_optimization_level)
-        result = "(storage %s\nstorage_type (%s)\nmessages (%s)\nflags (%s)\nglobals (%s)\nstorage_layout %s\nentry_points_layout %s\nbalance %s)" % (
-            (self.storage.export() if self.storage is not None else "()"),
-            ("%s" % (self.storage_type.export()) if self.storage_type is not None else "()"),
-            (
-                " ".join(
-                    "(%s %s %s)" % (k, str(v.originate), v.export())
-                    for (k, v) in sorted(self.messages.items())
-                )
-            ),
-            (" ".join(str(flag) for flag in sorted(self.flags))),
-            (
-                " ".join(
-                    "(%s %s)" % (name, variable.export())
-                    for (name, variable) in self.global_variables
-                )
-            ),
-            (self.storage_layout if self.storage_layout is not None else "()"),
-            (self.entry_points_layout if self.entry_points_layout is not None else "()"),
-            (self.__initial_balance.export() if self.__initial_balance is not None else "()"),
-        )
+        result = export_to_string(self)
         if self.verbose:
             alert("Creating\n\n%s" % result)
             window.console.log(result)
         return result
 
+    def export_to(self, out):
+        sp.profiler.begin("export", self.__class__.__name__)
+        start = output_size(out) if sp.profiler.enabled else None
+        try:
+            if self.exception_optimization_level is not None:
+                self.add_flag("Exception_%s" % self.exception_optimization_level)
+            out.write("(storage ")
+            if self.storage is not None:
+                export_to(self.storage, out)
+            else:
+                out.write("()")
+            out.write("\nstorage_type (")
+            if self.storage_type is not None:
+                export_to(self.storage_type, out)
+            else:
+                out.write("()")
+            out.write(")\nmessages (")
+            first = True
+            for (k, v) in sorted(self.messages.items()):
+                out.write("(%s %s " % (k, str(v.originate)) if first else " (%s %s " % (k, str(v.originate)))
+                first = False
+                v.export_to(out)
+                out.write(")")
+            out.write(")\nflags (%s)" % (" ".join(str(flag) for flag in sorted(self.flags))))
+            out.write("\nglobals (")
+            first = True
+            for (name, variable) in self.global_variables:
+                out.write("(%s " % name if first else " (%s " % name)
+                first = False
+                export_to(variable, out)
+                out.write(")")
+            out.write(")\nstorage_layout %s" % (self.storage_layout if self.storage_layout is not None else "()"))
+            out.write("\nentry_points_layout %s" % (self.entry_points_layout if self.entry_points_layout is not None else "()"))
+            out.write("\nbalance ")
+            if self.__initial_balance is not None:
+                export_to(self.__initial_balance, out)
+            else:
+                out.write("()")
+            out.write(")")
+        finally:
+            if start is not None:
+                sp.profiler.end(size=output_size(out) - start)
+
     def setNow(self, time):
         return self.smartml.setNow(time)
 
@@ -1791,6 +2202,10 @@ def cmd_result(r):
 def result(r):
     sp.newCommand(cmd_result(r))
 
+# Names of the lambdas of the current build by id, for reports.
+lambdaNames = {}
+
+
 class Lambda:
     def __init__(self, f, params, tParams, global_name, auto_result):
         self.id = window.lambdaNextId
@@ -1802,26 +2217,35 @@ class Lambda:
         self.f = self.collectLambda(f)
 
     def collectLambda(self, f):
-        prev = sp.mb
-        newMB = sp.mb is None
-        if newMB:
-            sp.setMB(MessageBuilder(None))
-        currentBlock = sp.mb.currentBlock
-        commands = TreeBlock()
-        sp.mb.currentBlock = commands
-        r = f(
-            Expr("lambdaParams", [self.id, self.params, get_line_no(), self.tParams])
-        )
-        if self.auto_result:
-            if r is not None:
-                result(r)
-        elif r is not None:
-            raise Exception("Please use 'sp.result' instead of 'return' in SmartPy functions.")
-        r = Expr("lambda", [self.id, self.params, get_line_no(), commands])
-        sp.mb.currentBlock = currentBlock
-        self.mb = prev
-        if newMB:
-            sp.setMB(None)
+        if self.global_name is not None:
+            name = str(self.global_name)
+        else:
+            name = f.__name__ if isinstance(f, FunctionType) else "lambda %i" % self.id
+        lambdaNames[self.id] = name
+        sp.profiler.begin("lambda", name)
+        try:
+            prev = sp.mb
+            newMB = sp.mb is None
+            if newMB:
+                sp.setMB(MessageBuilder(None))
+            currentBlock = sp.mb.currentBlock
+            commands = TreeBlock()
+            sp.mb.currentBlock = commands
+            r = f(
+                Expr("lambdaParams", [self.id, self.params, get_line_no(), self.tParams])
+            )
+            if self.auto_result:
+                if r is not None:
+                    result(r)
+            elif r is not None:
+                raise Exception("Please use 'sp.result' instead of 'return' in SmartPy functions.")
+            r = Expr("lambda", [self.id, self.params, get_line_no(), commands])
+            sp.mb.currentBlock = currentBlock
+            self.mb = prev
+            if newMB:
+                sp.setMB(None)
+        finally:
+            sp.profiler.end()
         return r
 
     def __call__(self, arg):
@@ -1959,8 +2383,8 @@ def profile(s):
 
 
 def setProfiling(b):
-    sp.profiling = b
-    sp.profilingLogs = []
+    sp.profiler.enabled = b
+    sp.profiler.reset()
 
 
 def fst(e):
@@ -2169,6 +2593,9 @@ in_browser = window.in_browser
 def add_test(*args, **kargs):
     return smartpyio.add_test(*args, **kargs)
 
+def add_compilation_target(name, contract, storage=None):
+    return smartpyio.add_compilation_target(name, contract, storage)
+
 def show(contract, name="Simulation", shortname=None, profile=False, is_default=True):
     def test():
         scenario = test_scenario()
@@ -2184,7 +2611,7 @@ def import_template(name):
         directory = pathlib.Path(__file__).parent.absolute()
     template = open(str(directory) + "/templates/" + name, "r").read()
     import smartpyio
-    template = smartpyio.adaptBlocks(template)
+    template = smartpyio.adaptBlocks(template, "templates/" + name)
     class Mod: pass
     module = Mod()
     module.__dict__['__name__'] = "templates/" + name
@@ -2195,32 +2622,216 @@ def import_script_from_url(url):
     import urllib
     template = urllib.request.urlopen(url).read().decode('utf-8')
     import smartpyio
-    template = smartpyio.adaptBlocks(template)
+    template = smartpyio.adaptBlocks(template, url)
     class Mod: pass
     module = Mod()
     module.__dict__['__name__'] = url
     exec (template, module.__dict__)
     return module
 
+def import_script_from_script(name, script, filename=None):
+    import smartpyio
+    script = smartpyio.adaptBlocks(script, name if filename is None else filename)
+    class Mod: pass
+    module = Mod()
+    module.__dict__['__name__'] = name
+    exec (compile(script, SCRIPT_FILENAME, "exec"), module.__dict__)
+    return module
+
+def import_script_from_file(path, name=None):
+    """Imports the script at path.
+
+    Scripts are cached by path and content hash. A script imported again in
+    the same build is not executed again, so a library imported from several
+    scripts is only executed once. Scripts also stay warm across the
+    targets of a batch: a cached script is reused when it is imported in the
+    same state (contract, lambda, type and seq counters and scripts already
+    imported) as when it was executed, and none of the files it read
+    changed. The state its execution left (dependencies, import graph,
+    compilation targets, tests, contracts and ids) is then replayed, and is
+    what executing it again would leave. In any other state it is executed
+    again, so that the ids it allocates follow the current counters.
+    Imports are recorded in window.pythonImportGraph.
+    """
+    import os
+    import hashlib
+    path = os.path.abspath(path)
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    script = open(path, "r").read()
+    importer = window.pythonImportStack[-1] if window.pythonImportStack else None
+    imports = window.pythonImportGraph.setdefault(importer, [])
+    if path not in imports:
+        imports.append(path)
+    key = (path, name, hashlib.sha256(script.encode("utf8")).hexdigest())
+    module = window.pythonImported.get(key)
+    if module is not None:
+        return module
+    state = import_state()
+    entry = window.pythonModules.get((key, state))
+    if entry is not None and all(file_stat(p) == stat for (p, stat) in entry.files.items()):
+        entry.replay()
+        return entry.module
+    entry = ImportedScript()
+    entry.record()
+    window.pythonImportStack.append(path)
+    sp.profiler.begin("import", os.path.relpath(path))
+    try:
+        window.pythonDependencies.append(path)
+        entry.module = import_script_from_script(name, script, path)
+    finally:
+        window.pythonImportStack.pop()
+        sp.profiler.end()
+    window.pythonImported[key] = entry.module
+    entry.stop()
+    window.pythonModules[(key, state)] = entry
+    return entry.module
+
+def import_state():
+    """What the execution of an imported script depends on besides files."""
+    return (
+        window.contractNextId,
+        window.lambdaNextId,
+        sp.types.unknownIds,
+        sp.types.seqCounter,
+        frozenset(window.pythonImported),
+    )
+
+def file_stat(path):
+    import os
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+class ImportedScript:
+    """What the execution of an imported script left in window."""
+
+    def record(self):
+        self.start = (
+            pyLen(window.pythonDependencies),
+            pyLen(window.pythonCompilationTargets),
+            pyLen(window.pythonTests),
+            pySet(window.contracts),
+            pySet(window.pythonImported),
+        )
+
+    def stop(self):
+        import os
+        (dependencies, targets, tests, contracts, imported) = self.start
+        del self.start
+        self.dependencies = window.pythonDependencies[dependencies:]
+        self.graph = {
+            path: pyList(window.pythonImportGraph[path])
+            for path in self.dependencies
+            if path in window.pythonImportGraph
+        }
+        self.targets = window.pythonCompilationTargets[targets:]
+        self.tests = window.pythonTests[tests:]
+        self.contracts = {i: c for (i, c) in window.contracts.items() if i not in contracts}
+        self.imported = {k: m for (k, m) in window.pythonImported.items() if k not in imported}
+        self.ids = (
+            window.contractNextId,
+            window.lambdaNextId,
+            sp.types.unknownIds,
+            sp.types.seqCounter,
+        )
+        # Project modules may have been read by the script, their changes
+        # invalidate it as well. They are all counted as dependencies of
+        # the scripts importing it again, some may have been loaded before.
+        root = os.getcwd() + os.sep
+        files = pySet(self.dependencies)
+        for module in pyList(sys.modules.values()):
+            file = getattr(module, "__file__", None)
+            if file is not None and os.path.abspath(file).startswith(root):
+                files.add(os.path.abspath(file))
+        self.files = {path: file_stat(path) for path in files}
+
+    def replay(self):
+        window.pythonDependencies.extend(self.files)
+        for (path, imports) in self.graph.items():
+            known = window.pythonImportGraph.setdefault(path, [])
+            known.extend(p for p in imports if p not in known)
+        window.pythonCompilationTargets.extend(self.targets)
+        window.pythonTests.extend(self.tests)
+        window.contracts.update(self.contracts)
+        window.pythonImported.update(self.imported)
+        (window.contractNextId, window.lambdaNextId,
+         sp.types.unknownIds, sp.types.seqCounter) = self.ids
+
+class io:
+    import_template = staticmethod(import_template)
+    import_script_from_url = staticmethod(import_script_from_url)
+    import_script_from_script = staticmethod(import_script_from_script)
+    import_script_from_file = staticmethod(import_script_from_file)
+
+def smartml_cli():
+    """The Michelson compiler: smartml-cli.js of this package, of the
+    SmartPy.sh running it or of the smartpy-cli npm package of the project
+    (npx smp), the vendored package having none. None when missing."""
+    import os
+    for directory in [
+        os.path.dirname(os.path.realpath(__file__)),
+        os.environ.get("smartpy_install_path"),
+        os.path.join(os.getcwd(), "node_modules", "@castframework", "smartpy-cli"),
+    ]:
+        if directory is not None and os.path.exists(os.path.join(directory, "smartml-cli.js")):
+            return os.path.join(directory, "smartml-cli.js")
+    return None
+
 def compile_contract(
         contract,
         target_directory,
-        name = "contract"
+        name = "contract",
+        cache = None
 ):
-    """Exports contract to smlse, code and storage files."""
+    """Exports contract to smlse, code and storage files.
+
+    When cache (a smartpy_cache.Cache) is given, the files produced from an
+    already seen smlse are copied from the cache instead of being recompiled.
+    Raises an exception when the compiler fails or does not write the code
+    and storage files.
+    """
+    import glob
     import subprocess
     import os
+    compiler = smartml_cli()
+    if compiler is None:
+        raise Exception("Cannot compile %s: no smartml-cli.js in the SmartPy package or node_modules" % name)
     os.makedirs(target_directory, exist_ok=True)
     targetSmlse = target_directory + "/" + name + ".smlse"
-    open(targetSmlse, "w").write(contract.export())
+    with open(targetSmlse, "w") as out:
+        contract.export_to(out)
+    if cache is not None:
+        import smartpy_cache
+        with open(targetSmlse, "rb") as f:
+            objectKey = smartpy_cache.digest(
+                smartpy_cache.fingerprint(), smartpy_cache.file_digest(compiler), name, f.read()
+            )
+        if cache.get(objectKey, {"contract": target_directory}):
+            return
     command = [
         "node",
-        os.path.dirname(os.path.realpath(__file__)) + "/smartml-cli.js",
+        compiler,
         "compile-smartml-contract",
         targetSmlse,
         target_directory
     ]
-    subprocess.run(command)
+    # As SmartPy.sh does, for the modules shipped with the compiler.
+    env = dict(os.environ)
+    env["NODE_PATH"] = os.pathsep.join(
+        path for path in [os.path.join(os.path.dirname(compiler), "node_modules"), env.get("NODE_PATH")] if path
+    )
+    result = subprocess.run(command, env=env)
+    if result.returncode != 0:
+        raise Exception("Compilation of %s failed with exit code %i" % (name, result.returncode))
+    # The files the deployment toolchain reads.
+    for pattern in ["*_contract.json", "*_storage.tz"]:
+        if not glob.glob(os.path.join(target_directory, pattern)):
+            raise Exception("Compilation of %s wrote no %s" % (name, pattern))
+    if cache is not None:
+        cache.put(objectKey, {"contract": target_directory})
 
 class Verbatim:
     def __init__(self, s):
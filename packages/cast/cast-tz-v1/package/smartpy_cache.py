@@ -0,0 +1,192 @@
+# Content-addressed build cache for smartpy_cli and compile_contract.
+#
+# A build is looked up with a key computed from the adapted source, the
+# SmartPy version (and the package sources themselves) and the build flags.
+# Under each key, a manifest lists the builds already seen with the hashes of
+# the files they depended on (scripts imported with
+# sp.io.import_script_from_file and Python modules of the project). A build
+# is reused when all of its dependencies still have the same hash, in which
+# case its outputs are copied back from the object store.
+#
+# Layout of the cache directory:
+#   manifests/<key>.json   list of {"dependencies": {path: hash}, "object": hash}
+#   objects/<hash>/<name>  saved outputs, one file or directory per name
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from version import version
+
+packageDirectory = os.path.dirname(os.path.realpath(__file__))
+packageFiles = [
+    "browser.py",
+    "smartpy.py",
+    "smartpyio.py",
+    "smartpy_cli.py",
+    "smartpy_interpreter.py",
+    "smartpy_optimize.py",
+    "smartpy_stats.py",
+    "smartml-cli.js",
+]
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf8")
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+def file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return digest(f.read())
+    except OSError:
+        return None
+
+
+fingerprintValue = None
+
+
+def fingerprint():
+    """Identifies the SmartPy package: its version and the sources it has."""
+    global fingerprintValue
+    if fingerprintValue is None:
+        fingerprintValue = digest(
+            version,
+            *[
+                "%s:%s" % (name, file_digest(os.path.join(packageDirectory, name)))
+                for name in packageFiles
+                if os.path.exists(os.path.join(packageDirectory, name))
+            ]
+        )
+    return fingerprintValue
+
+
+def relative(path):
+    return os.path.relpath(os.path.abspath(path))
+
+
+def dependencies(modules):
+    """Project files read since the snapshot 'modules' of sys.modules was taken.
+
+    Only files below the current directory are kept, the SmartPy package and
+    the Python installation are covered by the fingerprint.
+    """
+    from browser import window
+
+    root = os.getcwd()
+    paths = set(window.pythonDependencies)
+    for (name, module) in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if name not in modules and path is not None:
+            paths.add(os.path.abspath(path))
+    return {
+        relative(path): file_digest(path)
+        for path in sorted(paths)
+        if path.startswith(root + os.sep) and not path.startswith(packageDirectory + os.sep)
+    }
+
+
+def copy(source, target):
+    if os.path.isdir(source):
+        shutil.copytree(source, target, dirs_exist_ok=True)
+    else:
+        directory = os.path.dirname(target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(source, target)
+
+
+class Cache:
+    def __init__(self, directory, flags=[]):
+        self.directory = directory
+        self.flags = list(flags)
+
+    def key(self, filename, adaptedCode):
+        return digest(fingerprint(), json.dumps(self.flags), relative(filename), adaptedCode)
+
+    def manifest_path(self, key):
+        return os.path.join(self.directory, "manifests", key + ".json")
+
+    def object_path(self, objectKey):
+        return os.path.join(self.directory, "objects", objectKey)
+
+    def read_manifest(self, key):
+        try:
+            with open(self.manifest_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def lookup(self, key):
+        """First build under key whose dependencies are unchanged."""
+        for entry in self.read_manifest(key):
+            if all(
+                file_digest(path) == h for (path, h) in entry["dependencies"].items()
+            ) and os.path.isdir(self.object_path(entry["object"])):
+                return entry
+        return None
+
+    def get(self, objectKey, outputs):
+        """Copies the saved outputs of objectKey to their destinations in outputs."""
+        if objectKey is None:
+            return False
+        source = self.object_path(objectKey)
+        if not os.path.isdir(source):
+            return False
+        for (name, target) in outputs.items():
+            if not os.path.exists(os.path.join(source, name)):
+                return False
+        for (name, target) in outputs.items():
+            copy(os.path.join(source, name), target)
+        return True
+
+    def put(self, objectKey, outputs):
+        """Saves the outputs (name -> file or directory) under objectKey.
+
+        All the outputs must exist, a partial build is never saved.
+        """
+        missing = [source for source in outputs.values() if not os.path.exists(source)]
+        if missing:
+            raise Exception("Cannot cache a build without " + ", ".join(missing))
+        target = self.object_path(objectKey)
+        if os.path.isdir(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = tempfile.mkdtemp(dir=os.path.dirname(target))
+        for (name, source) in outputs.items():
+            copy(source, os.path.join(temporary, name))
+        try:
+            os.rename(temporary, target)
+        except OSError:
+            # Another build saved the same object in the meantime.
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    def restore(self, key, outputs):
+        """Restores the outputs of a previous build, returns its manifest entry."""
+        entry = self.lookup(key)
+        if entry is not None and self.get(entry["object"], outputs):
+            return entry
+        return None
+
+    def store(self, key, dependencies, outputs):
+        objectKey = digest(key, json.dumps(dependencies, sort_keys=True))
+        self.put(objectKey, outputs)
+        entries = [
+            entry for entry in self.read_manifest(key) if entry["object"] != objectKey
+        ]
+        entries.insert(0, {"dependencies": dependencies, "object": objectKey})
+        path = self.manifest_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(temporary, path)
+        return objectKey
@@ -3,70 +3,123 @@
 import browser
 import smartpyio
 import argparse
+import contextlib
+import glob
+import io
 import os
 import json
 import sys
+import time
 import traceback
 from version import version
 from urllib.request import urlopen
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="SmartPy")
-    parser.add_argument("filename", metavar="f", type=str, help="", nargs="?")
-    parser.add_argument("--version", action="store_true")
-    parser.add_argument("--class_call", nargs="?")
-    parser.add_argument("--scenario", nargs="?")
-    parser.add_argument("--sexprfile", nargs="?")
-    parser.add_argument("--pyadaptedfile", nargs="?")
-    args = parser.parse_args()
 
-    if args.version:
-        print("SmartPy %s" % version)
-        quit()
-    if args.filename is None:
-        print("filename required")
-        quit(1)
-    if args.filename.startswith("http"):
-        code = urlopen(args.filename).read().decode("utf8")
+def print_exception(title):
+    print (title)
+    print ('-'*60)
+    traceback.print_exc(file=sys.stdout)
+    print ('-'*60)
+
+
+def script_outputs(args, directory=None):
+    """Output files requested by args, relative to directory if given."""
+    outputs = {}
+    for (name, path) in [
+        ("sexprfile", args.sexprfile),
+        ("scenario", args.scenario),
+        ("pyadaptedfile", args.pyadaptedfile),
+        ("compile", args.compile),
+        ("import_graph", args.import_graph),
+        ("profile", args.profile),
+        ("stats", args.stats),
+        ("optimize_report", args.optimize_report),
+    ]:
+        if path is not None:
+            outputs[name] = path if directory is None else os.path.join(directory, path)
+    return outputs
+
+
+def build(filename, args, context, outputs):
+    """Runs the script filename and writes its outputs.
+
+    Returns "built", "cached" or "failed".
+    """
+    if filename.startswith("http"):
+        code = urlopen(filename).read().decode("utf8")
     else:
-        code = open(args.filename, "r").read()
-    adaptedCode = smartpyio.adaptBlocks(code)
-    context = globals()
+        code = open(filename, "r").read()
+    if args.adapt_cache is not None:
+        smartpyio.set_adapt_cache(args.adapt_cache)
+    elif args.cache is not None:
+        smartpyio.set_adapt_cache(os.path.join(args.cache, "adapted"))
+    adaptedCode = smartpyio.adaptBlocks(code, filename)
+    cache = None
+    if args.cache is not None:
+        import smartpy_cache
+        # Profiles describe a run, they are neither cached nor restored.
+        cachedOutputs = {name: path for (name, path) in outputs.items() if name != "profile"}
+        cache = smartpy_cache.Cache(
+            args.cache, [args.line_no, args.class_call, args.optimize, sorted(cachedOutputs)]
+        )
+        cacheKey = cache.key(filename, adaptedCode)
+        entry = None if "profile" in outputs else cache.restore(cacheKey, cachedOutputs)
+        if entry is not None:
+            browser.window.pythonDependencies += [
+                os.path.abspath(path) for path in entry["dependencies"]
+            ]
+            return "cached"
+        modules = set(sys.modules)
+    import smartpy
+    smartpy.set_line_no_mode(args.line_no)
+    if "profile" in outputs:
+        smartpy.setProfiling(True)
     context["alert"] = browser.alert
     context["window"] = browser.window
     try:
         compiledCode = compile(adaptedCode, "SmartPy Script", "exec")
     except Exception as e:
-        print ("Exception while parsing " + args.filename)
-        print ('-'*60)
-        traceback.print_exc(file=sys.stdout)
-        print ('-'*60)
-        sys.exit(1)
+        print_exception("Exception while parsing " + filename)
+        return "failed"
 
     try:
-        exec(compiledCode, context)
+        smartpy.sp.profiler.begin("script", filename)
+        try:
+            exec(compiledCode, context)
+        finally:
+            smartpy.sp.profiler.end()
     except Exception as e:
-        print ("Exception while compiling " + args.filename)
-        print ('-'*60)
-        traceback.print_exc(file=sys.stdout)
-        print ('-'*60)
-        sys.exit(1)
+        print_exception("Exception while compiling " + filename)
+        return "failed"
 
     try:
         if args.class_call is not None:
             contract = eval(args.class_call, context)
     except Exception as e:
-        print ("Exception while executing " + args.class_call)
-        print ('-'*60)
-        traceback.print_exc(file=sys.stdout)
-        print ('-'*60)
-        sys.exit(1)
+        print_exception("Exception while executing " + args.class_call)
+        return "failed"
+
+    if args.optimize:
+        import smartpy_optimize
+        import smartpy_stats
+        targets = list(browser.window.pythonCompilationTargets)
+        if args.class_call is not None:
+            targets.append(smartpyio.CompilationTarget(args.class_call, contract, None))
+        (before, after) = smartpy_optimize.optimize(targets, args.optimize)
+        smartpy_stats.print_diff(smartpy_stats.diff_reports(before, after)[0])
+        smartpy_optimize.print_sizes(smartpy_optimize.diff_sizes(before, after))
+        if "optimize_report" in outputs:
+            with open(outputs["optimize_report"], "w") as out:
+                json.dump({"passes": args.optimize, "before": before, "after": after}, out, indent=2)
 
-    if args.sexprfile is not None:
+    if "sexprfile" in outputs:
         if args.class_call is None:
             raise Exception("Cannot export sexprfile without a --class_call.")
-        open(args.sexprfile, "w").write(contract.export())
-    if args.scenario:
+        with open(outputs["sexprfile"], "w") as out:
+            contract.export_to(out)
+    failed = False
+    if "scenario" in outputs:
+        import smartpy_interpreter
         scenarios = []
         for test in browser.window.pythonTests:
             try:
@@ -79,16 +132,274 @@ if __name__ == "__main__":
                     browser.scenario += [data]
                 else:
                     browser.scenario = [data]
-                print ("Exception while testing " + args.filename)
-                print ('-'*60)
-                traceback.print_exc(file=sys.stdout)
-                print ('-'*60)
+                print_exception("Exception while testing " + filename)
             if isinstance(browser.scenario, list):
                 scenario = browser.scenario
             else:
                 scenario = browser.scenario.messages  # trace
+            (ok, scenario) = smartpy_interpreter.run_scenario(scenario)
+            if not ok:
+                print ("Scenario %s failed" % test.name)
+                for message in scenario:
+                    if message.get("unexpected"):
+                        print ("  line %s: %s %s %s" % (message.get("line_no"), message.get("action"), message.get("message", ""), message.get("error", "")))
+                failed = True
             scenarios.append({'shortname': test.shortname, 'longname': test.name, 'scenario' : scenario})
-        open(args.scenario, "w").write(json.dumps(scenarios))
+        open(outputs["scenario"], "w").write(json.dumps(scenarios))
             # print ("Exporting %s" % args.scenario)
-    if args.pyadaptedfile is not None:
-        open(args.pyadaptedfile, "w").write(adaptedCode)
+    if "pyadaptedfile" in outputs:
+        open(outputs["pyadaptedfile"], "w").write(adaptedCode)
+    if "stats" in outputs:
+        import smartpy_stats
+        with open(outputs["stats"], "w") as out:
+            json.dump(smartpy_stats.build_report(browser.window.pythonCompilationTargets), out, indent=2)
+    if "import_graph" in outputs:
+        with open(outputs["import_graph"], "w") as out:
+            json.dump(smartpyio.import_graph(os.path.relpath(filename)), out, indent=2)
+    if "compile" in outputs:
+        for target in browser.window.pythonCompilationTargets:
+            try:
+                smartpy.compile_contract(
+                    target.contract, os.path.join(outputs["compile"], target.name), target.name, cache
+                )
+            except Exception as e:
+                print_exception("Exception while compiling " + target.name + " of " + filename)
+                failed = True
+    if "profile" in outputs:
+        if args.profile_format == "chrome":
+            profile = smartpy.sp.profiler.to_chrome_trace()
+        else:
+            profile = smartpy.sp.profiler.to_json()
+        with open(outputs["profile"], "w") as out:
+            json.dump(profile, out, indent=2)
+        smartpy.setProfiling(False)
+    if failed:
+        return "failed"
+    if cache is not None:
+        cache.store(cacheKey, smartpy_cache.dependencies(modules), cachedOutputs)
+    return "built"
+
+
+def check_stats(args, outputs, directory=None):
+    """Compares the stats report with --stats_baseline, False on regressions."""
+    if args.stats_baseline is None or "stats" not in outputs:
+        return True
+    import smartpy_stats
+    baseline = args.stats_baseline
+    if directory is not None:
+        baseline = os.path.join(directory, baseline)
+    if not os.path.exists(baseline):
+        print ("No stats baseline " + baseline)
+        return True
+    (changes, regressions) = smartpy_stats.diff_reports(
+        json.load(open(baseline)), json.load(open(outputs["stats"])), args.stats_threshold
+    )
+    smartpy_stats.print_diff(changes)
+    if regressions:
+        print ("%i size regressions against %s" % (len(regressions), baseline))
+    return not regressions
+
+
+# Batch mode: every target is built in a worker of a process pool. Workers
+# are reused, so the global state left by a script (contract and lambda ids,
+# registered tests and compilation targets, modules imported from the
+# project) is reset before each target. Scripts imported with
+# sp.io.import_script_from_file stay warm across the targets of a worker.
+
+batchArgs = None
+batchModules = None
+
+
+def batch_init(args):
+    global batchArgs, batchModules
+    import smartpy
+    import smartpy_cache
+    batchArgs = args
+    batchModules = set(sys.modules)
+
+
+def batch_reset():
+    smartpyio.reset(keepModules=True)
+    browser.scenario = []
+    for name in list(sys.modules):
+        if name not in batchModules:
+            del sys.modules[name]
+
+
+def batch_build(filename):
+    import smartpy_cache
+    batch_reset()
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            outputs = script_outputs(batchArgs, os.path.dirname(filename))
+            status = build(filename, batchArgs, {"__name__": "__main__"}, outputs)
+            if status != "failed" and not check_stats(batchArgs, outputs, os.path.dirname(filename)):
+                status = "failed"
+    except Exception as e:
+        output.write(traceback.format_exc())
+        status = "failed"
+    return {
+        "filename": filename,
+        "status": status,
+        "time": time.perf_counter() - start,
+        "pid": os.getpid(),
+        "targets": [target.name for target in browser.window.pythonCompilationTargets],
+        "dependencies": sorted(smartpy_cache.dependencies(batchModules)),
+        "imports": smartpyio.import_graph(os.path.relpath(filename)),
+        "output": output.getvalue(),
+    }
+
+
+def batch_targets(patterns):
+    filenames = []
+    for pattern in patterns:
+        for filename in sorted(glob.glob(pattern, recursive=True)) or [pattern]:
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+def batch_report(results, elapsed, jobs):
+    for r in results:
+        if r["status"] == "failed":
+            print ("Failed: " + r["filename"])
+            print (r["output"])
+    for r in results:
+        print ("%-70s%8s%9.3fs  %s" % (r["filename"], r["status"], r["time"], " ".join(r["targets"])))
+    summary = {
+        "jobs": jobs,
+        "time": elapsed,
+        "built": sum(1 for r in results if r["status"] == "built"),
+        "cached": sum(1 for r in results if r["status"] == "cached"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "results": results,
+    }
+    print ("%i built, %i cached, %i failed in %.3fs with %i jobs"
+           % (summary["built"], summary["cached"], summary["failed"], elapsed, jobs))
+    return summary
+
+
+def batch(args):
+    import multiprocessing
+    filenames = batch_targets(args.batch)
+    jobs = args.jobs or os.cpu_count()
+    start = time.perf_counter()
+    with multiprocessing.Pool(min(jobs, len(filenames)) or 1, batch_init, (args,)) as pool:
+        results = pool.map(batch_build, filenames, chunksize=1)
+    summary = batch_report(results, time.perf_counter() - start, jobs)
+    if args.summary is not None:
+        open(args.summary, "w").write(json.dumps(summary, indent=2))
+    return summary
+
+
+# Watch mode: a single warm interpreter builds the batch targets, then polls
+# the watched directory and rebuilds the targets depending on changed files
+# (the target itself, scripts read by smpUtils.importContract and modules of
+# the project it imports). With --compile, the rebuilt targets are compiled
+# from the warm interpreter too (build:tez:daemon writes the dist directories
+# build.ts does).
+
+def watch_snapshot(directory):
+    import smartpy_cache
+    files = {}
+    for (root, directories, filenames) in os.walk(directory):
+        directories[:] = [d for d in directories if d not in ["dist", "__pycache__"]]
+        for filename in filenames:
+            if filename.endswith(".py"):
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                files[smartpy_cache.relative(path)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def watch(args):
+    import smartpy_cache
+    batch_init(args)
+    graph = {}
+
+    def rebuild(filenames):
+        start = time.perf_counter()
+        results = []
+        for filename in filenames:
+            r = batch_build(filename)
+            graph[smartpy_cache.relative(filename)] = set(r["dependencies"])
+            results.append(r)
+        batch_report(results, time.perf_counter() - start, 1)
+
+    files = watch_snapshot(args.watch)
+    rebuild(batch_targets(args.batch))
+    print ("Watching %s for changes" % args.watch)
+    try:
+        while True:
+            time.sleep(args.interval)
+            current = watch_snapshot(args.watch)
+            changed = {
+                path for path in set(files) | set(current) if files.get(path) != current.get(path)
+            }
+            files = current
+            if not changed:
+                continue
+            targets = batch_targets(args.batch)
+            for path in set(graph) - set(smartpy_cache.relative(t) for t in targets):
+                del graph[path]
+            affected = [
+                target
+                for target in targets
+                if smartpy_cache.relative(target) in changed
+                or smartpy_cache.relative(target) not in graph
+                or graph[smartpy_cache.relative(target)] & changed
+            ]
+            if affected:
+                print ("Changed: " + " ".join(sorted(changed)))
+                rebuild(affected)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartPy")
+    parser.add_argument("filename", metavar="f", type=str, help="", nargs="?")
+    parser.add_argument("--version", action="store_true")
+    parser.add_argument("--class_call", nargs="?")
+    parser.add_argument("--scenario", nargs="?", help="run the tests with the interpreter and write their messages and outcomes to this file")
+    parser.add_argument("--sexprfile", nargs="?")
+    parser.add_argument("--pyadaptedfile", nargs="?")
+    parser.add_argument("--line_no", nargs="?", default="eager", help="eager, lazy or off")
+    parser.add_argument("--compile", nargs="?", help="compile the compilation targets into this directory")
+    parser.add_argument("--cache", nargs="?", help="build cache directory")
+    parser.add_argument("--adapt_cache", nargs="?", help="cache directory of adapted scripts, defaults to adapted/ in the build cache")
+    parser.add_argument("--profile", nargs="?", help="write build timings (contracts, entry points, lambdas, exports) to this file")
+    parser.add_argument("--profile_format", nargs="?", default="json", help="json or chrome (trace event format)")
+    parser.add_argument("--stats", nargs="?", help="JSON report of the size and shape of contracts, entry points and lambdas")
+    parser.add_argument("--stats_baseline", nargs="?", help="stats report to compare with, growing metrics fail the build")
+    parser.add_argument("--stats_threshold", type=float, default=0.0, help="growth in percent tolerated by --stats_baseline")
+    parser.add_argument("--optimize", nargs="+", help="optimization passes run before exporting, in order: fold (constant folding), cse (hoists repeated map lookups)")
+    parser.add_argument("--optimize_report", nargs="?", help="JSON stats and code sizes of the contracts before and after --optimize")
+    parser.add_argument("--import_graph", nargs="?", help="JSON graph of the scripts imported with sp.io.import_script_from_file")
+    parser.add_argument("--batch", nargs="+", help="build every file matched by these globs, output paths are relative to each file")
+    parser.add_argument("--jobs", type=int, help="number of batch workers, defaults to the number of cores")
+    parser.add_argument("--summary", nargs="?", help="JSON summary of the batch")
+    parser.add_argument("--watch", nargs="?", help="keep rebuilding the batch when files of this directory change")
+    parser.add_argument("--interval", type=float, default=0.5, help="watch polling interval in seconds")
+    args = parser.parse_args()
+
+    if args.version:
+        print("SmartPy %s" % version)
+        quit()
+    if args.batch is not None and args.watch is not None:
+        watch(args)
+        quit()
+    if args.batch is not None:
+        if batch(args)["failed"]:
+            sys.exit(1)
+        quit()
+    if args.filename is None:
+        print("filename required")
+        quit(1)
+    outputs = script_outputs(args)
+    if build(args.filename, args, globals(), outputs) == "failed":
+        sys.exit(1)
+    if not check_stats(args, outputs):
+        sys.exit(1)
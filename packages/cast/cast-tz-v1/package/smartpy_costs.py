@@ -0,0 +1,479 @@
+# Relative gas and storage burn estimates for the operations of a local chain.
+#
+# MeteredChain is a LocalChain (smartpy_interpreter) whose contracts are
+# compiled with MeteredCompiler: every node evaluated by an entry point or a
+# lambda is charged the Michelson instructions SmartPy compiles it to. Each
+# applied operation, internal ones included, gets a Receipt with
+#   gas           manager operation + decoding and typechecking of the code
+#                 and of the storage + interpretation + encoding of the new
+#                 storage, in relative units (see below)
+#   instructions  number of Michelson instructions executed (estimated)
+#   storage_size  serialized size of the contract afterwards: code, storage
+#                 and big_map entries
+#   paid_diff     newly paid bytes, burn is paid_diff * cost_per_byte (plus
+#                 origination_size for originations)
+#
+# The cost table is shaped after the protocol 012 (Ithaca) constants and
+# Michelson interpreter cost tables, simplified to one cost per instruction
+# kind plus size dependent terms for map accesses, pack and unpack. It has
+# not been calibrated against the receipts of a node: gas is a relative
+# unit (a thousandth of the table), not what a node would consume, and the
+# protocol limits it is compared with only give orders of magnitude. Sizes
+# estimate the binary Micheline encoding. Code size is estimated from the
+# s-expression: there is no Michelson compiler in this package. Lambdas
+# packed by the interpreter are sized with its own encoding, which is larger
+# than Michelson. Estimates are meant to compare entry points and storage
+# designs, not to set gas limits.
+
+import math
+import weakref
+
+import smartpy_interpreter as interpreter
+
+table = {
+    # Protocol constants
+    "manager_operation": 1000000,
+    "cost_per_byte": 250,
+    "origination_size": 257,
+    "hard_gas_limit_per_operation": 1040000,
+    "hard_gas_limit_per_block": 5200000,
+    "hard_storage_limit_per_operation": 60000,
+    # Script loading, per byte of code or storage, and typechecking, per
+    # instruction
+    "decode_byte": 20,
+    "encode_byte": 10,
+    "typecheck_instruction": 300,
+    # Interpretation
+    "instruction": 30,
+    "compare": 35,
+    "map_access": 45,
+    "map_access_log": 30,
+    "big_map_access": 2000,
+    "pack_byte": 10,
+    "unpack": 260,
+    "unpack_byte": 15,
+    "transfer": 60,
+    "create_contract": 60,
+    "contract": 30,
+    "lambda_call": 50,
+}
+
+# Michelson instructions per s-expression node, SmartPy compiles most
+# nodes to a DUP/DIG, the instruction itself and a DROP or a PAIR.
+instructions = {
+    "attr": 2,
+    "getItem": 4,
+    "getItemDefault": 5,
+    "getItemMessage": 5,
+    "contains": 3,
+    "literal": 1,
+    "data": 2,
+    "params": 2,
+    "lambdaParams": 2,
+    "getLocal": 2,
+    "iter": 2,
+    "record": 2,
+    "set": 4,
+    "defineLocal": 2,
+    "verify": 4,
+    "ifBlock": 2,
+    "forGroup": 4,
+    "match_cases": 3,
+    "call_lambda": 3,
+    "transfer": 3,
+    "create_contract": 3,
+    "contract": 4,
+    "pack": 1,
+    "unpack": 2,
+    "set_type": 0,
+    "type_annotation": 0,
+}
+
+comparisons = ["eq", "neq", "lt", "le", "gt", "ge"]
+
+
+class Meter:
+    __slots__ = ("gas", "instructions")
+
+    def __init__(self):
+        self.gas = 0
+        self.instructions = 0
+
+    def consume(self, gas, instructions=0):
+        self.gas += gas
+        self.instructions += instructions
+
+
+def charge(frame, gas, count=0):
+    meter = frame.context.meter
+    if meter is not None:
+        meter.consume(gas, count)
+
+
+def map_cost(m):
+    if isinstance(m, interpreter.BigMap):
+        return table["big_map_access"]
+    return table["map_access"] + table["map_access_log"] * int(math.log2(len(m) + 1))
+
+
+class MeteredCompiler(interpreter.Compiler):
+    def metered(self, f, head):
+        count = instructions.get(head, 1)
+        gas = count * (table["compare"] if head in comparisons else table["instruction"])
+        if head == "transfer":
+            gas += table["transfer"]
+        elif head == "create_contract":
+            gas += table["create_contract"]
+        elif head == "contract":
+            gas += table["contract"]
+        elif head == "call_lambda":
+            gas += table["lambda_call"]
+        if count == 0:
+            return f
+
+        def metered(frame):
+            charge(frame, gas, count)
+            return f(frame)
+
+        return metered
+
+    def expr(self, x):
+        return self.metered(interpreter.Compiler.expr(self, x), x[0] if isinstance(x, list) else None)
+
+    def command(self, x):
+        return self.metered(interpreter.Compiler.command(self, x), x[0])
+
+    def e_getItem(self, x):
+        (m, k, line) = (self.expr(x[1]), self.expr(x[2]), interpreter.line_of(x))
+
+        def getItem(frame):
+            value = m(frame)
+            charge(frame, map_cost(value))
+            try:
+                result = value[k(frame)]
+            except KeyError:
+                interpreter.fail(line)
+            if isinstance(value, interpreter.BigMap):
+                charge(frame, table["decode_byte"] * size(result))
+            return result
+
+        return getItem
+
+    def e_contains(self, x):
+        (m, k) = self.exprs(x[1:3])
+
+        def contains(frame):
+            value = m(frame)
+            charge(frame, map_cost(value))
+            return k(frame) in value
+
+        return contains
+
+    def c_set(self, x):
+        target = x[1]
+        containers = []
+        while isinstance(target, list) and target[0] in ["attr", "getItem"]:
+            if target[0] == "getItem":
+                containers.append(self.expr(target[1]))
+            target = target[1]
+        set = interpreter.Compiler.c_set(self, x)
+        if not containers:
+            return set
+
+        def metered(frame):
+            for container in containers:
+                charge(frame, map_cost(container(frame)))
+            set(frame)
+
+        return metered
+
+    def e_pack(self, x):
+        v = self.expr(x[1])
+
+        def pack(frame):
+            result = interpreter.pack(v(frame))
+            charge(frame, table["pack_byte"] * len(result))
+            return result
+
+        return pack
+
+    def e_unpack(self, x):
+        v = self.expr(x[1])
+
+        def unpack(frame):
+            b = v(frame)
+            result = interpreter.unpack(b, self)
+            charge(frame, table["unpack"] + table["unpack_byte"] * len(b))
+            if isinstance(result.value, interpreter.Closure):
+                charge(frame, table["typecheck_instruction"] * code_instructions(parse_source(result.value)))
+            return result
+
+        return unpack
+
+
+# Sizes of the binary Micheline encoding
+
+def is_address(s):
+    return len(s) == 36 and s[:3] in ["tz1", "tz2", "tz3", "KT1"]
+
+
+def size(v):
+    if isinstance(v, bool) or v == ():
+        return 2
+    if isinstance(v, int):
+        return 1 + max(1, (abs(v).bit_length() + 7) // 7)
+    if isinstance(v, str):
+        return 27 if is_address(v) else 5 + len(v.encode("utf8"))
+    if isinstance(v, bytes):
+        return 5 + len(v)
+    if isinstance(v, interpreter.BigMap):
+        return 3
+    if isinstance(v, interpreter.Record):
+        return 2 * (len(v.fields) - 1) + sum(size(x) for x in v.fields.values()) if v.fields else 2
+    if isinstance(v, tuple):
+        return 2 * (len(v) - 1) + sum(size(x) for x in v)
+    if isinstance(v, dict):
+        return 5 + sum(2 + size(k) + size(x) for (k, x) in v.items())
+    if isinstance(v, (frozenset, list)):
+        return 5 + sum(size(x) for x in v)
+    if isinstance(v, interpreter.Variant):
+        return 2 + (0 if v.name == "None" else size(v.value))
+    if isinstance(v, interpreter.Closure):
+        return 5 + 2 * code_instructions(parse_source(v))
+    if isinstance(v, interpreter.ContractValue):
+        return 27 + len(v.entry_point)
+    return 0
+
+
+def big_map_size(v):
+    """Bytes of the big_map entries reachable from v."""
+    if isinstance(v, interpreter.BigMap):
+        return sum(size(k) + size(x) + big_map_size(x) for (k, x) in v.items())
+    if isinstance(v, interpreter.Record):
+        return sum(big_map_size(x) for x in v.fields.values())
+    if isinstance(v, (tuple, list)):
+        return sum(big_map_size(x) for x in v)
+    if isinstance(v, dict):
+        return sum(big_map_size(x) for x in v.values())
+    if isinstance(v, interpreter.Variant):
+        return big_map_size(v.value)
+    return 0
+
+
+sources = {}
+
+
+def parse_source(closure):
+    x = sources.get(closure.source)
+    if x is None:
+        x = interpreter.parse(closure.source)[0]
+        sources[closure.source] = x
+    return x
+
+
+def nodes(x):
+    if not isinstance(x, list):
+        return 0
+    return 1 + sum(nodes(y) for y in x)
+
+
+def code_instructions(x):
+    """Estimated Michelson instructions of an s-expression."""
+    return 3 * nodes(x)
+
+
+# Instructions by program, dropped with the program: an id could be reused
+# by a later program.
+codes = weakref.WeakKeyDictionary()
+
+
+def program_instructions(program):
+    count = codes.get(program)
+    if count is None:
+        parts = interpreter.keywords(program.source)
+        count = code_instructions(parts.get("messages", [])) + code_instructions(parts.get("globals", []))
+        codes[program] = count
+    return count
+
+
+def gas_units(milligas):
+    return (milligas + 999) // 1000
+
+
+class Receipt:
+    def __init__(self, kind, sender, destination, entry_point, internal, depth):
+        self.kind = kind
+        self.sender = sender
+        self.destination = destination
+        self.entry_point = entry_point
+        self.internal = internal
+        self.depth = depth
+        self.gas = 0
+        self.instructions = 0
+        self.storage_size = 0
+        self.paid_diff = 0
+        self.burn = 0
+
+    def to_json(self, names):
+        return {
+            "kind": self.kind,
+            "sender": names.get(self.sender, self.sender),
+            "destination": names.get(self.destination, self.destination),
+            "entry_point": self.entry_point,
+            "internal": self.internal,
+            "gas": self.gas,
+            "instructions": self.instructions,
+            "storage_size": self.storage_size,
+            "paid_diff": self.paid_diff,
+            "burn": self.burn,
+        }
+
+
+class MeteredChain(interpreter.LocalChain):
+    """A LocalChain recording a Receipt for every applied operation."""
+
+    compiler = MeteredCompiler
+
+    def __init__(self, *args, **kargs):
+        interpreter.LocalChain.__init__(self, *args, **kargs)
+        self.receipts = []
+        self.paid = {}
+        self.names = {}
+        self.depths = {}
+        self.last_receipts = []
+
+    def storage_size(self, account):
+        return (
+            2 * program_instructions(account.program)
+            + size(account.storage)
+            + big_map_size(account.storage)
+        )
+
+    def originate(self, program, storage=None, balance=0, address=None, id=None, source=None):
+        address = interpreter.LocalChain.originate(self, program, storage, balance, address, id, source)
+        account = self.accounts[address]
+        receipt = Receipt("originate", source, address, None, False, 0)
+        receipt.storage_size = receipt.paid_diff = self.storage_size(account)
+        receipt.gas = gas_units(
+            table["manager_operation"]
+            + table["typecheck_instruction"] * program_instructions(account.program)
+            + table["encode_byte"] * size(account.storage)
+        )
+        receipt.burn = (receipt.paid_diff + table["origination_size"]) * table["cost_per_byte"]
+        self.paid[address] = receipt.storage_size
+        self.receipts.append(receipt)
+        self.last_receipts = [receipt]
+        return address
+
+    def transfer(self, sender, destination, entry_point, params, amount=0):
+        """As LocalChain.transfer, the receipts of the call are kept in
+        last_receipts."""
+        (receipts, paid) = (len(self.receipts), dict(self.paid))
+        self.depths = {}
+        try:
+            applied = interpreter.LocalChain.transfer(self, sender, destination, entry_point, params, amount)
+        except Exception:
+            del self.receipts[receipts:]
+            self.paid = paid
+            raise
+        self.last_receipts = self.receipts[receipts:]
+        return applied
+
+    def apply(self, sender, source, operation):
+        depth = self.depths.get(id(operation), 0)
+        if operation.kind == "originate":
+            receipt = Receipt("originate", sender, operation.address, None, depth > 0, depth)
+        else:
+            address = operation.destination.address
+            entry_point = operation.destination.entry_point
+            receipt = Receipt(operation.kind, sender, address, entry_point, depth > 0, depth)
+        self.meter = Meter()
+        target = self.accounts.get(receipt.destination)
+        program = None if target is None else target.program
+        gas = table["manager_operation"]
+        if program is not None and operation.kind == "transfer":
+            gas += table["decode_byte"] * (2 * program_instructions(program) + size(target.storage))
+            gas += table["typecheck_instruction"] * program_instructions(program)
+        try:
+            emitted = interpreter.LocalChain.apply(self, sender, source, operation)
+        finally:
+            meter = self.meter
+            self.meter = None
+        for (_, op) in emitted:
+            self.depths[id(op)] = depth + 1
+        target = self.accounts.get(receipt.destination)
+        if target is not None and target.program is not None:
+            if operation.kind == "originate":
+                gas += table["typecheck_instruction"] * program_instructions(target.program)
+            gas += table["encode_byte"] * size(target.storage)
+            receipt.storage_size = self.storage_size(target)
+            paid = self.paid.get(target.address, 0)
+            receipt.paid_diff = max(0, receipt.storage_size - paid)
+            self.paid[target.address] = max(paid, receipt.storage_size)
+            receipt.burn = receipt.paid_diff * table["cost_per_byte"]
+            if operation.kind == "originate":
+                receipt.burn += table["origination_size"] * table["cost_per_byte"]
+        receipt.gas = gas_units(gas + meter.gas)
+        receipt.instructions = meter.instructions
+        self.receipts.append(receipt)
+        return emitted
+
+    def name(self, address):
+        return self.names.get(address, address)
+
+
+def summary(chain, receipts=None):
+    """Costs by contract and entry point: calls, mean and max of gas,
+    instructions, paid storage and burn."""
+    result = {}
+    for receipt in chain.receipts if receipts is None else receipts:
+        key = "%s.%s" % (chain.name(receipt.destination), receipt.entry_point or receipt.kind)
+        entry = result.setdefault(
+            key, {"calls": 0, "internal": 0, "gas": [], "instructions": [], "paid_diff": [], "burn": []}
+        )
+        entry["calls"] += 1
+        entry["internal"] += 1 if receipt.internal else 0
+        for metric in ["gas", "instructions", "paid_diff", "burn"]:
+            entry[metric].append(getattr(receipt, metric))
+    for entry in result.values():
+        for metric in ["gas", "instructions", "paid_diff", "burn"]:
+            values = entry[metric]
+            entry[metric] = {"mean": sum(values) / len(values), "max": max(values)}
+    return result
+
+
+def print_summary(result):
+    header = "%-60s%7s%11s%11s%13s%11s%12s" % (
+        "entry point", "calls", "units", "units max", "instructions", "paid", "burn"
+    )
+    print(header)
+    print("-" * len(header))
+    for (key, entry) in sorted(result.items()):
+        print(
+            "%-60s%7i%11.0f%11i%13.0f%11.0f%12.0f"
+            % (
+                key,
+                entry["calls"],
+                entry["gas"]["mean"],
+                entry["gas"]["max"],
+                entry["instructions"]["mean"],
+                entry["paid_diff"]["mean"],
+                entry["burn"]["mean"],
+            )
+        )
+
+
+def print_receipts(chain, receipts):
+    """The operations of one call, internal ones indented by depth."""
+    for receipt in receipts:
+        print(
+            "%-60s%11i%13i%11i%12i"
+            % (
+                "  " * receipt.depth
+                + "%s.%s" % (chain.name(receipt.destination), receipt.entry_point or receipt.kind),
+                receipt.gas,
+                receipt.instructions,
+                receipt.paid_diff,
+                receipt.burn,
+            )
+        )
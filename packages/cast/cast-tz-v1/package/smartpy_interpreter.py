@@ -0,0 +1,1415 @@
+# In-process interpreter for the s-expressions exported by Contract.export.
+#
+# It covers the subset of SmartPy used by the contracts of this repository:
+# records, maps, big_maps, sets, lists, options and variants, verify,
+# locals, sp.if / sp.else, sp.for, sp.while, lambdas (also packed and
+# unpacked), sp.transfer and sp.create_contract. Expressions and commands
+# are compiled once into Python closures, so running an entry point does
+# not walk the s-expression again.
+#
+# Values:
+#   int, nat, mutez, timestamp   int
+#   string, address, key_hash   str
+#   bytes                        bytes
+#   bool                         bool
+#   unit                         ()
+#   record                       Record
+#   map                          dict
+#   big_map                      BigMap (a dict)
+#   set                          frozenset
+#   list                         list (never modified in place)
+#   pair                         tuple
+#   option, variant              Variant ("Some" / "None" for options)
+#   lambda                       Closure
+#   contract                     ContractValue
+#   operation                    Operation
+#
+# Values are immutable: assigning a path (self.data.m[k].f = v) copies the
+# records and maps along the path.
+#
+# pack does not produce Michelson bytes: it encodes the value (lambdas by
+# their s-expression) after the 0x05 prefix, so that unpack can read it
+# back. Failures raise Failure with the value of sp.failwith, the message of
+# sp.verify or, without message, the line number of the failing command.
+#
+# Operations emitted by an entry point are returned in the order they were
+# created. run_scenario executes the messages of a test scenario
+# (sp.test_scenario) on a LocalChain, internal operations included, and
+# apply_plan applies an origination plan (origination.json) to it.
+
+import collections
+import hashlib
+import os
+import re
+
+
+class Failure(Exception):
+    def __init__(self, value):
+        Exception.__init__(self, value)
+        self.value = value
+
+
+class Quoted(str):
+    """A string literal of the s-expression, as opposed to a symbol."""
+
+
+tokens = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+integer = re.compile(r"-?[0-9]+$")
+
+
+def parse(text):
+    """Parses s-expressions into nested lists of symbols, Quoted and ints."""
+    stack = [[]]
+    for token in tokens.findall(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            x = stack.pop()
+            stack[-1].append(x)
+        elif token[0] == '"':
+            stack[-1].append(Quoted(token[1:-1]))
+        elif integer.match(token):
+            stack[-1].append(int(token))
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        raise Exception("Unbalanced s-expression")
+    return stack[0]
+
+
+def unparse(x):
+    if isinstance(x, list):
+        return "(%s)" % " ".join(unparse(y) for y in x)
+    if isinstance(x, Quoted):
+        return '"%s"' % x
+    return str(x)
+
+
+class Record:
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.fields == other.fields
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.fields.items())))
+
+    def __lt__(self, other):
+        return tuple(v for (_, v) in sorted(self.fields.items())) < tuple(
+            v for (_, v) in sorted(other.fields.items())
+        )
+
+    def __repr__(self):
+        return "Record(%s)" % ", ".join("%s=%r" % (k, v) for (k, v) in sorted(self.fields.items()))
+
+
+class Variant:
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value=()):
+        self.name = name
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Variant) and (self.name, self.value) == (other.name, other.value)
+
+    def __hash__(self):
+        return hash((self.name, self.value))
+
+    def __lt__(self, other):
+        return (self.name, self.value) < (other.name, other.value)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.name, self.value)
+
+
+def some(x):
+    return Variant("Some", x)
+
+
+none = Variant("None")
+
+
+class BigMap(dict):
+    """A big_map, as opposed to a map: only its accessed entries are loaded
+    on chain."""
+
+
+class Closure:
+    __slots__ = ("id", "body", "source")
+
+    def __init__(self, id, body, source):
+        self.id = id
+        self.body = body
+        self.source = source
+
+    def __eq__(self, other):
+        return isinstance(other, Closure) and self.source == other.source
+
+    def __hash__(self):
+        return hash(self.source)
+
+    def __repr__(self):
+        return "Closure(%s)" % self.id
+
+
+class ContractValue:
+    __slots__ = ("address", "entry_point")
+
+    def __init__(self, address, entry_point):
+        self.address = address
+        self.entry_point = entry_point
+
+    def __eq__(self, other):
+        return isinstance(other, ContractValue) and (self.address, self.entry_point) == (
+            other.address,
+            other.entry_point,
+        )
+
+    def __hash__(self):
+        return hash((self.address, self.entry_point))
+
+    def __repr__(self):
+        return "ContractValue(%s%%%s)" % (self.address, self.entry_point)
+
+
+class Operation:
+    """transfer (parameter, amount, destination), originate (program,
+    storage, amount, address) or delegate (baker)."""
+
+    __slots__ = ("kind", "parameter", "amount", "destination", "program", "storage", "address", "baker")
+
+    def __init__(self, kind, **fields):
+        self.kind = kind
+        for name in Operation.__slots__[1:]:
+            setattr(self, name, fields.get(name))
+
+    def __repr__(self):
+        if self.kind == "transfer":
+            return "transfer(%r, %r, %r)" % (self.parameter, self.amount, self.destination)
+        if self.kind == "originate":
+            return "originate(%s, %r)" % (self.address, self.amount)
+        return "delegate(%r)" % self.baker
+
+
+# pack / unpack
+
+def encode(v):
+    if isinstance(v, bool):
+        return "(bool %s)" % v
+    if isinstance(v, int):
+        return "(int %i)" % v
+    if isinstance(v, str):
+        return "(string %s)" % (v.encode("utf8").hex() or "_")
+    if isinstance(v, bytes):
+        return "(bytes %s)" % (v.hex() or "_")
+    if v == ():
+        return "(unit)"
+    if isinstance(v, Record):
+        return "(record %s)" % " ".join(
+            "(%s %s)" % (k, encode(x)) for (k, x) in sorted(v.fields.items())
+        )
+    if isinstance(v, dict):
+        return "(map %s)" % " ".join(
+            "(%s %s)" % (encode(k), encode(v[k])) for k in sorted(v)
+        )
+    if isinstance(v, frozenset):
+        return "(set %s)" % " ".join(encode(x) for x in sorted(v))
+    if isinstance(v, list):
+        return "(list %s)" % " ".join(encode(x) for x in v)
+    if isinstance(v, tuple):
+        return "(tuple %s)" % " ".join(encode(x) for x in v)
+    if isinstance(v, Variant):
+        return "(variant %s %s)" % (v.name, encode(v.value))
+    if isinstance(v, Closure):
+        return "(closure %s)" % v.source
+    if isinstance(v, ContractValue):
+        return "(contract %s %s)" % (encode(v.address), encode(v.entry_point))
+    raise Exception("Cannot pack %r" % (v,))
+
+
+def decode(x, compiler=None):
+    f = x[0]
+    if f == "bool":
+        return x[1] == "True"
+    if f == "int":
+        return x[1]
+    if f == "string":
+        return "" if x[1] == "_" else bytes.fromhex(str(x[1])).decode("utf8")
+    if f == "bytes":
+        return b"" if x[1] == "_" else bytes.fromhex(str(x[1]))
+    if f == "unit":
+        return ()
+    if f == "record":
+        return Record({k: decode(y, compiler) for (k, y) in x[1:]})
+    if f == "map":
+        return {decode(k, compiler): decode(y, compiler) for (k, y) in x[1:]}
+    if f == "set":
+        return frozenset(decode(y, compiler) for y in x[1:])
+    if f == "list":
+        return [decode(y, compiler) for y in x[1:]]
+    if f == "tuple":
+        return tuple(decode(y, compiler) for y in x[1:])
+    if f == "variant":
+        return Variant(x[1], decode(x[2], compiler))
+    if f == "closure":
+        return compile_closure(x[1], compiler)
+    if f == "contract":
+        return ContractValue(decode(x[1]), decode(x[2]))
+    raise Exception("Cannot unpack %s" % unparse(x))
+
+
+def pack(v):
+    return b"\x05" + encode(v).encode("utf8")
+
+
+unpacked = {}
+
+
+def unpack(b, compiler=None):
+    if not isinstance(b, bytes) or not b.startswith(b"\x05"):
+        return none
+    key = (compiler.__class__, b)
+    result = unpacked.get(key)
+    if result is None:
+        try:
+            result = some(decode(parse(b[1:].decode("utf8"))[0], compiler))
+        except Exception:
+            result = none
+        unpacked[key] = result
+    return result
+
+
+closures = {}
+
+
+def compile_closure(x, compiler=None):
+    """Closure of a lambda s-expression (lambda id params line commands)."""
+    compiler = Compiler() if compiler is None else compiler
+    source = unparse(x)
+    key = (compiler.__class__, source)
+    closure = closures.get(key)
+    if closure is None:
+        closure = Closure(x[1], compiler.block(x[4]), source)
+        closures[key] = closure
+    return closure
+
+
+# Evaluation
+
+class Context:
+    """Execution context of an operation: chain and transaction data."""
+
+    def __init__(self, chain, sender=None, source=None, amount=0, now=0, level=0,
+                 self_address=None, balance=0, chain_id="", meter=None):
+        self.chain = chain
+        self.meter = meter
+        self.sender = sender
+        self.source = source
+        self.amount = amount
+        self.now = now
+        self.level = level
+        self.self_address = self_address
+        self.balance = balance
+        self.chain_id = chain_id
+
+
+class Frame:
+    __slots__ = ("data", "params", "locals", "lambdaParams", "iters", "operations", "globals", "context", "result")
+
+    def __init__(self, context, data=None, params=None, globals=None):
+        self.context = context
+        self.data = data
+        self.params = params
+        self.locals = {}
+        self.lambdaParams = {}
+        self.iters = {}
+        self.operations = []
+        self.globals = globals or {}
+        self.result = None
+
+
+def call_closure(closure, arg, frame):
+    inner = Frame(frame.context, globals=frame.globals)
+    inner.lambdaParams[closure.id] = arg
+    closure.body(inner)
+    if inner.operations:
+        frame.operations = inner.operations + frame.operations
+    return inner.result
+
+
+def literal_value(t, v):
+    if t in ["nat", "int", "intOrNat", "mutez", "timestamp"]:
+        return int(v)
+    if t == "bool":
+        return v == "True" or v is True
+    if t == "bytes":
+        s = str(v)
+        return bytes.fromhex(s[2:] if s.startswith("0x") else s)
+    if t == "unit":
+        return ()
+    return str(v)
+
+
+def compare(f):
+    return {
+        "eq": lambda a, b: a == b,
+        "neq": lambda a, b: a != b,
+        "lt": lambda a, b: a < b,
+        "le": lambda a, b: a <= b,
+        "gt": lambda a, b: a > b,
+        "ge": lambda a, b: a >= b,
+    }[f]
+
+
+def items(m):
+    return [Record({"key": k, "value": m[k]}) for k in sorted(m)]
+
+
+def elements(x):
+    if isinstance(x, dict):
+        return items(x)
+    if isinstance(x, frozenset):
+        return sorted(x)
+    return x
+
+
+def line_of(x):
+    return x[-1] if x and isinstance(x[-1], int) and not isinstance(x[-1], bool) else 0
+
+
+def fail(value):
+    raise Failure(value)
+
+
+ATTR = 0
+ITEM = 1
+
+
+def update_path(value, steps, keys, i, new):
+    if i == len(steps):
+        return new
+    step = steps[i]
+    if step[0] == ATTR:
+        fields = dict(value.fields)
+        fields[step[1]] = update_path(value.fields[step[1]], steps, keys, i + 1, new)
+        return Record(fields)
+    k = keys[i]
+    m = value.__class__(value)
+    if i + 1 < len(steps):
+        if k not in value:
+            fail(step[2])
+        m[k] = update_path(value[k], steps, keys, i + 1, new)
+    else:
+        m[k] = new
+    return m
+
+
+class Compiler:
+    def expr(self, x):
+        if not isinstance(x, list):
+            raise Exception("Unexpected atom %r in expression" % (x,))
+        f = x[0]
+        method = getattr(self, "e_" + f.replace("-", "_"), None)
+        if method is None:
+            def unsupported(frame):
+                raise Exception("Unsupported expression %s (line %s)" % (f, line_of(x)))
+
+            return unsupported
+        return method(x)
+
+    def exprs(self, xs):
+        return [self.expr(y) for y in xs]
+
+    # Literals and variables
+
+    def e_literal(self, x):
+        (t, v) = (x[1][0], x[1][1] if len(x[1]) > 1 else None)
+        if t == "local-address":
+            return lambda frame: frame.context.chain.local_address(v)
+        value = literal_value(t, v)
+        return lambda frame: value
+
+    def e_unit(self, x):
+        return lambda frame: ()
+
+    def e_data(self, x):
+        return lambda frame: frame.data
+
+    def e_params(self, x):
+        return lambda frame: frame.params
+
+    def e_lambdaParams(self, x):
+        id = x[1]
+        return lambda frame: frame.lambdaParams[id]
+
+    def e_getLocal(self, x):
+        name = x[1]
+        return lambda frame: frame.locals[name]
+
+    def e_iter(self, x):
+        name = x[1]
+        return lambda frame: frame.iters[name]
+
+    def e_variant_arg(self, x):
+        key = ("variant", str(x[1]))
+        return lambda frame: frame.iters[key]
+
+    def e_global(self, x):
+        name = x[1]
+        return lambda frame: frame.globals[name]
+
+    def e_operations(self, x):
+        return lambda frame: frame.operations
+
+    def e_contractData(self, x):
+        id = x[1]
+        return lambda frame: frame.context.chain.contract_data(id)
+
+    def e_contractBalance(self, x):
+        id = x[1]
+        return lambda frame: frame.context.chain.contract_balance(id)
+
+    def e_scenario_var(self, x):
+        id = x[1]
+        return lambda frame: frame.context.chain.scenario_vars[id]
+
+    def e_sender(self, x):
+        return lambda frame: frame.context.sender
+
+    def e_source(self, x):
+        return lambda frame: frame.context.source
+
+    def e_amount(self, x):
+        return lambda frame: frame.context.amount
+
+    def e_now(self, x):
+        return lambda frame: frame.context.now
+
+    def e_level(self, x):
+        return lambda frame: frame.context.level
+
+    def e_balance(self, x):
+        return lambda frame: frame.context.balance
+
+    def e_self_address(self, x):
+        return lambda frame: frame.context.self_address
+
+    def e_chain_id(self, x):
+        return lambda frame: frame.context.chain_id
+
+    def e_self_entry_point(self, x):
+        name = str(x[1])
+        return lambda frame: ContractValue(frame.context.self_address, name)
+
+    def e_account_of_seed(self, x):
+        seed = str(x[1])
+        h = hashlib.sha256(seed.encode("utf8")).hexdigest()
+        account = Record(
+            {
+                "address": make_address("tz1", seed),
+                "public_key_hash": make_address("tz1", seed),
+                "public_key": "edpk" + h[:50],
+                "secret_key": "edsk" + h[:50],
+            }
+        )
+        return lambda frame: account
+
+    def e_reduce(self, x):
+        return self.expr(x[1])
+
+    def e_type_annotation(self, x):
+        return self.expr(x[1])
+
+    # Data structures
+
+    def e_record(self, x):
+        fields = [(name, self.expr(y)) for (name, y) in x[2:]]
+        return lambda frame: Record({name: f(frame) for (name, f) in fields})
+
+    def e_map(self, x):
+        entries = [(self.expr(k), self.expr(v)) for (k, v) in x[2:]]
+        return lambda frame: {k(frame): v(frame) for (k, v) in entries}
+
+    def e_big_map(self, x):
+        entries = [(self.expr(k), self.expr(v)) for (k, v) in x[2:]]
+        return lambda frame: BigMap({k(frame): v(frame) for (k, v) in entries})
+
+    def e_set(self, x):
+        elements = self.exprs(x[2:])
+        return lambda frame: frozenset(e(frame) for e in elements)
+
+    def e_list(self, x):
+        elements = self.exprs(x[2:])
+        return lambda frame: [e(frame) for e in elements]
+
+    def e_tuple(self, x):
+        elements = self.exprs(x[1:-1])
+        return lambda frame: tuple(e(frame) for e in elements)
+
+    def e_variant(self, x):
+        (name, value) = (str(x[1]), self.expr(x[2]))
+        return lambda frame: Variant(name, value(frame))
+
+    def e_attr(self, x):
+        (record, name) = (self.expr(x[1]), str(x[2]))
+        return lambda frame: record(frame).fields[name]
+
+    def e_getItem(self, x):
+        (m, k, line) = (self.expr(x[1]), self.expr(x[2]), line_of(x))
+
+        def getItem(frame):
+            try:
+                return m(frame)[k(frame)]
+            except KeyError:
+                fail(line)
+
+        return getItem
+
+    def e_getItemDefault(self, x):
+        (m, k, default) = self.exprs(x[1:4])
+        return lambda frame: m(frame).get(k(frame), default(frame))
+
+    def e_getItemMessage(self, x):
+        (m, k, message) = self.exprs(x[1:4])
+
+        def getItemMessage(frame):
+            try:
+                return m(frame)[k(frame)]
+            except KeyError:
+                fail(message(frame))
+
+        return getItemMessage
+
+    def e_contains(self, x):
+        (m, k) = self.exprs(x[1:3])
+        return lambda frame: k(frame) in m(frame)
+
+    def e_items(self, x):
+        m = self.expr(x[1])
+        return lambda frame: items(m(frame))
+
+    def e_keys(self, x):
+        m = self.expr(x[1])
+        return lambda frame: sorted(m(frame))
+
+    def e_values(self, x):
+        m = self.expr(x[1])
+        return lambda frame: [v for (_, v) in sorted(m(frame).items())]
+
+    def e_elements(self, x):
+        s = self.expr(x[1])
+        return lambda frame: sorted(s(frame))
+
+    def e_rev(self, x):
+        l = self.expr(x[1])
+        return lambda frame: l(frame)[::-1]
+
+    def e_rev_items(self, x):
+        m = self.expr(x[1])
+        return lambda frame: items(m(frame))[::-1]
+
+    def e_size(self, x):
+        s = self.expr(x[1])
+        return lambda frame: len(s(frame))
+
+    def e_cons(self, x):
+        (head, tail) = self.exprs(x[1:3])
+        return lambda frame: [head(frame)] + tail(frame)
+
+    def e_concat(self, x):
+        l = self.expr(x[1])
+
+        def concat(frame):
+            xs = l(frame)
+            return b"".join(xs) if xs and isinstance(xs[0], bytes) else "".join(xs)
+
+        return concat
+
+    def e_slice(self, x):
+        (offset, length, s) = self.exprs(x[1:4])
+
+        def slice(frame):
+            (o, n, v) = (offset(frame), length(frame), s(frame))
+            return some(v[o : o + n]) if o + n <= len(v) else none
+
+        return slice
+
+    def e_first(self, x):
+        p = self.expr(x[1])
+        return lambda frame: p(frame)[0]
+
+    def e_second(self, x):
+        p = self.expr(x[1])
+        return lambda frame: p(frame)[1]
+
+    def e_isVariant(self, x):
+        (v, name) = (self.expr(x[1]), str(x[2]))
+        return lambda frame: v(frame).name == name
+
+    def e_openVariant(self, x):
+        (v, name, line) = (self.expr(x[1]), str(x[2]), line_of(x))
+        message = None if x[3] == "None" else self.expr(x[3])
+
+        def openVariant(frame):
+            value = v(frame)
+            if value.name != name:
+                fail(line if message is None else message(frame))
+            return value.value
+
+        return openVariant
+
+    # Operators
+
+    def binary(self, x, op):
+        (a, b) = self.exprs(x[1:3])
+        return lambda frame: op(a(frame), b(frame))
+
+    def e_eq(self, x):
+        return self.binary(x, compare("eq"))
+
+    def e_neq(self, x):
+        return self.binary(x, compare("neq"))
+
+    def e_lt(self, x):
+        return self.binary(x, compare("lt"))
+
+    def e_le(self, x):
+        return self.binary(x, compare("le"))
+
+    def e_gt(self, x):
+        return self.binary(x, compare("gt"))
+
+    def e_ge(self, x):
+        return self.binary(x, compare("ge"))
+
+    def e_add(self, x):
+        return self.binary(x, lambda a, b: a + b)
+
+    def e_sub(self, x):
+        return self.binary(x, lambda a, b: a - b)
+
+    def e_mul(self, x):
+        return self.binary(x, lambda a, b: a * b)
+
+    def e_floordiv(self, x):
+        return self.binary(x, lambda a, b: a // b)
+
+    def e_mod(self, x):
+        return self.binary(x, lambda a, b: a % b)
+
+    def e_xor(self, x):
+        return self.binary(x, lambda a, b: a ^ b)
+
+    def e_max(self, x):
+        return self.binary(x, max)
+
+    def e_min(self, x):
+        return self.binary(x, min)
+
+    def e_ediv(self, x):
+        return self.binary(x, lambda a, b: some((a // b, a % b)) if b else none)
+
+    def e_and(self, x):
+        (a, b) = self.exprs(x[1:3])
+
+        def and_(frame):
+            v = a(frame)
+            return (v and b(frame)) if isinstance(v, bool) else v & b(frame)
+
+        return and_
+
+    def e_or(self, x):
+        (a, b) = self.exprs(x[1:3])
+
+        def or_(frame):
+            v = a(frame)
+            return (v or b(frame)) if isinstance(v, bool) else v | b(frame)
+
+        return or_
+
+    def e_lshift(self, x):
+        return self.binary(x, lambda a, b: a << b)
+
+    def e_rshift(self, x):
+        return self.binary(x, lambda a, b: a >> b)
+
+    def e_invert(self, x):
+        a = self.expr(x[1])
+
+        def invert(frame):
+            v = a(frame)
+            return not v if isinstance(v, bool) else ~v
+
+        return invert
+
+    def e_neg(self, x):
+        a = self.expr(x[1])
+        return lambda frame: -a(frame)
+
+    def e_abs(self, x):
+        a = self.expr(x[1])
+        return lambda frame: abs(a(frame))
+
+    def e_toInt(self, x):
+        return self.expr(x[1])
+
+    def e_isNat(self, x):
+        a = self.expr(x[1])
+
+        def isNat(frame):
+            v = a(frame)
+            return some(v) if v >= 0 else none
+
+        return isNat
+
+    def e_add_seconds(self, x):
+        return self.binary(x, lambda t, s: t + s)
+
+    def e_split_tokens(self, x):
+        (amount, quantity, total) = self.exprs(x[1:4])
+        return lambda frame: amount(frame) * quantity(frame) // total(frame)
+
+    def e_hashCrypto(self, x):
+        (algorithm, v) = (str(x[1]).lower(), self.expr(x[2]))
+        name = "blake2b" if algorithm == "blake2b" else algorithm
+        if name == "blake2b":
+            return lambda frame: hashlib.blake2b(v(frame), digest_size=32).digest()
+        return lambda frame: hashlib.new(name, v(frame)).digest()
+
+    # Lambdas, packing
+
+    def e_lambda(self, x):
+        closure = compile_closure(x, self)
+        return lambda frame: closure
+
+    def e_call_lambda(self, x):
+        (f, arg) = self.exprs(x[1:3])
+        return lambda frame: call_closure(f(frame), arg(frame), frame)
+
+    def e_pack(self, x):
+        v = self.expr(x[1])
+        return lambda frame: pack(v(frame))
+
+    def e_unpack(self, x):
+        v = self.expr(x[1])
+        return lambda frame: unpack(v(frame), self)
+
+    # Contracts and operations
+
+    def e_contract(self, x):
+        (entry_point, address) = (str(x[1]), self.expr(x[3]))
+
+        def contract(frame):
+            a = address(frame)
+            if frame.context.chain.has_entry_point(a, entry_point):
+                return some(ContractValue(a, entry_point))
+            return none
+
+        return contract
+
+    def e_implicit_account(self, x):
+        key_hash = self.expr(x[1])
+        return lambda frame: ContractValue(key_hash(frame), "")
+
+    def e_to_address(self, x):
+        c = self.expr(x[1])
+        return lambda frame: c(frame).address
+
+    def e_transfer(self, x):
+        (parameter, amount, destination) = self.exprs(x[1:4])
+        return lambda frame: Operation(
+            "transfer", parameter=parameter(frame), amount=amount(frame), destination=destination(frame)
+        )
+
+    def e_set_delegate(self, x):
+        baker = self.expr(x[1])
+        return lambda frame: Operation("delegate", baker=baker(frame))
+
+    def e_create_contract(self, x):
+        parts = {y[0]: y[1] if len(y) > 1 else None for y in x[1:-1]}
+        program = Program(parts["contract"], self.__class__())
+        storage = self.expr(parts["storage"]) if isinstance(parts["storage"], list) else None
+        amount = self.expr(parts["amount"])
+        baker = self.expr(parts["baker"]) if isinstance(parts.get("baker"), list) else None
+
+        def create_contract(frame):
+            address = frame.context.chain.new_address()
+            operation = Operation(
+                "originate",
+                program=program,
+                storage=program.storage if storage is None else storage(frame),
+                amount=amount(frame),
+                address=address,
+                baker=None if baker is None else baker(frame),
+            )
+            return Record({"operation": operation, "address": address})
+
+        return create_contract
+
+    # Commands
+
+    def block(self, commands):
+        compiled = []
+        i = 0
+        while i < len(commands):
+            command = commands[i]
+            i += 1
+            if command[0] == "ifBlock":
+                orElse = None
+                if i < len(commands) and commands[i][0] == "elseBlock":
+                    orElse = self.block(commands[i][1])
+                    i += 1
+                compiled.append(self.c_ifBlock(command, orElse))
+            else:
+                compiled.append(self.command(command))
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def block(frame):
+            for c in compiled:
+                c(frame)
+
+        return block
+
+    def command(self, x):
+        f = x[0]
+        method = getattr(self, "c_" + f, None)
+        if method is None:
+            def unsupported(frame):
+                raise Exception("Unsupported command %s (line %s)" % (f, line_of(x)))
+
+            return unsupported
+        return method(x)
+
+    def lvalue(self, x):
+        """Compiles an assigned path into (get root, set root, steps, keys)."""
+        steps = []
+        keys = []
+        while isinstance(x, list) and x[0] in ["attr", "getItem"]:
+            if x[0] == "attr":
+                steps.append((ATTR, str(x[2])))
+                keys.append(None)
+            else:
+                steps.append((ITEM, None, line_of(x)))
+                keys.append(self.expr(x[2]))
+            x = x[1]
+        steps.reverse()
+        keys.reverse()
+        if x[0] == "data":
+            get = lambda frame: frame.data
+
+            def put(frame, v):
+                frame.data = v
+
+        elif x[0] == "getLocal":
+            name = x[1]
+            get = lambda frame: frame.locals[name]
+
+            def put(frame, v):
+                frame.locals[name] = v
+
+        elif x[0] == "operations":
+            get = lambda frame: frame.operations
+
+            def put(frame, v):
+                frame.operations = v
+
+        else:
+            raise Exception("Cannot assign %s" % unparse(x))
+        return (get, put, steps, keys)
+
+    def c_set(self, x):
+        (get, put, steps, keys) = self.lvalue(x[1])
+        value = self.expr(x[2])
+        if not steps:
+            return lambda frame: put(frame, value(frame))
+
+        def set(frame):
+            v = value(frame)
+            ks = [None if k is None else k(frame) for k in keys]
+            put(frame, update_path(get(frame), steps, ks, 0, v))
+
+        return set
+
+    def c_delItem(self, x):
+        (get, put, steps, keys) = self.lvalue(x[1])
+        item = self.expr(x[2])
+
+        def delItem(frame):
+            k = item(frame)
+            ks = [None if key is None else key(frame) for key in keys]
+            m = self.get_path(get(frame), steps, ks)
+            m = m.__class__(m)
+            m.pop(k, None)
+            put(frame, update_path(get(frame), steps, ks, 0, m))
+
+        return delItem
+
+    def c_updateSet(self, x):
+        (get, put, steps, keys) = self.lvalue(x[1])
+        (item, add) = (self.expr(x[2]), x[3] == "True")
+
+        def updateSet(frame):
+            k = item(frame)
+            ks = [None if key is None else key(frame) for key in keys]
+            s = self.get_path(get(frame), steps, ks)
+            s = s | {k} if add else s - {k}
+            put(frame, update_path(get(frame), steps, ks, 0, s))
+
+        return updateSet
+
+    @staticmethod
+    def get_path(value, steps, keys):
+        for (step, k) in zip(steps, keys):
+            if step[0] == ATTR:
+                value = value.fields[step[1]]
+            else:
+                if k not in value:
+                    fail(step[2])
+                value = value[k]
+        return value
+
+    def c_defineLocal(self, x):
+        (name, value) = (x[1], self.expr(x[2]))
+
+        def defineLocal(frame):
+            frame.locals[name] = value(frame)
+
+        return defineLocal
+
+    def c_verify(self, x):
+        cond = self.expr(x[1])
+        message = self.expr(x[3]) if len(x) > 4 else None
+        line = line_of(x)
+
+        def verify(frame):
+            if not cond(frame):
+                fail(line if message is None else message(frame))
+
+        return verify
+
+    def c_failwith(self, x):
+        message = self.expr(x[1])
+        return lambda frame: fail(message(frame))
+
+    def c_never(self, x):
+        return self.c_failwith(x)
+
+    def c_result(self, x):
+        value = self.expr(x[1])
+
+        def result(frame):
+            frame.result = value(frame)
+
+        return result
+
+    def c_set_type(self, x):
+        return lambda frame: None
+
+    c_set_record_layout = c_set_type
+    c_set_variant_layout = c_set_type
+    c_set_type_record_layout = c_set_type
+    c_set_type_variant_layout = c_set_type
+
+    def c_ifBlock(self, x, orElse=None):
+        (cond, then) = (self.expr(x[1]), self.block(x[2]))
+
+        def ifBlock(frame):
+            if cond(frame):
+                then(frame)
+            elif orElse is not None:
+                orElse(frame)
+
+        return ifBlock
+
+    def c_ifSomeBlock(self, x):
+        (cond, then) = (self.expr(x[1]), self.block(x[3]))
+
+        def ifSomeBlock(frame):
+            if cond(frame).name == "Some":
+                then(frame)
+
+        return ifSomeBlock
+
+    def c_match(self, x):
+        (v, name, arg, body, line) = (self.expr(x[1]), str(x[2]), ("variant", str(x[3])), self.block(x[4]), line_of(x))
+
+        def match(frame):
+            value = v(frame)
+            if value.name != name:
+                fail(line)
+            frame.iters[arg] = value.value
+            body(frame)
+
+        return match
+
+    def c_match_cases(self, x):
+        v = self.expr(x[1])
+        cases = {}
+        for case in x[3]:
+            if case[0] != "match":
+                raise Exception("Unexpected %s in match_cases (line %s)" % (case[0], line_of(case)))
+            cases[str(case[2])] = (("variant", str(case[3])), self.block(case[4]))
+
+        def matchCases(frame):
+            value = v(frame)
+            case = cases.get(value.name)
+            if case is not None:
+                frame.iters[case[0]] = value.value
+                case[1](frame)
+
+        return matchCases
+
+    def c_whileBlock(self, x):
+        (cond, body) = (self.expr(x[1]), self.block(x[2]))
+
+        def whileBlock(frame):
+            while cond(frame):
+                body(frame)
+
+        return whileBlock
+
+    def c_forGroup(self, x):
+        (name, value, body) = (x[1], self.expr(x[2]), self.block(x[3]))
+
+        def forGroup(frame):
+            for element in elements(value(frame)):
+                frame.iters[name] = element
+                body(frame)
+
+        return forGroup
+
+
+def keywords(x):
+    """(k1 v1 k2 v2 ...) as a dict."""
+    return {x[i]: x[i + 1] for i in range(0, len(x) - 1, 2)}
+
+
+class Program:
+    """A compiled contract: initial storage, entry points and globals."""
+
+    def __init__(self, x, compiler=None):
+        if isinstance(x, str):
+            x = parse(x)[0]
+        self.source = x
+        parts = keywords(x)
+        compiler = Compiler() if compiler is None else compiler
+        storage = parts.get("storage")
+        self.storage_expr = compiler.expr(storage) if isinstance(storage, list) and storage else None
+        self.storage = None
+        self.entry_points = {}
+        for message in parts.get("messages", []):
+            self.entry_points[str(message[0])] = compiler.block(message[2])
+        self.global_exprs = [(str(name), compiler.expr(value)) for (name, value) in parts.get("globals", [])]
+        self.flags = parts.get("flags", [])
+        balance = parts.get("balance")
+        self.balance_expr = compiler.expr(balance) if isinstance(balance, list) and balance else None
+
+    def initial_storage(self, context):
+        if self.storage_expr is None:
+            return None
+        return self.storage_expr(Frame(context))
+
+    def globals(self, context):
+        frame = Frame(context)
+        for (name, value) in self.global_exprs:
+            frame.globals[name] = value(frame)
+        return frame.globals
+
+    def execute(self, entry_point, params, storage, context, globals=None):
+        """Runs an entry point, returns the new storage and the operations."""
+        body = self.entry_points.get(entry_point)
+        if body is None:
+            raise Exception("No entry point %s" % entry_point)
+        frame = Frame(context, storage, params, globals if globals is not None else self.globals(context))
+        body(frame)
+        return (frame.data, frame.operations[::-1])
+
+
+b58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def make_address(prefix, seed):
+    n = int(hashlib.sha256(str(seed).encode("utf8")).hexdigest(), 16)
+    chars = []
+    for _ in range(33):
+        (n, r) = divmod(n, 58)
+        chars.append(b58[r])
+    return prefix + "".join(chars)
+
+
+class Account:
+    __slots__ = ("address", "program", "storage", "balance", "globals", "id")
+
+    def __init__(self, address, program=None, storage=None, balance=0, globals=None, id=None):
+        self.address = address
+        self.program = program
+        self.storage = storage
+        self.balance = balance
+        self.globals = globals
+        self.id = id
+
+
+class LocalChain:
+    """Contracts and implicit accounts, with the internal operations of a
+    call executed in breadth-first order, as on Tezos."""
+
+    compiler = Compiler
+
+    def __init__(self, now=0, level=0, chain_id=""):
+        self.accounts = {}
+        self.ids = {}
+        self.originated = 0
+        self.now = now
+        self.level = level
+        self.chain_id = chain_id
+        self.scenario_vars = {}
+        self.journal = None
+        self.meter = None
+
+    def new_address(self):
+        self.originated += 1
+        return make_address("KT1", "originated %i" % self.originated)
+
+    def local_address(self, id):
+        return make_address("KT1", "scenario %s" % id)
+
+    def account(self, address):
+        account = self.accounts.get(address)
+        if account is None:
+            if address.startswith("KT1"):
+                return None
+            account = Account(address)
+            self.accounts[address] = account
+        return account
+
+    def contract_data(self, id):
+        return self.accounts[self.ids[id]].storage
+
+    def contract_balance(self, id):
+        return self.accounts[self.ids[id]].balance
+
+    def has_entry_point(self, address, entry_point):
+        account = self.accounts.get(address)
+        if account is None or account.program is None:
+            return entry_point in ["", "default"] and not address.startswith("KT1")
+        if entry_point in ["", "default"]:
+            return len(account.program.entry_points) == 1 or "default" in account.program.entry_points
+        return entry_point in account.program.entry_points
+
+    def context(self, sender, source, amount, address):
+        return Context(
+            self,
+            sender=sender,
+            source=source,
+            amount=amount,
+            now=self.now,
+            level=self.level,
+            self_address=address,
+            balance=self.accounts[address].balance,
+            chain_id=self.chain_id,
+            meter=self.meter,
+        )
+
+    def originate(self, program, storage=None, balance=0, address=None, id=None, source=None):
+        if isinstance(program, str):
+            program = Program(program, self.compiler())
+        if address is None:
+            address = self.local_address(id) if id is not None else self.new_address()
+        context = Context(self, sender=source, source=source, now=self.now, level=self.level,
+                          self_address=address, chain_id=self.chain_id)
+        if storage is None:
+            storage = program.initial_storage(context)
+        account = Account(address, program, storage, balance, program.globals(context), id)
+        self.accounts[address] = account
+        if id is not None:
+            self.ids[id] = address
+        return address
+
+    def transfer(self, sender, destination, entry_point, params, amount=0):
+        """Calls a contract (or credits an implicit account) and runs the
+        internal operations it emits, breadth first. Returns the applied
+        operations with their senders. The chain is left unchanged when one
+        of them fails."""
+        self.journal = {}
+        originated = self.originated
+        queue = collections.deque(
+            [(sender, Operation("transfer", parameter=params, amount=amount,
+                                destination=ContractValue(destination, entry_point)))]
+        )
+        applied = []
+        try:
+            while queue:
+                (operation_sender, operation) = queue.popleft()
+                applied.append((operation_sender, operation))
+                queue.extend(self.apply(operation_sender, sender, operation))
+        except Exception:
+            for (address, (account, storage, balance)) in self.journal.items():
+                if account is None:
+                    del self.accounts[address]
+                else:
+                    account.storage = storage
+                    account.balance = balance
+            self.originated = originated
+            raise
+        finally:
+            self.journal = None
+        return applied
+
+    def touch(self, account):
+        if self.journal is not None and account.address not in self.journal:
+            self.journal[account.address] = (account, account.storage, account.balance)
+
+    def apply(self, sender, source, operation):
+        """Applies one operation, returns the operations it emits."""
+        if operation.kind == "originate":
+            self.debit(sender, operation.amount)
+            account = Account(operation.address, operation.program, operation.storage, operation.amount)
+            account.globals = operation.program.globals(
+                Context(self, sender=sender, source=source, self_address=operation.address)
+            )
+            if self.journal is not None:
+                self.journal[operation.address] = (None, None, 0)
+            self.accounts[operation.address] = account
+            return []
+        if operation.kind == "delegate":
+            return []
+        destination = operation.destination
+        target = self.account(destination.address)
+        if target is None:
+            raise Failure("Unknown contract %s" % destination.address)
+        self.debit(sender, operation.amount)
+        self.touch(target)
+        target.balance += operation.amount
+        if target.program is None:
+            return []
+        entry_point = destination.entry_point
+        if entry_point in ["", "default"] and "default" not in target.program.entry_points:
+            entry_point = next(iter(target.program.entry_points))
+        context = self.context(sender, source, operation.amount, target.address)
+        (target.storage, operations) = target.program.execute(
+            entry_point, operation.parameter, target.storage, context, target.globals
+        )
+        return [(target.address, op) for op in operations]
+
+    def debit(self, address, amount):
+        account = self.account(address)
+        if account is not None and account.program is not None:
+            if account.balance < amount:
+                raise Failure("Balance too low")
+            self.touch(account)
+            account.balance -= amount
+
+
+# Origination plans (origination.json), as run by
+# scripts/toolchain/cli/platform.ts against a node.
+
+placeholder = re.compile(r"tz1@([^@]*)@")
+
+
+def dist_export(path):
+    """Export of the contract of a plan path, as built by --compile dist."""
+    name = os.path.basename(path.rstrip("/"))
+    return open(os.path.join(path, "dist", name, name + ".smlse")).read()
+
+
+def apply_plan(chain, plan, context, exports=dist_export):
+    """Applies the actions of an origination plan.
+
+    context maps the placeholders of the storages (tz1@ADMIN@, ...) to
+    addresses; it must contain ADMIN and REGISTRAR and receives the
+    addresses of the originated contracts. exports gives the export of the
+    contract of a path. Returns context."""
+    for step in plan:
+        action = step["action"]
+        if action == "originate":
+            export = placeholder.sub(lambda m: context[m.group(1)], exports(step["path"]))
+            context[step["register"]] = chain.originate(export, source=context["ADMIN"])
+        elif action == "bind":
+            chain.transfer(context["ADMIN"], context[step["lambda"]], "buildCreateAndPlay", Record({}))
+            chain.transfer(context["ADMIN"], context[step["lambda"]], "sendCreateAndPlay", context[step["target"]])
+        elif action == "authorizeFactory":
+            chain.transfer(
+                context["REGISTRAR"],
+                context[step["registry"]],
+                "authorizeFactory",
+                Record({"factoryType": step["instrumentType"], "factoryAddress": context[step["target"]]}),
+            )
+        else:
+            print("Unknown action: %s" % action)
+    return context
+
+
+def scenario_address(chain, text):
+    """Address of a sender given as in PreparedMessage (seed:, address:, none)."""
+    if text == "none":
+        return make_address("tz1", "none")
+    if text.startswith("seed:"):
+        return make_address("tz1", text[5:])
+    if text.startswith("address:"):
+        return Compiler().expr(parse(text[8:])[0])(Frame(Context(chain)))
+    return text
+
+
+def run_scenario(messages, chain=None):
+    """Executes the messages of a scenario, returns (ok, messages annotated
+    with their outcome)."""
+    chain = LocalChain() if chain is None else chain
+    ok = True
+    results = []
+    for message in messages:
+        message = dict(message) if isinstance(message, dict) else message
+        if not isinstance(message, dict):
+            results.append(message)
+            continue
+        action = message.get("action")
+        try:
+            if action == "newContract":
+                chain.originate(message["export"], id=message["id"])
+            elif action == "message":
+                if message.get("time") is not None:
+                    chain.now = message["time"]
+                if message.get("level") is not None:
+                    chain.level = message["level"]
+                context = Frame(Context(chain))
+                params = Compiler().expr(parse(message["params"])[0])(context)
+                amount = Compiler().expr(parse(message["amount"])[0])(context)
+                sender = scenario_address(chain, message["sender"])
+                source = scenario_address(chain, message["source"])
+                try:
+                    chain.transfer(sender, chain.ids[message["id"]], message["message"], params, amount)
+                    message["result"] = "ok"
+                except Failure as failure:
+                    message["result"] = "failure"
+                    message["error"] = repr(failure.value)
+                if (message["result"] == "ok") != message.get("valid", True):
+                    ok = False
+                    message["unexpected"] = True
+            elif action == "verify":
+                value = Compiler().expr(parse(message["condition"])[0])(Frame(Context(chain)))
+                message["result"] = "ok" if value else "failure"
+                if not value:
+                    ok = False
+                    message["unexpected"] = True
+            elif action == "error":
+                ok = False
+                message["unexpected"] = True
+            elif action == "compute":
+                chain.scenario_vars[message["id"]] = Compiler().expr(parse(message["expression"])[0])(
+                    Frame(Context(chain))
+                )
+            elif action == "show":
+                message["value"] = repr(
+                    Compiler().expr(parse(message["expression"])[0])(Frame(Context(chain)))
+                )
+        except Exception as e:
+            message["result"] = "error"
+            message["error"] = str(e)
+            message["unexpected"] = True
+            ok = False
+        results.append(message)
+    return (ok, results)
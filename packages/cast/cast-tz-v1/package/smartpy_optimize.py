@@ -0,0 +1,526 @@
+# Optimization passes over the command trees of contracts, run by
+# smartpy_cli --optimize once the contracts are built and before they are
+# exported. Entry points and the bodies of lambdas (sp.build_lambda, global
+# lambdas) are optimized, each block on its own.
+#
+#   fold  expressions built from literals only (comparisons, and, or, ~,
+#         +, -, * on int and nat) are evaluated, verify of a true
+#         condition are removed, sp.if / sp.else and sp.while on a known
+#         condition are replaced by the branch taken.
+#   cse   map lookups (getItem, possibly under attr) on the storage, the
+#         parameters and locals repeated in a block are computed once into
+#         a generated local cse_<n>, defined just before the first command
+#         using them.
+#
+# Passes run in the order given.
+#
+# A branch is only inlined into its parent block when it does not define
+# locals, which would then outlive it.
+#
+# A lookup is shared by the commands following its definition as long as
+# none of them may write a path it reads; the command writing it is the
+# last one to share it, for the expressions it evaluates before writing.
+# The first command must evaluate the lookup unconditionally (not in a
+# nested block, the right hand side of and / or, a branch of sp.eif, a
+# default value or the message of a failure, see is_conditional), so that
+# no lookup that could fail is added to a path of the original code.
+# When several lookups of that command fail, the error reported may be the
+# one of the hoisted lookup.
+#
+# optimize reports the contracts before and after the passes: the stats of
+# smartpy_stats and the code size, bytes of the export and estimated
+# Michelson instructions (smartpy_costs.code_instructions) by entry point.
+# scripts/benchmarks/optimize.py compares the gas and the behaviour of the
+# optimized contracts with the original ones on the local chain.
+
+import smartpy as sp
+import smartpy_costs
+import smartpy_interpreter
+import smartpy_stats
+
+passNames = ["fold", "cse"]
+
+roots = ["data", "params", "lambdaParams", "getLocal", "iter", "operations"]
+targets = ["set", "delItem", "updateSet"]
+# Commands whose first argument is evaluated several times or not at all.
+loops = ["whileBlock", "set_type"]
+commands = targets + loops + [
+    "defineLocal",
+    "verify",
+    "failwith",
+    "never",
+    "result",
+    "ifBlock",
+    "elseBlock",
+    "forGroup",
+    "match_cons",
+    "ifSomeBlock",
+    "match",
+    "match_cases",
+]
+
+
+def block_of(x):
+    if isinstance(x, sp.TreeBlock):
+        return x
+    if isinstance(x, (sp.CommandBlock, sp.MessageBuilder)):
+        return x.commands
+    return None
+
+
+def is_conditional(f, i):
+    """Whether argument i of f is evaluated only in some cases: the right
+    hand side of and / or, the branches of sp.eif, a default value and the
+    messages of failures (sp.verify, open_some, a lookup with a message)."""
+    return (
+        (f in ["and", "or"] and i == 1)
+        or (f == "eif" and i in [1, 2])
+        or (f in ["getItemDefault", "getItemMessage", "openVariant"] and i == 2)
+    )
+
+
+def is_conditional_command(f, i):
+    return (i == 0 and f in loops) or (f == "verify" and i == 2)
+
+
+def line_of(x):
+    while isinstance(x, sp.Expr):
+        if x._l and smartpy_stats.is_line_no(x._f, x._l, len(x._l) - 1):
+            return x._l[-1]
+        x = x._l[0] if x._l else None
+    return 0
+
+
+def access_path(x):
+    """Path read or written by an access, "*" standing for any key."""
+    if isinstance(x, sp.Local):
+        return ("local", x.name)
+    if isinstance(x, sp.Expr):
+        if x._f == "attr":
+            return access_path(x._l[0]) + (x._l[1],)
+        if x._f == "getItem":
+            return access_path(x._l[0]) + ("*",)
+        if x._f == "getLocal":
+            return ("local", x._l[0])
+        if x._f in ["iter", "lambdaParams"]:
+            return (x._f, x._l[0])
+        if x._f in roots:
+            return (x._f,)
+    return ("*",)
+
+
+def conflict(p, q):
+    return all(a == b or "*" in [a, b] for (a, b) in zip(p, q))
+
+
+def is_access(x):
+    if not isinstance(x, sp.Expr):
+        return False
+    if x._f in roots or x._f == "literal":
+        return True
+    if x._f in ["attr", "pack"]:
+        return is_access(x._l[0])
+    if x._f == "getItem":
+        return is_access(x._l[0]) and is_access(x._l[1])
+    return False
+
+
+def has_lookup(x):
+    return isinstance(x, sp.Expr) and (
+        x._f == "getItem" or any(has_lookup(y) for y in x._l)
+    )
+
+
+def read_paths(x, out):
+    if isinstance(x, sp.Expr):
+        if x._f in ["attr", "getItem"] or x._f in roots:
+            out.append(access_path(x))
+        for y in x._l:
+            read_paths(y, out)
+    return out
+
+
+class CSE:
+    def __init__(self):
+        self.keys = {}
+        self.count = 0
+
+    def key(self, x):
+        """Line independent key of x."""
+        if isinstance(x, sp.Expr):
+            entry = self.keys.get(id(x))
+            if entry is None:
+                entry = (
+                    x,
+                    (x._f,)
+                    + tuple(
+                        self.key(y)
+                        for (i, y) in enumerate(x._l)
+                        if not smartpy_stats.is_line_no(x._f, x._l, i)
+                    ),
+                )
+                self.keys[id(x)] = entry
+            return entry[1]
+        if isinstance(x, (str, int, float, bool)) or x is None:
+            return x
+        if isinstance(x, sp.TType):
+            return x.export()
+        return ("id", id(x))
+
+    def expr_uses(self, x, conditional, out):
+        if isinstance(x, sp.record):
+            for y in x.fields.values():
+                self.expr_uses(y, conditional, out)
+        if not isinstance(x, sp.Expr) or x._f == "lambda":
+            return
+        if x._f in ["attr", "getItem"] and is_access(x) and has_lookup(x):
+            out.append((self.key(x), x, conditional))
+        for (i, y) in enumerate(x._l):
+            self.expr_uses(y, conditional or is_conditional(x._f, i), out)
+
+    def target_uses(self, x, conditional, out):
+        while isinstance(x, sp.Expr) and x._f in ["attr", "getItem"]:
+            if x._f == "getItem":
+                self.expr_uses(x._l[1], conditional, out)
+            x = x._l[0]
+
+    def command_uses(self, command, conditional, out):
+        if command._f not in commands:
+            return out
+        for (i, y) in enumerate(command._l):
+            if isinstance(y, (sp.Expr, sp.record)):
+                if i == 0 and command._f in targets:
+                    self.target_uses(y, conditional, out)
+                else:
+                    self.expr_uses(y, conditional or is_conditional_command(command._f, i), out)
+            elif block_of(y) is not None:
+                for c in block_of(y).commands:
+                    self.command_uses(c, True, out)
+        return out
+
+    def command_writes(self, command, out):
+        if command._f not in commands:
+            out.append(("*",))
+            return out
+        if command._f in targets:
+            out.append(access_path(command._l[0]))
+        elif command._f == "defineLocal":
+            out.append(("local", command._l[0]))
+        elif command._f == "forGroup":
+            out.append(("iter", command._l[0]))
+        for y in command._l:
+            if block_of(y) is not None:
+                for c in block_of(y).commands:
+                    self.command_writes(c, out)
+        return out
+
+    def rewrite_expr(self, x, k, name, conditional, conditionals):
+        if conditional and not conditionals:
+            return x
+        if isinstance(x, sp.record):
+            fields = {
+                f: self.rewrite_expr(y, k, name, conditional, conditionals)
+                for (f, y) in x.fields.items()
+            }
+            if all_same(fields.values(), x.fields.values()):
+                return x
+            return rebuild_record(x, fields)
+        if not isinstance(x, sp.Expr) or x._f == "lambda":
+            return x
+        if x._f in ["attr", "getItem"] and self.key(x) == k:
+            return sp.Expr("getLocal", [name, line_of(x)])
+        l = [
+            self.rewrite_expr(y, k, name, conditional or is_conditional(x._f, i), conditionals)
+            for (i, y) in enumerate(x._l)
+        ]
+        return x if all_same(l, x._l) else sp.Expr(x._f, l)
+
+    def rewrite_target(self, x, k, name, conditional, conditionals):
+        if not isinstance(x, sp.Expr) or x._f not in ["attr", "getItem"]:
+            return x
+        l = list(x._l)
+        l[0] = self.rewrite_target(l[0], k, name, conditional, conditionals)
+        if x._f == "getItem":
+            l[1] = self.rewrite_expr(l[1], k, name, conditional, conditionals)
+        return x if all_same(l, x._l) else sp.Expr(x._f, l)
+
+    def rewrite_command(self, command, k, name, conditional, conditionals):
+        if command._f not in commands:
+            return command
+        l = []
+        for (i, y) in enumerate(command._l):
+            if isinstance(y, (sp.Expr, sp.record)):
+                if i == 0 and command._f in targets:
+                    y = self.rewrite_target(y, k, name, conditional, conditionals)
+                else:
+                    y = self.rewrite_expr(
+                        y, k, name, conditional or is_conditional_command(command._f, i), conditionals
+                    )
+            elif conditionals and block_of(y) is not None:
+                block = block_of(y)
+                block.commands = [
+                    self.rewrite_command(c, k, name, True, conditionals) for c in block.commands
+                ]
+            l.append(y)
+        return command if all_same(l, command._l) else sp.Expr(command._f, l)
+
+    def hoist(self, block):
+        """Hoists one lookup of block, returns whether one was found."""
+        uses = [self.command_uses(c, False, []) for c in block.commands]
+        writes = [self.command_writes(c, []) for c in block.commands]
+        candidates = {}
+        for (i, found) in enumerate(uses):
+            for (k, x, conditional) in found:
+                if not conditional and (k, i) not in candidates:
+                    candidates[(k, i)] = (size(x), i, x)
+        for ((k, _), (_, first, x)) in sorted(candidates.items(), key=lambda c: c[1][:2]):
+            reads = read_paths(x, [])
+            count = 0
+            for last in range(first, len(block.commands)):
+                written = any(conflict(w, r) for w in writes[last] for r in reads)
+                count += len(
+                    [c for (k2, _, c) in uses[last] if k2 == k and not (written and c)]
+                )
+                if written:
+                    break
+            if count < 2:
+                continue
+            name = "cse_%i" % self.count
+            self.count += 1
+            block.commands[first : last + 1] = [
+                self.rewrite_command(c, k, name, False, i < last or not written)
+                for (i, c) in enumerate(block.commands[first : last + 1], first)
+            ]
+            block.commands.insert(first, sp.Expr("defineLocal", [name, x, line_of(x)]))
+            return True
+        return False
+
+    def optimize_block(self, block):
+        while self.hoist(block):
+            pass
+        for command in block.commands:
+            if command._f in commands:
+                for y in command._l:
+                    if block_of(y) is not None:
+                        self.optimize_block(block_of(y))
+
+    def optimize_tree(self, block):
+        self.count = 0
+        self.optimize_block(block)
+
+comparisons = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "lt": lambda a, b: a < b,
+    "le": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b,
+    "ge": lambda a, b: a >= b,
+}
+arithmetic = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+}
+numeric = ["nat", "int", "intOrNat", "mutez"]
+ordered = numeric + ["string", "bool"]
+
+
+def literal_of(x):
+    """(type, value) of a literal, None for other expressions."""
+    if isinstance(x, sp.Expr) and x._f == "literal" and isinstance(x._l[0], sp.Expr):
+        t = x._l[0]._f
+        if t in ordered or t in ["bytes", "address", "key_hash"]:
+            return (t, x._l[0]._l[0])
+    return None
+
+
+def constant(x):
+    """Value of a boolean literal, None otherwise."""
+    value = literal_of(x)
+    return value[1] if value is not None and value[0] == "bool" else None
+
+
+def make_literal(t, v, line):
+    return sp.Expr("literal", [sp.Expr(t, [v]), line])
+
+
+def compatible(t1, t2):
+    return t1 == t2 or (
+        "intOrNat" in [t1, t2] and t1 in ["nat", "int", "intOrNat"] and t2 in ["nat", "int", "intOrNat"]
+    )
+
+
+class Fold:
+    def evaluate(self, x):
+        """Value of x when it can be computed now, None otherwise."""
+        f = x._f
+        line = line_of(x)
+        if f in comparisons:
+            (a, b) = (literal_of(x._l[0]), literal_of(x._l[1]))
+            if a is None or b is None or not compatible(a[0], b[0]):
+                return None
+            if f in ["eq", "neq"] or a[0] in ordered:
+                return make_literal("bool", comparisons[f](a[1], b[1]), line)
+        elif f == "invert":
+            c = constant(x._l[0])
+            if c is not None:
+                return make_literal("bool", not c, line)
+        elif f in ["and", "or"]:
+            # The right hand side is only evaluated when the left one does
+            # not decide.
+            c = constant(x._l[0])
+            if c is not None:
+                return x._l[1] if c == (f == "and") else x._l[0]
+        elif f in arithmetic:
+            (a, b) = (literal_of(x._l[0]), literal_of(x._l[1]))
+            if a is None or b is None or a[0] != b[0] or a[0] not in ["nat", "int", "intOrNat"]:
+                return None
+            if f != "sub":
+                return make_literal(a[0], arithmetic[f](a[1], b[1]), line)
+            if a[0] != "intOrNat":
+                return make_literal("int", a[1] - b[1], line)
+        return None
+
+    def fold_expr(self, x):
+        if isinstance(x, sp.record):
+            fields = {f: self.fold_expr(y) for (f, y) in x.fields.items()}
+            return x if all_same(fields.values(), x.fields.values()) else rebuild_record(x, fields)
+        if not isinstance(x, sp.Expr) or x._f == "lambda":
+            return x
+        l = [self.fold_expr(y) for y in x._l]
+        if not all_same(l, x._l):
+            x = sp.Expr(x._f, l)
+        result = self.evaluate(x)
+        return x if result is None else result
+
+    def fold_command(self, command):
+        l = []
+        for y in command._l:
+            if block_of(y) is not None:
+                self.fold_block(block_of(y))
+            else:
+                y = self.fold_expr(y)
+            l.append(y)
+        return command if all_same(l, command._l) else sp.Expr(command._f, l)
+
+    def fold_block(self, block):
+        folded = [self.fold_command(c) for c in block.commands]
+        result = []
+        i = 0
+        while i < len(folded):
+            command = folded[i]
+            i += 1
+            if command._f == "verify" and constant(command._l[0]) is True:
+                continue
+            if command._f == "whileBlock" and constant(command._l[0]) is False:
+                continue
+            if command._f == "ifBlock" and constant(command._l[0]) is not None:
+                orElse = folded[i] if i < len(folded) and folded[i]._f == "elseBlock" else None
+                if constant(command._l[0]):
+                    taken = block_of(command._l[1])
+                else:
+                    taken = None if orElse is None else block_of(orElse._l[0])
+                if taken is None or not any(c._f == "defineLocal" for c in taken.commands):
+                    if orElse is not None:
+                        i += 1
+                    if taken is not None:
+                        result += taken.commands
+                    continue
+            result.append(command)
+        block.commands = result
+
+    def optimize_tree(self, block):
+        self.fold_block(block)
+
+
+def size(x):
+    return 1 + sum(size(y) for y in x._l) if isinstance(x, sp.Expr) else 0
+
+
+def rebuild_record(x, fields):
+    result = sp.record()
+    result.fields = fields
+    result.lineNo = x.lineNo
+    return result
+
+
+def all_same(l1, l2):
+    return all(x is y for (x, y) in zip(l1, l2))
+
+
+def find_lambdas(x, out, seen):
+    if id(x) in seen:
+        return out
+    seen.add(id(x))
+    if isinstance(x, sp.Expr) and x._f == "lambda":
+        out.append(x)
+    for y in smartpy_stats.children(x):
+        find_lambdas(y, out, seen)
+    return out
+
+
+def optimize_contract(contract, passes, seen):
+    for name in passes:
+        if name not in passNames:
+            raise Exception("Unknown optimization pass %s, expected one of: %s" % (name, " ".join(passNames)))
+    trees = [mb.commands for (_, mb) in sorted(contract.messages.items())]
+    lambdas = []
+    for x in [list(contract.messages.values()), getattr(contract, "global_variables", []), contract.storage]:
+        find_lambdas(x, lambdas, seen)
+    trees += [x._l[3] for x in lambdas]
+    for name in passes:
+        optimizer = Fold() if name == "fold" else CSE()
+        for tree in trees:
+            optimizer.optimize_tree(tree)
+
+
+def code_size(contract):
+    """Bytes of the export of contract and estimated instructions of its
+    entry points and globals."""
+    export = contract.export()
+    parts = smartpy_interpreter.keywords(smartpy_interpreter.parse(export)[0])
+    instructions = {
+        str(message[0]): smartpy_costs.code_instructions(message[2]) for message in parts.get("messages", [])
+    }
+    instructions["globals"] = smartpy_costs.code_instructions(parts.get("globals", []))
+    return {"bytes": len(export), "instructions": instructions}
+
+
+def build_report(targets):
+    report = smartpy_stats.build_report(targets)
+    for target in targets:
+        report["contracts"][target.name]["size"] = code_size(target.contract)
+    return report
+
+
+def optimize(targets, passes):
+    """Optimizes the contracts of targets in place.
+
+    Returns the reports before and after: the stats of
+    smartpy_stats.build_report, with the code size of every contract.
+    """
+    before = build_report(targets)
+    seen = set()
+    for target in targets:
+        if id(target.contract) not in seen:
+            seen.add(id(target.contract))
+            optimize_contract(target.contract, passes, seen)
+    return (before, build_report(targets))
+
+
+def diff_sizes(before, after):
+    """Code sizes that differ: (path, before, after)."""
+    changes = []
+    for (name, contract) in sorted(after["contracts"].items()):
+        (old, new) = (before["contracts"][name]["size"], contract["size"])
+        if old["bytes"] != new["bytes"]:
+            changes.append(("%s bytes" % name, old["bytes"], new["bytes"]))
+        for (item, count) in sorted(new["instructions"].items()):
+            if old["instructions"].get(item) != count:
+                changes.append(("%s.%s instructions" % (name, item), old["instructions"].get(item), count))
+    return changes
+
+
+def print_sizes(changes):
+    for (path, before, after) in changes:
+        print("%-88s%10s ->%10s  %+.1f%%" % (path, before, after, 100.0 * (after - before) / before))
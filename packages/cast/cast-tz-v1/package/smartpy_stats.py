@@ -0,0 +1,233 @@
+# Size and shape of the expression trees of contracts.
+#
+# For every contract, entry point and lambda built in it, the report gives:
+#   nodes            number of Expr nodes (values built with sp.record,
+#                    sp.map, ... count as one node)
+#   depth            maximum nesting of nodes and command blocks
+#   storage_getItem  getItem accesses on a path rooted at the storage
+#   storage_attr     attr accesses on a path rooted at the storage
+#   getItem, attr    all getItem and attr accesses
+#   repeated         subexpressions occurring several times, by the number
+#                    of nodes repeating them would spare
+#
+# Line numbers are ignored when comparing subexpressions.
+#
+# diff_reports compares a report with a baseline, e.g. a report committed
+# next to the contracts, and lists the metrics that grew.
+
+import smartpy as sp
+
+metrics = ["nodes", "depth", "storage_getItem", "storage_attr", "getItem", "attr"]
+accessors = ["attr", "getItem", "getItemDefault", "getItemMessage"]
+lineNoPositions = {"lambda": 2, "lambdaParams": 2}
+
+
+def children(x):
+    if isinstance(x, sp.Expr):
+        return x._l
+    if isinstance(x, sp.TreeBlock):
+        return x.commands
+    if isinstance(x, (list, tuple)):
+        return x
+    if isinstance(x, (sp.CommandBlock, sp.MessageBuilder)):
+        return [x.commands]
+    if isinstance(x, sp.record):
+        return [x.fields[k] for k in sorted(x.fields)]
+    if isinstance(x, sp.mapOrBigMap):
+        return [y for item in x.l.items() for y in item]
+    if isinstance(x, (sp.tuple, sp.build_list, sp.build_set)):
+        return list(x.l)
+    return []
+
+
+def is_line_no(f, l, i):
+    """Whether l[i], among the arguments l of an Expr f, is a line number."""
+    if isinstance(l[i], sp.LazyLineNo):
+        return True
+    if not isinstance(l[i], int) or isinstance(l[i], bool):
+        return False
+    return f == "params" or (1 < len(l) and i == lineNoPositions.get(f, len(l) - 1))
+
+
+def on_storage(x):
+    while isinstance(x, sp.Expr) and x._f in accessors:
+        x = x._l[0]
+    return isinstance(x, sp.Expr) and x._f == "data"
+
+
+class TreeStats:
+    def __init__(self):
+        self.counts = {metric: 0 for metric in metrics}
+        self.keys = {}
+        self.lambdas = []
+
+    def visit(self, x, depth):
+        """Returns the line independent key and the size of x."""
+        isNode = isinstance(x, (sp.Expr, sp.WouldBeValue))
+        if isNode:
+            self.counts["nodes"] += 1
+            self.counts["depth"] = max(self.counts["depth"], depth)
+        elif isinstance(x, (sp.TreeBlock, sp.CommandBlock, sp.MessageBuilder)):
+            self.counts["depth"] = max(self.counts["depth"], depth)
+        if isinstance(x, sp.Expr):
+            if x._f in ["getItem", "attr"]:
+                self.counts[x._f] += 1
+                if on_storage(x._l[0]):
+                    self.counts["storage_" + x._f] += 1
+            if x._f == "lambda":
+                self.lambdas.append(x)
+            subKeys = []
+            size = 1
+            for (i, y) in enumerate(x._l):
+                if is_line_no(x._f, x._l, i):
+                    continue
+                (key, ySize) = self.visit(y, depth + 1)
+                subKeys.append(key)
+                size += ySize
+            key = (x._f,) + tuple(subKeys)
+            if 1 < size:
+                entry = self.keys.setdefault(key, [0, size, x])
+                entry[0] += 1
+            return (key, size)
+        block = isinstance(x, (sp.TreeBlock, sp.CommandBlock, sp.MessageBuilder))
+        ys = children(x)
+        if not ys and not isNode and not block:
+            if isinstance(x, sp.LazyLineNo):
+                return (int(x), 0)
+            if isinstance(x, (str, int, float, bool)) or x is None:
+                return (x, 0)
+            return (x.export() if hasattr(x, "export") else repr(x), 0)
+        subKeys = []
+        size = 1 if isNode else 0
+        for y in ys:
+            (key, ySize) = self.visit(y, depth + (1 if isNode or block else 0))
+            subKeys.append(key)
+            size += ySize
+        return ((x.__class__.__name__,) + tuple(subKeys), size)
+
+    def repeated(self, count):
+        repeats = [
+            {
+                "expression": shorten(sp.export_to_string(x)),
+                "occurrences": occurrences,
+                "nodes": size,
+                "spared": (occurrences - 1) * size,
+            }
+            for (occurrences, size, x) in self.keys.values()
+            if 1 < occurrences and x._f != "literal"
+        ]
+        repeats.sort(key=lambda r: (-r["spared"], r["expression"]))
+        return repeats[:count]
+
+
+def shorten(s, length=160):
+    return s if len(s) <= length else s[: length - 3] + "..."
+
+
+def tree_stats(x, repeated=10):
+    stats = TreeStats()
+    stats.visit(x, 0)
+    result = dict(stats.counts)
+    result["repeated"] = stats.repeated(repeated)
+    return (result, stats.lambdas)
+
+
+def lambda_stats(lambdas, repeated):
+    result = {}
+    for x in lambdas:
+        name = sp.lambdaNames.get(x._l[0], "lambda %s" % x._l[0])
+        (stats, _) = tree_stats(x, repeated)
+        while name in result:
+            name += "'"
+        result[name] = stats
+    return result
+
+
+def contract_stats(contract, repeated=10):
+    entryPoints = {}
+    lambdas = []
+    total = {metric: 0 for metric in metrics}
+    for (name, mb) in sorted(contract.messages.items()):
+        (stats, found) = tree_stats(mb, repeated)
+        entryPoints[name] = stats
+        lambdas += found
+    for (name, variable) in getattr(contract, "global_variables", []):
+        (_, found) = tree_stats(variable, repeated)
+        lambdas += found
+    for stats in entryPoints.values():
+        for metric in metrics:
+            total[metric] = (
+                max(total[metric], stats[metric])
+                if metric == "depth"
+                else total[metric] + stats[metric]
+            )
+    return {
+        "class": contract.__class__.__name__,
+        "total": total,
+        "entry_points": entryPoints,
+        "lambdas": lambda_stats(lambdas, repeated),
+    }
+
+
+def build_report(targets, repeated=10):
+    """Report on the compilation targets (window.pythonCompilationTargets)."""
+    return {
+        "contracts": {
+            target.name: contract_stats(target.contract, repeated) for target in targets
+        }
+    }
+
+
+def diff_reports(baseline, report, threshold=0.0):
+    """Metrics that differ from the baseline.
+
+    Returns (changes, regressions): regressions are the changes growing by
+    more than threshold percent.
+    """
+    changes = []
+
+    def compare(path, before, after):
+        for metric in metrics:
+            b = before.get(metric, 0)
+            a = after.get(metric, 0)
+            if a != b:
+                changes.append(
+                    {
+                        "path": path,
+                        "metric": metric,
+                        "baseline": b,
+                        "current": a,
+                        "percent": 100.0 * (a - b) / b if b else None,
+                    }
+                )
+
+    for (name, contract) in sorted(report["contracts"].items()):
+        old = baseline.get("contracts", {}).get(name)
+        if old is None:
+            continue
+        compare(name, old["total"], contract["total"])
+        for group in ["entry_points", "lambdas"]:
+            for (item, stats) in sorted(contract[group].items()):
+                if item in old[group]:
+                    compare("%s.%s" % (name, item), old[group][item], stats)
+    regressions = [
+        change
+        for change in changes
+        if change["current"] > change["baseline"]
+        and (change["percent"] is None or change["percent"] > threshold)
+    ]
+    return (changes, regressions)
+
+
+def print_diff(changes):
+    for change in changes:
+        print(
+            "%-70s%18s%10s ->%10s  %s"
+            % (
+                change["path"],
+                change["metric"],
+                change["baseline"],
+                change["current"],
+                "" if change["percent"] is None else "%+.1f%%" % change["percent"],
+            )
+        )
@@ -76,6 +76,76 @@ def add_test(name, shortname=None, profile=False, is_default=True):
     return r
 
 
+class CompilationTarget:
+    def __init__(self, name, contract, storage):
+        self.name = name
+        self.contract = contract
+        self.storage = storage
+
+
+window.pythonCompilationTargets = []
+
+
+def add_compilation_target(name, contract, storage=None):
+    for x in name:
+        if not (x in "_-" or x.isalnum()):
+            raise Exception(
+                "Bad compilation target name: '%s', '%s' is forbidden" % (name, x)
+            )
+    window.pythonCompilationTargets.append(CompilationTarget(name, contract, storage))
+
+
+# Files read through sp.io.import_script_from_file, used by smartpy_cache.
+window.pythonDependencies = []
+# Scripts imported by sp.io.import_script_from_file, by (path, name, hash)
+# and the state they were imported in, as smartpy.ImportedScript.
+window.pythonModules = {}
+# Modules of the scripts imported in the current build, by (path, name, hash).
+window.pythonImported = {}
+# Paths imported by each script, the top level script being None.
+window.pythonImportGraph = {}
+window.pythonImportStack = []
+
+
+def import_graph(root):
+    """Import graph of the current build with paths relative to the current
+    directory, root naming the top level script."""
+    import os
+
+    def relative(path):
+        return root if path is None else os.path.relpath(path)
+
+    return {
+        relative(importer): [relative(path) for path in imports]
+        for (importer, imports) in window.pythonImportGraph.items()
+    }
+
+
+def reset(keepModules=False):
+    """Forgets the state left by previous scripts in this interpreter.
+
+    With keepModules, the scripts imported by sp.io.import_script_from_file
+    stay cached, they are checked against their files when imported again.
+    """
+    import smartpy
+
+    window.activeScenario = None
+    window.contracts = {}
+    window.contractNextId = 0
+    window.lambdaNextId = 0
+    window.pythonTests.clear()
+    window.pythonCompilationTargets = []
+    window.pythonDependencies = []
+    if not keepModules:
+        window.pythonModules = {}
+    window.pythonImported = {}
+    window.pythonImportGraph = {}
+    window.pythonImportStack = []
+    smartpy.defaultVerifyMessage = None
+    smartpy.sp.types.unknownIds = 0
+    smartpy.sp.types.seqCounter = 0
+
+
 import traceback
 
 context = globals().copy()
@@ -191,7 +261,160 @@ def syntaxChanges():
     return changes
 
 
-def adaptBlocks(code):
+# sp.for, sp.if, sp.while and sp.else blocks are not Python: adaptBlocks
+# rewrites their headers into with statements (sp.if x: becomes
+# with sp.if_(x):). Headers are found with the Python tokenizer, so strings,
+# comments and bracketed continuation lines are left alone, and they keep
+# their line numbers. Adapted scripts are cached by hash of their source, in
+# memory and, after set_adapt_cache, on disk.
+
+import hashlib
+import io
+import os
+import tokenize
+
+adaptVersion = "tokens-1"
+adaptCacheDirectory = None
+adaptedScripts = {}
+# Line maps by script name, None being the script of the editor.
+lineMaps = {}
+
+
+class LineMap:
+    """Adapted line -> source line of a script. Adapted headers keep their
+    lines, so this is the identity on the lines of the script."""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def get(self, lineId, default=None):
+        if str(lineId).isdigit() and 1 <= int(lineId) <= self.lines:
+            return str(lineId)
+        return default
+
+
+def set_adapt_cache(directory):
+    global adaptCacheDirectory
+    adaptCacheDirectory = directory
+
+
+def adaptBlocks(code, name=None):
+    global reverseLines
+    key = hashlib.sha256((adaptVersion + "\0" + code).encode("utf8")).hexdigest()
+    result = adaptedScripts.get(key)
+    if result is None and adaptCacheDirectory is not None:
+        try:
+            with open(os.path.join(adaptCacheDirectory, key + ".py"), "r", newline="") as f:
+                result = f.read()
+        except OSError:
+            pass
+    if result is None:
+        try:
+            result = adaptBlocksTokens(code)
+        except (tokenize.TokenError, SyntaxError):
+            result = adaptBlocksLines(code)
+        if adaptCacheDirectory is not None:
+            os.makedirs(adaptCacheDirectory, exist_ok=True)
+            path = os.path.join(adaptCacheDirectory, key + ".py")
+            with open(path + ".%i" % os.getpid(), "w", newline="") as f:
+                f.write(result)
+            os.replace(path + ".%i" % os.getpid(), path)
+    adaptedScripts[key] = result
+    lineMaps[name] = LineMap(result.count("\n") + 1)
+    if name is None:
+        reverseLines = lineMaps[name]
+    return result
+
+
+def adaptBlocksTokens(code):
+    if not any(("sp." + keyword) in code for keyword in ["for", "if", "while", "else"]):
+        return code + "\n"
+    lineStarts = [0]
+    for line in code.split("\n"):
+        lineStarts.append(lineStarts[-1] + len(line) + 1)
+
+    def offset(position):
+        return lineStarts[position[0] - 1] + position[1]
+
+    tokens = [
+        token
+        for token in tokenize.generate_tokens(io.StringIO(code).readline)
+        if token.type not in [tokenize.NL, tokenize.COMMENT]
+    ]
+    replacements = []
+    startOfLine = True
+    for (i, token) in enumerate(tokens):
+        if startOfLine and token.type == tokenize.NAME and token.string == "sp":
+            replacement = adaptHeader(code, tokens, i, offset)
+            if replacement is not None:
+                replacements.append(replacement)
+        startOfLine = token.type in [
+            tokenize.NEWLINE,
+            tokenize.INDENT,
+            tokenize.DEDENT,
+        ]
+    result = []
+    last = 0
+    for (start, end, text) in replacements:
+        result.append(code[last:start])
+        result.append(text)
+        last = end
+    result.append(code[last:])
+    return "".join(result) + "\n"
+
+
+def adaptHeader(code, tokens, i, offset):
+    """Rewrites the block header starting with the token tokens[i] ('sp'),
+    returns (start, end, replacement) or None if it is not a header."""
+    if not (
+        i + 2 < len(tokens)
+        and tokens[i + 1].string == "."
+        and tokens[i + 2].string in ["for", "if", "while", "else"]
+    ):
+        return None
+    keyword = tokens[i + 2]
+    depth = 0
+    colon = None
+    j = i + 3
+    while j < len(tokens) and tokens[j].type not in [tokenize.NEWLINE, tokenize.ENDMARKER]:
+        if tokens[j].string in ["(", "[", "{"]:
+            depth += 1
+        elif tokens[j].string in [")", "]", "}"]:
+            depth -= 1
+        elif tokens[j].string == ":" and depth == 0:
+            colon = j
+        j += 1
+    if colon is None or colon != j - 1:
+        return None
+    start = offset(tokens[i].start)
+    end = offset(tokens[colon].end)
+
+    def text(fromToken):
+        s = code[offset(fromToken.end) : offset(tokens[colon].start)]
+        return s[1:] if s.startswith(" ") else s
+
+    if keyword.string == "else":
+        if colon != i + 3:
+            return None
+        return (start, end, "with sp.else_():")
+    if keyword.string == "for":
+        if not (
+            tokens[i + 3].type == tokenize.NAME and tokens[i + 4].string == "in"
+        ):
+            return None
+        variable = tokens[i + 3].string
+        return (
+            start,
+            end,
+            "with sp.for_('%s', %s) as %s:" % (variable, text(tokens[i + 4]), variable),
+        )
+    if colon == i + 3:
+        return None
+    return (start, end, "with sp.%s_(%s):" % (keyword.string, text(keyword)))
+
+
+def adaptBlocksLines(code):
+    """Line based adaptBlocks, used for scripts the tokenizer rejects."""
     lines = code.split("\n") + [""]
 
     def indent(line):
@@ -245,12 +468,7 @@ def adaptBlocks(code):
         if initialLine.endswith("\r") and not line.endswith("\r"):
             line += "\r"
         newLines.append(NewLine(lineId, line))
-    result = "\n".join(line.line for line in newLines)
-    global reverseLines
-    reverseLines.clear()
-    for i in range(len(newLines)):
-        reverseLines[str(i + 1)] = str(newLines[i].pos)
-    return result
+    return "\n".join(line.line for line in newLines)
 
 
 testTemplate = """
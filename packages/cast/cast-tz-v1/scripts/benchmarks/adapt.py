@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Times smartpyio.adaptBlocks on the largest scripts of src/.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/adapt.py
+#   python3 scripts/benchmarks/adapt.py --count 5 --repeat 200
+#
+# Columns: the former line based adapter, the tokenizer based one, a hit in
+# the in-memory cache and a hit in the on-disk cache (a new process reading
+# the adapted script back).
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpyio
+
+
+def largest_scripts(count):
+    paths = glob.glob(os.path.join("src", "**", "*.py"), recursive=True)
+    return sorted(paths, key=os.path.getsize, reverse=True)[:count]
+
+
+def timed(f, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat
+
+
+def measure(path, repeat, directory):
+    code = open(path, "r").read()
+
+    def memory():
+        smartpyio.adaptBlocks(code, path)
+
+    def disk():
+        smartpyio.adaptedScripts.clear()
+        smartpyio.adaptBlocks(code, path)
+
+    smartpyio.set_adapt_cache(directory)
+    smartpyio.adaptBlocks(code, path)
+    result = {
+        "lines": timed(lambda: smartpyio.adaptBlocksLines(code), repeat),
+        "tokens": timed(lambda: smartpyio.adaptBlocksTokens(code), repeat),
+        "memory": timed(memory, repeat),
+        "disk": timed(disk, repeat),
+    }
+    smartpyio.set_adapt_cache(None)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="adaptBlocks benchmark")
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    columns = ["lines", "tokens", "memory", "disk"]
+    header = "%-60s%10s" % ("script", "size") + "".join("%12s" % c for c in columns)
+    print(header)
+    print("-" * len(header))
+    with tempfile.TemporaryDirectory() as directory:
+        for path in largest_scripts(args.count):
+            r = measure(path, args.repeat, directory)
+            print(
+                "%-60s%9.1fk" % (path, os.path.getsize(path) / 1000)
+                + "".join("%10.1fus" % (r[c] * 1e6) for c in columns)
+            )
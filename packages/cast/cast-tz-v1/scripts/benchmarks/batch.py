@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Gas and storage burn per subscription of the batch entry points of
+# ForgeBond (initiateSubscriptions, confirmPaymentsReceived and
+# confirmPaymentsTransferred) against one operation per ticket, from the
+# cost model of smartpy_costs.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/batch.py
+#   python3 scripts/benchmarks/batch.py --sizes 10 100 500 1000 --json batch.json
+#
+# For every batch size B in --sizes, B subscriptions are settled on a new
+# ForgeBond one operation at a time, then on another one with one batch per
+# step. Gas, in the relative units of smartpy_costs, counts the event sink
+# calls the operations emit. Settlements per block is how many subscriptions
+# the hard gas limit of a block lets settle, each step of a batch being one
+# operation. A batch whose gas goes beyond the hard gas limit of an
+# operation is marked as such. The cost model not being calibrated, both
+# only give orders of magnitude.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpy_costs as costs
+import smartpy_interpreter as interpreter
+
+spec = importlib.util.spec_from_file_location(
+    "platform_benchmark", os.path.join(os.path.dirname(os.path.abspath(__file__)), "platform.py")
+)
+benchmark = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(benchmark)
+
+
+def subscription(context, txId):
+    return interpreter.Record(
+        {
+            "txId": txId,
+            "operationId": txId,
+            "deliverySenderAccountNumber": context["REGISTRAR"],
+            "deliveryReceiverAccountNumber": context["INVESTOR"],
+            "deliveryQuantity": 1,
+            "txHash": "0x%x" % txId,
+        }
+    )
+
+
+# Step, sender, entry point and parameter for one ticket, batch entry point
+# and parameter for a list of tickets.
+steps = [
+    (
+        "initiate",
+        "REGISTRAR",
+        "initiateSubscription",
+        subscription,
+        "initiateSubscriptions",
+        lambda context, txIds: [subscription(context, txId) for txId in txIds],
+    ),
+    (
+        "received",
+        "SETTLER",
+        "confirmPaymentReceived",
+        lambda context, txId: interpreter.Record({"txId": txId}),
+        "confirmPaymentsReceived",
+        lambda context, txIds: interpreter.Record({"txIds": txIds, "bestEffort": False}),
+    ),
+    (
+        "transferred",
+        "SETTLER",
+        "confirmPaymentTransferred",
+        lambda context, txId: interpreter.Record({"txId": txId}),
+        "confirmPaymentsTransferred",
+        lambda context, txIds: interpreter.Record({"txIds": txIds, "bestEffort": False}),
+    ),
+]
+
+
+def totals(receipts):
+    return {
+        "operations": len(receipts),
+        "gas": sum(r.gas for r in receipts),
+        "burn": sum(r.burn for r in receipts),
+    }
+
+
+def measure(chain, context, size, index):
+    (single, _) = benchmark.create(chain, context, "bond", 2 * index)
+    (batched, _) = benchmark.create(chain, context, "bond", 2 * index + 1)
+    txIds = list(range(size))
+    result = {"size": size, "steps": {}}
+    for (step, sender, entry_point, params, batch_entry_point, batch_params) in steps:
+        receipts = []
+        for txId in txIds:
+            chain.transfer(context[sender], single, entry_point, params(context, txId))
+            receipts.extend(chain.last_receipts)
+        chain.transfer(context[sender], batched, batch_entry_point, batch_params(context, txIds))
+        result["steps"][step] = {"single": totals(receipts), "batch": totals(chain.last_receipts)}
+    return result
+
+
+def run(args):
+    plan = json.load(open(args.plan))
+    exports = {step["path"]: benchmark.build_export(step["path"]) for step in plan if step["action"] == "originate"}
+    chain = costs.MeteredChain()
+    context = {
+        name: interpreter.make_address("tz1", name)
+        for name in ["ADMIN", "REGISTRAR", "SETTLER", "INVESTOR"]
+    }
+    interpreter.apply_plan(chain, plan, context, exports.get)
+    return [measure(chain, context, size, i) for (i, size) in enumerate(args.sizes)]
+
+
+def per_block(size, gas):
+    """Subscriptions settled in a block by operations settling size of them
+    for gas."""
+    return size * (costs.table["hard_gas_limit_per_block"] // gas)
+
+
+def report(results):
+    header = "%8s%-14s%14s%14s%10s%14s%14s%12s%12s" % (
+        "B", "  step", "units/single", "units/batched", "saved", "ops single", "ops batch", "burn/single", "burn/batch"
+    )
+    print(header)
+    print("-" * len(header))
+    limit = costs.table["hard_gas_limit_per_operation"]
+    for r in results:
+        size = r["size"]
+        for (step, _, _, _, _, _) in steps:
+            (single, batch) = (r["steps"][step]["single"], r["steps"][step]["batch"])
+            print(
+                "%8i%-14s%14.0f%14.0f%9.1f%%%14i%14i%12.0f%12.0f%s"
+                % (
+                    size,
+                    "  " + step,
+                    single["gas"] / size,
+                    batch["gas"] / size,
+                    100.0 * (single["gas"] - batch["gas"]) / single["gas"],
+                    single["operations"],
+                    batch["operations"],
+                    single["burn"] / size,
+                    batch["burn"] / size,
+                    "  over the gas limit of an operation" if batch["gas"] > limit else "",
+                )
+            )
+        single = sum(r["steps"][step]["single"]["gas"] for step in r["steps"])
+        batch = sum(r["steps"][step]["batch"]["gas"] for step in r["steps"])
+        print(
+            "%8i%-14s%14.0f%14.0f%9.1f%%   settlements per block: %i single, %i batched"
+            % (
+                size,
+                "  settlement",
+                single / size,
+                batch / size,
+                100.0 * (single - batch) / single,
+                per_block(1, single // size),
+                per_block(size, batch),
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch settlement benchmark")
+    parser.add_argument("--plan", nargs="?", default="origination.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500], help="batch sizes B")
+    parser.add_argument("--json", nargs="?")
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+    if args.json is not None:
+        open(args.json, "w").write(json.dumps(results, indent=2))
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# Builds every contract matched by smpconfig.json with the vendored SmartPy
+# package and reports how long each one takes.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/build.py
+#   python3 scripts/benchmarks/build.py --line_no inspect eager lazy off
+#   python3 scripts/benchmarks/build.py --line_no eager --memory
+#
+# With --memory, exports are traced twice: once built as a single string
+# (Contract.export) and once streamed to /dev/null (Contract.export_to).
+# It also reports the number of Expr nodes alive after the build, their
+# average footprint and the peak RSS of the build.
+#
+# Each contract is built in its own interpreter so that timings do not depend
+# on the build order. The "inspect" line number mode reproduces the former
+# inspect.stack() based get_line_no and serves as a reference.
+
+import argparse
+import gc
+import glob
+import inspect
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+
+def inspect_get_line_no():
+    for x in inspect.stack():
+        if x.filename == "SmartPy Script":
+            return x.lineno
+    return -1
+
+
+def contract_paths():
+    config = json.load(open(os.path.join(root, "smpconfig.json")))
+    return sorted(
+        glob.glob(os.path.join(config["srcDir"], config["pattern"]), recursive=True)
+    )
+
+
+def node_size(node):
+    """Size of an Expr with its own side tables, not counting child nodes."""
+    size = sys.getsizeof(node) + sys.getsizeof(object.__getattribute__(node, "_l"))
+    try:
+        fields = object.__getattribute__(node, "__dict__")
+        size += sys.getsizeof(fields)
+    except AttributeError:
+        # Slotted nodes allocate their side tables on first use.
+        fields = {
+            name: object.__getattribute__(node, "_" + name)
+            for name in ["onUpdateHandlers", "attributes", "opens"]
+        }
+    for name in ["onUpdateHandlers", "attributes", "opens"]:
+        if fields.get(name) is not None:
+            size += sys.getsizeof(fields[name])
+    return size
+
+
+def expr_nodes():
+    import smartpy as sp
+
+    gc.collect()
+    return [x for x in gc.get_objects() if isinstance(x, sp.Expr)]
+
+
+def build_one(path, line_no, memory, sink):
+    import smartpy as sp
+    from browser import window
+
+    if line_no == "inspect":
+        sp.get_line_no = inspect_get_line_no
+    else:
+        sp.set_line_no_mode(line_no)
+    window.pythonCompilationTargets = []
+    code = open(path, "r").read()
+    start = time.perf_counter()
+    sp.io.import_script_from_script(path, code)
+    built = time.perf_counter()
+    contracts = [target.contract for target in window.pythonCompilationTargets]
+    nodes = expr_nodes() if memory else []
+    nodesSize = sum(node_size(node) for node in nodes)
+    if memory:
+        tracemalloc.start()
+    size = 0
+    for contract in contracts:
+        if sink == "stream":
+            with open(os.devnull, "w") as out:
+                contract.export_to(out)
+                size += out.tell()
+        else:
+            size += len(contract.export())
+    exported = time.perf_counter()
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    for contract in contracts:
+        contract.export()
+    exportedAgain = time.perf_counter()
+    return {
+        "path": path,
+        "line_no": line_no,
+        "targets": [target.name for target in window.pythonCompilationTargets],
+        "build": built - start,
+        "export": exported - built,
+        "export_again": exportedAgain - exported,
+        "export_peak": peak,
+        "sink": sink,
+        "nodes": len(nodes),
+        "node_bytes": nodesSize / len(nodes) if nodes else None,
+        "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "size": size,
+    }
+
+
+def run_one(path, line_no, memory=False, sink="string"):
+    command = [sys.executable, __file__, "--one", path, "--line_no", line_no, "--sink", sink]
+    if memory:
+        command.append("--memory")
+    output = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output)
+
+
+def report(results, modes):
+    header = "%-70s" % "contract" + "".join("%12s" % mode for mode in modes)
+    print(header)
+    print("-" * len(header))
+    byPath = {}
+    for r in results:
+        byPath.setdefault(r["path"], {})[r["line_no"]] = r
+    totals = {mode: 0.0 for mode in modes}
+    for (path, runs) in sorted(byPath.items()):
+        row = "%-70s" % path
+        for mode in modes:
+            t = runs[mode]["build"] + runs[mode]["export"]
+            totals[mode] += t
+            row += "%11.3fs" % t
+        print(row)
+    print("-" * len(header))
+    print("%-70s" % "total" + "".join("%11.3fs" % totals[mode] for mode in modes))
+    reference = totals[modes[0]]
+    if 1 < len(modes) and reference:
+        print(
+            "%-70s" % ("speed-up vs %s" % modes[0])
+            + "".join("%11.1fx" % (reference / totals[mode]) for mode in modes)
+        )
+
+
+def report_export(results):
+    header = "%-70s%12s%12s%12s%14s%14s" % (
+        "contract", "size", "export", "again", "peak string", "peak stream"
+    )
+    print(header)
+    print("-" * len(header))
+    bySink = {}
+    for r in results:
+        bySink.setdefault(r["path"], {})[r["sink"]] = r
+    for (path, runs) in sorted(bySink.items()):
+        r = runs["string"]
+        print(
+            "%-70s%11.1fk%11.3fs%11.3fs%13.1fk%13.1fk"
+            % (
+                path,
+                r["size"] / 1000,
+                r["export"],
+                r["export_again"],
+                r["export_peak"] / 1000,
+                runs["stream"]["export_peak"] / 1000,
+            )
+        )
+
+
+def report_memory(results):
+    header = "%-70s%12s%12s%12s" % ("contract", "nodes", "bytes/node", "max rss")
+    print(header)
+    print("-" * len(header))
+    for r in sorted(results, key=lambda r: r["path"]):
+        if r["sink"] != "string":
+            continue
+        print(
+            "%-70s%12i%12.0f%11.1fM"
+            % (r["path"], r["nodes"], r["node_bytes"] or 0, r["maxrss"] / 1024)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartPy build benchmark")
+    parser.add_argument("--line_no", nargs="+", default=["inspect", "eager", "lazy", "off"])
+    parser.add_argument("--one", nargs="?")
+    parser.add_argument("--memory", action="store_true", help="trace export memory")
+    parser.add_argument("--sink", nargs="?", default="string", help="string or stream")
+    parser.add_argument("--json", nargs="?")
+    args = parser.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(build_one(args.one, args.line_no[0], args.memory, args.sink)))
+        sys.exit(0)
+
+    results = []
+    for path in contract_paths():
+        for mode in args.line_no:
+            results.append(run_one(path, mode))
+    report(results, args.line_no)
+    if args.memory:
+        exports = [
+            run_one(path, args.line_no[0], True, sink)
+            for path in contract_paths()
+            for sink in ["string", "stream"]
+        ]
+        print()
+        report_export(exports)
+        print()
+        report_memory(exports)
+        results += exports
+    if args.json is not None:
+        open(args.json, "w").write(json.dumps(results, indent=2))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Estimated gas and storage burn of the entry points of the platform, from
+# the cost model of smartpy_costs on the local chain.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/costs.py
+#   python3 scripts/benchmarks/costs.py --operations --json costs.json
+#
+# origination.json is applied, then every entry point of ForgeBond,
+# ForgeEmtn, the factories and ForgeInstrumentRegistry is called at least
+# once. The summary gives, by contract and entry point, internal operations
+# included, the mean gas (in relative units, the cost model is not
+# calibrated against a node), executed instructions, paid bytes and burn (in
+# mutez). --operations also prints the operations of every call.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpy_costs as costs
+import smartpy_interpreter as interpreter
+
+# platform.py would shadow the standard module of the same name.
+spec = importlib.util.spec_from_file_location(
+    "platform_benchmark", os.path.join(os.path.dirname(os.path.abspath(__file__)), "platform.py")
+)
+benchmark = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(benchmark)
+
+
+def subscription(context, txId):
+    return interpreter.Record(
+        {
+            "txId": txId,
+            "operationId": txId,
+            "deliverySenderAccountNumber": context["REGISTRAR"],
+            "deliveryReceiverAccountNumber": context["INVESTOR"],
+            "deliveryQuantity": 1,
+            "txHash": "0x%x" % txId,
+        }
+    )
+
+
+def run(args, chain=None, passes=None):
+    """Runs the calls on chain (a new MeteredChain by default) with the
+    contracts optimized by passes if given."""
+    plan = json.load(open(args.plan))
+    exports = {
+        step["path"]: benchmark.build_export(step["path"], passes) for step in plan if step["action"] == "originate"
+    }
+    chain = costs.MeteredChain() if chain is None else chain
+    context = {
+        name: interpreter.make_address("tz1", name)
+        for name in ["ADMIN", "REGISTRAR", "SETTLER", "INVESTOR", "OPERATOR"]
+    }
+    calls = []
+
+    def call(sender, destination, entry_point, params):
+        chain.transfer(context[sender], destination, entry_point, params)
+        calls.append(
+            {
+                "call": "%s.%s" % (chain.name(destination), entry_point),
+                "operations": [receipt.to_json(chain.names) for receipt in chain.last_receipts],
+            }
+        )
+        if args.operations:
+            print("%s by %s" % (calls[-1]["call"], sender))
+            costs.print_receipts(chain, chain.last_receipts)
+
+    interpreter.apply_plan(chain, plan, context, exports.get)
+    chain.names = {address: name for (name, address) in context.items()}
+    for (kind, name) in [("bond", "ForgeBond"), ("emtn", "ForgeEmtn")]:
+        instruments = []
+        for i in range(args.instruments):
+            (factory, entry_point, params) = benchmark.kinds[kind]
+            call("REGISTRAR", context[factory], entry_point, params(context, "%s%06i" % (kind, i)))
+            (address,) = [r.destination for r in chain.last_receipts if r.kind == "originate"]
+            chain.names[address] = name
+            instruments.append(address)
+        for instrument in instruments:
+            for txId in range(args.settlements):
+                call("REGISTRAR", instrument, "initiateSubscription", subscription(context, txId))
+                call("SETTLER", instrument, "confirmPaymentReceived", interpreter.Record({"txId": txId}))
+                call("SETTLER", instrument, "confirmPaymentTransferred", interpreter.Record({"txId": txId}))
+            call(
+                "REGISTRAR",
+                instrument,
+                "initiateSubscriptions",
+                [subscription(context, txId) for txId in range(args.settlements, 2 * args.settlements)],
+            )
+            for entry_point in ["confirmPaymentsReceived", "confirmPaymentsTransferred"]:
+                call(
+                    "SETTLER",
+                    instrument,
+                    entry_point,
+                    interpreter.Record(
+                        {"txIds": list(range(args.settlements, 2 * args.settlements)), "bestEffort": False}
+                    ),
+                )
+        # settleDvP needs a registrar that is also the settler.
+        (factory, entry_point, params) = benchmark.kinds[kind]
+        call(
+            "REGISTRAR",
+            context[factory],
+            entry_point,
+            params(dict(context, SETTLER=context["REGISTRAR"]), "%sdvp" % kind),
+        )
+        (address,) = [r.destination for r in chain.last_receipts if r.kind == "originate"]
+        chain.names[address] = name
+        for txId in range(args.settlements):
+            call("REGISTRAR", address, "settleDvP", subscription(context, txId))
+        instrument = instruments[0]
+        for entry_point in ["callAuthorizeOperator", "callRevokeOperatorAuthorization"]:
+            call(
+                "REGISTRAR",
+                instrument,
+                "run",
+                interpreter.Record(
+                    {"entrypointName": entry_point, "_operator": context["SETTLER"], "_operatorRole": 2}
+                ),
+            )
+        call("REGISTRAR", instrument, "upgrade", chain.accounts[instrument].storage.fields["entrypointsBigMap"])
+    # The registrar lists and unlists an instrument itself, as the
+    # registry tests do.
+    call(
+        "REGISTRAR",
+        context["REGISTRY"],
+        "authorizeFactory",
+        interpreter.Record({"factoryType": "Registrar", "factoryAddress": context["REGISTRAR"]}),
+    )
+    call(
+        "REGISTRAR",
+        context["REGISTRY"],
+        "listInstrument",
+        interpreter.Record({"name": "listed", "isin": "LISTED", "address": context["OPERATOR"]}),
+    )
+    call("REGISTRAR", context["REGISTRY"], "unlistInstrument", "LISTED")
+    call("REGISTRAR", context["REGISTRY"], "unAuthorizeFactory", context["REGISTRAR"])
+    return (chain, calls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gas and storage burn estimates")
+    parser.add_argument("--plan", nargs="?", default="origination.json")
+    parser.add_argument("--instruments", type=int, default=2, help="instruments created by each factory")
+    parser.add_argument("--settlements", type=int, default=2, help="subscriptions settled on each instrument")
+    parser.add_argument("--operations", action="store_true", help="print the operations of every call")
+    parser.add_argument("--json", nargs="?")
+    args = parser.parse_args()
+
+    (chain, calls) = run(args)
+    summary = costs.summary(chain)
+    if args.operations:
+        print()
+    costs.print_summary(summary)
+    if args.json is not None:
+        open(args.json, "w").write(
+            json.dumps({"table": costs.table, "summary": summary, "calls": calls}, indent=2)
+        )
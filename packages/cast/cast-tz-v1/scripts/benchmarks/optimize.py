@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Gas, code size and behaviour of the contracts optimized by smartpy_cli
+# --optimize, against the original ones, on the local chain.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/optimize.py
+#   python3 scripts/benchmarks/optimize.py --passes fold --json optimize.json
+#
+# The calls of costs.py are run twice, on the original contracts and on the
+# optimized ones, followed by calls expected to fail. The runs must give
+# the same storages, the same operations with the same parameters and the
+# same failures; lambdas are compared by the order they are met in, their
+# code and ids differing. The
+# summary gives by contract and entry point the mean gas (in relative
+# units, see costs.py) and by contract the estimated code instructions,
+# before and after. Exits with 1 when the runs differ.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpy_costs as costs
+import smartpy_interpreter as interpreter
+
+spec = importlib.util.spec_from_file_location(
+    "costs_benchmark", os.path.join(os.path.dirname(os.path.abspath(__file__)), "costs.py")
+)
+benchmark = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(benchmark)
+
+
+def normalize(v, ids):
+    """v with its lambdas, packed ones included, numbered in the order
+    they are met in ids: the ids given by the builds differ."""
+    if isinstance(v, interpreter.Closure):
+        return ("lambda", ids.setdefault(v.id, len(ids)))
+    if isinstance(v, bytes):
+        unpacked = interpreter.unpack(v)
+        return v if unpacked.name == "None" else ("packed", normalize(unpacked.value, ids))
+    if isinstance(v, interpreter.Record):
+        return tuple((k, normalize(x, ids)) for (k, x) in sorted(v.fields.items()))
+    if isinstance(v, interpreter.Variant):
+        return (v.name, normalize(v.value, ids))
+    if isinstance(v, dict):
+        return (v.__class__.__name__,) + tuple((repr(k), normalize(x, ids)) for (k, x) in sorted(v.items()))
+    if isinstance(v, (list, tuple)):
+        return tuple(normalize(x, ids) for x in v)
+    if isinstance(v, (set, frozenset)):
+        return tuple(sorted(normalize(x, ids) for x in v))
+    if isinstance(v, interpreter.Operation):
+        return (
+            v.kind,
+            normalize(v.parameter, ids),
+            v.amount,
+            repr(v.destination),
+            v.address,
+            normalize(v.storage, ids),
+        )
+    return v
+
+
+class TracedChain(costs.MeteredChain):
+    """A MeteredChain keeping the operations applied by every call."""
+
+    def __init__(self, *args, **kargs):
+        costs.MeteredChain.__init__(self, *args, **kargs)
+        self.trace = []
+        self.ids = {}
+
+    def transfer(self, sender, destination, entry_point, params, amount=0):
+        try:
+            applied = costs.MeteredChain.transfer(self, sender, destination, entry_point, params, amount)
+        except interpreter.Failure as e:
+            self.trace.append((entry_point, "failed", normalize(e.value, self.ids)))
+            raise
+        self.trace.append((entry_point, tuple((sender, normalize(op, self.ids)) for (sender, op) in applied)))
+        return applied
+
+
+def failing_calls(chain):
+    """Calls the instruments expected to fail."""
+    addresses = {name: address for (address, name) in chain.names.items()}
+    for name in ["ForgeBond", "ForgeEmtn"]:
+        instrument = addresses[name]
+        for (sender, entry_point, params) in [
+            ("SETTLER", "initiateSubscription", benchmark.subscription(addresses, 100)),
+            ("SETTLER", "confirmPaymentReceived", interpreter.Record({"txId": 100})),
+            ("SETTLER", "confirmPaymentTransferred", interpreter.Record({"txId": 100})),
+            ("REGISTRAR", "confirmPaymentReceived", interpreter.Record({"txId": 0})),
+            ("INVESTOR", "settleDvP", benchmark.subscription(addresses, 100)),
+        ]:
+            try:
+                chain.transfer(addresses[sender], instrument, entry_point, params)
+            except interpreter.Failure:
+                pass
+
+
+def run(args, passes):
+    chain = TracedChain()
+    benchmark.run(args, chain, passes)
+    failing_calls(chain)
+    storages = {
+        chain.name(address): normalize(account.storage, chain.ids)
+        for (address, account) in sorted(chain.accounts.items())
+        if account.program is not None
+    }
+    sizes = {}
+    for (address, account) in chain.accounts.items():
+        if account.program is not None:
+            sizes[chain.name(address)] = costs.program_instructions(account.program)
+    return (chain, storages, sizes)
+
+
+def differences(before, after):
+    (chain, storages, _) = before
+    (optimized, optimizedStorages, _) = after
+    result = []
+    if len(chain.trace) != len(optimized.trace):
+        result.append("%i calls, %i with the optimized contracts" % (len(chain.trace), len(optimized.trace)))
+    for (i, (x, y)) in enumerate(zip(chain.trace, optimized.trace)):
+        if x != y:
+            result.append("call %i (%s): %r != %r" % (i, x[0], x[1:], y[1:]))
+    for name in sorted(set(storages) | set(optimizedStorages)):
+        if storages.get(name) != optimizedStorages.get(name):
+            result.append("storage of %s differs" % name)
+    return result
+
+
+def report(before, after):
+    (gas, optimizedGas) = (costs.summary(before[0]), costs.summary(after[0]))
+    rows = {
+        "gas": {
+            key: (gas[key]["gas"]["mean"], optimizedGas[key]["gas"]["mean"])
+            for key in sorted(gas)
+            if key in optimizedGas
+        },
+        "instructions": {name: (before[2][name], after[2].get(name)) for name in sorted(before[2])},
+    }
+    for (title, values) in [("units", rows["gas"]), ("code instructions", rows["instructions"])]:
+        header = "%-60s%18s%12s%9s" % ("entry point" if title == "units" else "contract", title, "optimized", "")
+        print(header)
+        print("-" * len(header))
+        for (key, (b, a)) in values.items():
+            print("%-60s%18.0f%12.0f%+8.1f%%" % (key, b, a, 100.0 * (a - b) / b if b else 0.0))
+        print()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Optimized contracts against the original ones")
+    parser.add_argument("--plan", nargs="?", default="origination.json")
+    parser.add_argument("--passes", nargs="+", default=["fold", "cse"], help="smartpy_optimize passes")
+    parser.add_argument("--instruments", type=int, default=2, help="instruments created by each factory")
+    parser.add_argument("--settlements", type=int, default=2, help="subscriptions settled on each instrument")
+    parser.add_argument("--json", nargs="?")
+    args = parser.parse_args()
+    args.operations = False
+
+    # The original contracts are built first: the passes rewrite in place
+    # the lambdas the imported scripts share.
+    before = run(args, None)
+    after = run(args, args.passes)
+    rows = report(before, after)
+    diffs = differences(before, after)
+    for diff in diffs:
+        print(diff)
+    print("%i calls, %s" % (len(before[0].trace), "%i differences" % len(diffs) if diffs else "same behaviour"))
+    if args.json is not None:
+        open(args.json, "w").write(json.dumps(dict(rows, passes=args.passes, differences=diffs), indent=2))
+    sys.exit(1 if diffs else 0)
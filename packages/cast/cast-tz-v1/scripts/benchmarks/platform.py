@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Throughput of the whole platform on the local chain of
+# smartpy_interpreter: origination.json is applied as platform.ts would on a
+# node, then bonds (or EMTNs) are created through their factory and
+# subscriptions are settled on them.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/platform.py
+#   python3 scripts/benchmarks/platform.py --instruments 5000 --settlements 2 --kind emtn
+#
+# A settlement is the subscription flow on one instrument:
+# initiateSubscription, confirmPaymentReceived and confirmPaymentTransferred,
+# with the event sink calls they emit.
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpy_interpreter as interpreter
+
+
+def build_export(path, passes=None):
+    """Export of the contract of a plan path, built in this process and
+    optimized by passes (smartpy_optimize) if given."""
+    import smartpy as sp
+    from browser import window
+
+    (script,) = glob.glob(os.path.join(path, "*_contract.py"))
+    window.pythonCompilationTargets = []
+    sp.io.import_script_from_script(script, open(script, "r").read())
+    name = os.path.basename(path.rstrip("/"))
+    (target,) = [t for t in window.pythonCompilationTargets if t.name == name]
+    if passes:
+        import smartpy_optimize
+
+        smartpy_optimize.optimize([target], passes)
+    return target.contract.export()
+
+
+def bond_params(context, isin):
+    return interpreter.Record(
+        {
+            "registryAddress": context["REGISTRY"],
+            "initialSupply": 1000000,
+            "isinCode": isin,
+            "name": isin,
+            "symbol": "mo",
+            "denomination": 1753660800,
+            "divisor": 1438041600,
+            "startDate": 12,
+            "initialMaturityDate": 36,
+            "firstCouponDate": 1,
+            "couponFrequencyInMonths": 1,
+            "interestRateInBips": 24,
+            "callable": True,
+            "isSoftBullet": True,
+            "softBulletPeriodInMonths": 1234,
+            "currency": "EUR",
+            "registrar": context["REGISTRAR"],
+            "settler": context["SETTLER"],
+            "owner": context["REGISTRAR"],
+        }
+    )
+
+
+def emtn_params(context, isin):
+    return interpreter.Record(
+        {
+            "registryAddress": context["REGISTRY"],
+            "initialSupply": 1000000,
+            "isinCode": isin,
+            "name": isin,
+            "symbol": "mo",
+            "currency": "EUR",
+            "registrar": context["REGISTRAR"],
+            "settler": context["SETTLER"],
+            "owner": context["REGISTRAR"],
+        }
+    )
+
+
+kinds = {
+    "bond": ("FACTORY_BOND", "createForgeBond", bond_params),
+    "emtn": ("FACTORY_EMTN", "createForgeEmtn", emtn_params),
+}
+
+
+def create(chain, context, kind, index):
+    (factory, entry_point, params) = kinds[kind]
+    applied = chain.transfer(
+        context["REGISTRAR"], context[factory], entry_point, params(context, "ISIN%06i" % index)
+    )
+    (address,) = [op.address for (_, op) in applied if op.kind == "originate"]
+    return (address, len(applied))
+
+
+def settle(chain, context, instrument, txId):
+    (registrar, settler) = (context["REGISTRAR"], context["SETTLER"])
+    count = len(
+        chain.transfer(
+            registrar,
+            instrument,
+            "initiateSubscription",
+            interpreter.Record(
+                {
+                    "txId": txId,
+                    "operationId": txId,
+                    "deliverySenderAccountNumber": registrar,
+                    "deliveryReceiverAccountNumber": context["INVESTOR"],
+                    "deliveryQuantity": 1,
+                    "txHash": "0x%x" % txId,
+                }
+            ),
+        )
+    )
+    for entry_point in ["confirmPaymentReceived", "confirmPaymentTransferred"]:
+        count += len(chain.transfer(settler, instrument, entry_point, interpreter.Record({"txId": txId})))
+    return count
+
+
+def run(args):
+    start = time.perf_counter()
+    plan = json.load(open(args.plan))
+    exports = {step["path"]: build_export(step["path"]) for step in plan if step["action"] == "originate"}
+    built = time.perf_counter()
+    chain = interpreter.LocalChain()
+    context = {
+        name: interpreter.make_address("tz1", name)
+        for name in ["ADMIN", "REGISTRAR", "SETTLER", "INVESTOR"]
+    }
+    interpreter.apply_plan(chain, plan, context, exports.get)
+    applied = time.perf_counter()
+    instruments = []
+    operations = 0
+    for i in range(args.instruments):
+        (address, count) = create(chain, context, args.kind, i)
+        instruments.append(address)
+        operations += count
+    created = time.perf_counter()
+    settlements = 0
+    for txId in range(args.settlements):
+        for instrument in instruments:
+            operations += settle(chain, context, instrument, txId)
+            settlements += 1
+    settled = time.perf_counter()
+    return {
+        "kind": args.kind,
+        "instruments": args.instruments,
+        "settlements": settlements,
+        "operations": operations,
+        "build": built - start,
+        "plan": applied - built,
+        "create": created - applied,
+        "settle": settled - created,
+        "contracts": sum(1 for account in chain.accounts.values() if account.program is not None),
+    }
+
+
+def report(r):
+    print("%-40s%10.3fs" % ("build exports", r["build"]))
+    print("%-40s%10.3fs" % ("apply origination plan", r["plan"]))
+    print(
+        "%-40s%10.3fs%12.0f/s"
+        % ("create %i %s" % (r["instruments"], r["kind"]), r["create"], r["instruments"] / r["create"])
+    )
+    if r["settlements"]:
+        print(
+            "%-40s%10.3fs%12.0f/s"
+            % ("settle %i subscriptions" % r["settlements"], r["settle"], r["settlements"] / r["settle"])
+        )
+    print(
+        "%-40s%10i%12.0f/s"
+        % ("operations", r["operations"], r["operations"] / (r["create"] + r["settle"]))
+    )
+    print("%-40s%10i" % ("contracts on chain", r["contracts"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local chain platform benchmark")
+    parser.add_argument("--plan", nargs="?", default="origination.json")
+    parser.add_argument("--kind", nargs="?", default="bond", help="bond or emtn")
+    parser.add_argument("--instruments", type=int, default=1000, help="instruments created through the factory")
+    parser.add_argument("--settlements", type=int, default=1, help="subscriptions settled on each instrument")
+    parser.add_argument("--json", nargs="?")
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    if args.json is not None:
+        open(args.json, "w").write(json.dumps(result, indent=2))
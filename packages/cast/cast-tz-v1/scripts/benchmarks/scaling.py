@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# Gas and storage of the settlement entry points of an instrument as its
+# history grows, from the cost model of smartpy_costs.
+#
+# Run it from the cast-tz-v1 directory:
+#   python3 scripts/benchmarks/scaling.py
+#   python3 scripts/benchmarks/scaling.py --settlements 0 1000 100000 --holders 1 --operators 0
+#   python3 scripts/benchmarks/scaling.py --thresholds scripts/benchmarks/scaling_thresholds.json
+#   python3 scripts/benchmarks/scaling.py --write_thresholds scripts/benchmarks/scaling_thresholds.json
+#
+# For every N in --settlements, every M in --holders and every K in
+# --operators (the others being 0, 1 and 0), a ForgeBond is created through
+# its factory and seeded with N settled subscriptions, M holders and K
+# operators besides its registrar and settler, copies of the entries left by
+# a real settlement. The summary gives the gas (in the relative units of
+# smartpy_costs, not calibrated against a node), the instructions and the
+# newly paid bytes of initiateSubscription, confirmPaymentReceived,
+# confirmPaymentTransferred and run (operator authorization), and how gas
+# grows with N, M and K.
+#
+# --thresholds compares the gas with a threshold file and fails when one
+# goes beyond its reference by more than the threshold the file records. A
+# reference is given by run ("initiateSubscription N=0 M=1 K=0"), as
+# --write_thresholds writes them to compare two designs, or by entry point
+# ("initiateSubscription"), a budget for every N, M and K.
+#
+# scaling_thresholds.json holds fixed budgets, written by hand: gas must
+# not grow with the history of an instrument. They are not regenerated from
+# a run; a change that moves one justifies it in its commit.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpy_costs as costs
+import smartpy_interpreter as interpreter
+
+spec = importlib.util.spec_from_file_location(
+    "platform_benchmark", os.path.join(os.path.dirname(os.path.abspath(__file__)), "platform.py")
+)
+benchmark = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(benchmark)
+
+entry_points = ["initiateSubscription", "confirmPaymentReceived", "confirmPaymentTransferred", "run"]
+
+
+def subscription(context, txId):
+    return interpreter.Record(
+        {
+            "txId": txId,
+            "operationId": txId,
+            "deliverySenderAccountNumber": context["REGISTRAR"],
+            "deliveryReceiverAccountNumber": context["INVESTOR"],
+            "deliveryQuantity": 1,
+            "txHash": "0x%x" % txId,
+        }
+    )
+
+
+def settle(chain, context, instrument, txId):
+    chain.transfer(context["REGISTRAR"], instrument, "initiateSubscription", subscription(context, txId))
+    chain.transfer(context["SETTLER"], instrument, "confirmPaymentReceived", interpreter.Record({"txId": txId}))
+    chain.transfer(context["SETTLER"], instrument, "confirmPaymentTransferred", interpreter.Record({"txId": txId}))
+
+
+def with_fields(record, **fields):
+    result = dict(record.fields)
+    result.update(fields)
+    return interpreter.Record(result)
+
+
+def seed(storage, settlements, holders, operators):
+    """Storage with settlements past settlements, holders holders and
+    operators more operators, the containers keep their type (map or
+    big_map)."""
+    repository = storage.fields["settlementTransactionRepository"]
+    byId = repository.fields["settlementTransactionById"]
+    byOperation = repository.fields["operationTypeByOperationId"]
+    (template,) = byId.values()
+    (operationType,) = byOperation.values()
+    # Past settlements use the ids after the ones the benchmark calls with.
+    newById = byId.__class__(byId)
+    newByOperation = byOperation.__class__(byOperation)
+    for i in range(settlements):
+        txId = 1000000 + i
+        newById[txId] = with_fields(template, txId=txId, operationId=txId)
+        newByOperation[txId] = operationType
+    accounts = storage.fields["accounts"]
+    newAccounts = accounts.fields["addresses"].__class__(accounts.fields["addresses"])
+    balances = storage.fields["balances"]
+    newBalances = balances.__class__(balances)
+    holder = interpreter.Record({"balance": 1, "locked": 0})
+    for i in range(holders - 1):
+        address = interpreter.make_address("tz1", "holder %i" % i)
+        newBalances[address] = holder
+        newAccounts[len(newAccounts)] = address
+    authorizations = storage.fields["operatorsAuthorizations"]
+    newAuthorizations = authorizations.__class__(authorizations)
+    registrar = authorizations[storage.fields["owner"]]
+    for i in range(operators):
+        address = interpreter.make_address("tz1", "operator %i" % i)
+        newAuthorizations[address] = registrar
+        newAccounts[len(newAccounts)] = address
+    return with_fields(
+        storage,
+        settlementTransactionRepository=with_fields(
+            repository, settlementTransactionById=newById, operationTypeByOperationId=newByOperation
+        ),
+        balances=newBalances,
+        accounts=with_fields(accounts, count=len(newAccounts), addresses=newAccounts),
+        operatorsAuthorizations=newAuthorizations,
+    )
+
+
+def measure(exports, plan, settlements, holders, operators):
+    chain = costs.MeteredChain()
+    context = {
+        name: interpreter.make_address("tz1", name)
+        for name in ["ADMIN", "REGISTRAR", "SETTLER", "INVESTOR"]
+    }
+    interpreter.apply_plan(chain, plan, context, exports.get)
+    (address, _) = benchmark.create(chain, context, "bond", 0)
+    settle(chain, context, address, 0)
+    account = chain.accounts[address]
+    account.storage = seed(account.storage, settlements, holders, operators)
+    chain.paid[address] = chain.storage_size(account)
+    txId = 1
+    calls = [
+        ("REGISTRAR", "initiateSubscription", subscription(context, txId)),
+        ("SETTLER", "confirmPaymentReceived", interpreter.Record({"txId": txId})),
+        ("SETTLER", "confirmPaymentTransferred", interpreter.Record({"txId": txId})),
+        (
+            "REGISTRAR",
+            "run",
+            interpreter.Record(
+                {"entrypointName": "callAuthorizeOperator", "_operator": context["SETTLER"], "_operatorRole": 2}
+            ),
+        ),
+    ]
+    result = {}
+    for (sender, entry_point, params) in calls:
+        chain.transfer(context[sender], address, entry_point, params)
+        receipt = chain.last_receipts[0]
+        result[entry_point] = {
+            "gas": receipt.gas,
+            "gas_with_internal": sum(r.gas for r in chain.last_receipts),
+            "instructions": receipt.instructions,
+            "paid_diff": receipt.paid_diff,
+            "storage_size": receipt.storage_size,
+        }
+    return result
+
+
+# Name, argument and value when another dimension varies.
+dimensions = [("N", "settlements", 0), ("M", "holders", 1), ("K", "operators", 0)]
+
+
+def key(entry_point, point):
+    return " ".join([entry_point] + ["%s=%i" % (name, point[field]) for (name, field, _) in dimensions])
+
+
+def run(args):
+    plan = json.load(open(args.plan))
+    exports = {step["path"]: benchmark.build_export(step["path"]) for step in plan if step["action"] == "originate"}
+    points = []
+    for (_, field, _) in dimensions:
+        for value in getattr(args, field):
+            point = {f: base for (_, f, base) in dimensions}
+            point[field] = value
+            if point not in points:
+                points.append(point)
+    results = []
+    for point in points:
+        result = dict(point)
+        result["entry_points"] = measure(exports, plan, point["settlements"], point["holders"], point["operators"])
+        results.append(result)
+    return results
+
+
+def growth(curve):
+    """Gas of the largest point relative to the smallest one."""
+    if len(curve) < 2 or not curve[0][1]:
+        return None
+    return curve[-1][1] / curve[0][1]
+
+
+def report(results):
+    header = "%-30s%10s%10s%10s%12s%12s%12s%12s" % (
+        "entry point", "N", "M", "K", "units", "+internal", "instructions", "paid"
+    )
+    print(header)
+    print("-" * len(header))
+    for entry_point in entry_points:
+        for r in results:
+            e = r["entry_points"][entry_point]
+            print(
+                "%-30s%10i%10i%10i%12i%12i%12i%12i"
+                % (
+                    entry_point,
+                    r["settlements"],
+                    r["holders"],
+                    r["operators"],
+                    e["gas"],
+                    e["gas_with_internal"],
+                    e["instructions"],
+                    e["paid_diff"],
+                )
+            )
+    print()
+    for entry_point in entry_points:
+        for (name, dimension, _) in dimensions:
+            curve = sorted(
+                (r[dimension], r["entry_points"][entry_point]["gas"])
+                for r in results
+                if all(r[f] == base for (_, f, base) in dimensions if f != dimension)
+            )
+            ratio = growth(curve)
+            if ratio is not None and curve[0][0] != curve[-1][0]:
+                print(
+                    "%-30s units x%.2f from %s=%i to %s=%i"
+                    % (entry_point, ratio, name, curve[0][0], name, curve[-1][0])
+                )
+
+
+def thresholds(results, threshold):
+    return {
+        "threshold": threshold,
+        "gas": {
+            key(entry_point, r): r["entry_points"][entry_point]["gas"]
+            for r in results
+            for entry_point in entry_points
+        },
+    }
+
+
+def check(results, baseline):
+    """Gas going beyond the reference of baseline, by run or by entry
+    point, by more than its threshold."""
+    regressions = []
+    for r in results:
+        for entry_point in entry_points:
+            name = key(entry_point, r)
+            gas = r["entry_points"][entry_point]["gas"]
+            reference = baseline["gas"].get(name, baseline["gas"].get(entry_point))
+            if reference is not None and gas > reference * (1 + baseline["threshold"] / 100.0):
+                regressions.append((name, reference, gas))
+    for (name, reference, gas) in regressions:
+        print("%-60s%10i ->%10i  %+.1f%%" % (name, reference, gas, 100.0 * (gas - reference) / reference))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Settlement gas scaling benchmark")
+    parser.add_argument("--plan", nargs="?", default="origination.json")
+    parser.add_argument("--settlements", type=int, nargs="+", default=[0, 100, 1000, 10000, 100000],
+                        help="past settlements N")
+    parser.add_argument("--holders", type=int, nargs="+", default=[1, 100, 1000, 10000, 100000],
+                        help="holders M")
+    parser.add_argument("--operators", type=int, nargs="+", default=[0, 100, 1000, 10000, 100000],
+                        help="operators K besides the registrar and the settler")
+    parser.add_argument("--thresholds", nargs="?", help="fail when gas grows beyond this threshold file")
+    parser.add_argument("--write_thresholds", nargs="?", help="write a threshold file from this run")
+    parser.add_argument("--threshold", type=float, default=5.0, help="growth in percent recorded by --write_thresholds")
+    parser.add_argument("--json", nargs="?")
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+    if args.json is not None:
+        open(args.json, "w").write(json.dumps(results, indent=2))
+    if args.write_thresholds is not None:
+        open(args.write_thresholds, "w").write(json.dumps(thresholds(results, args.threshold), indent=2) + "\n")
+    if args.thresholds is not None:
+        regressions = check(results, json.load(open(args.thresholds)))
+        if regressions:
+            print("%i gas regressions against %s" % (len(regressions), args.thresholds))
+            sys.exit(1)
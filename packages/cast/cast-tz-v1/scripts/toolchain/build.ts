@@ -1,9 +1,11 @@
 import * as Path from 'path';
-import { ls, exec, pwd } from 'shelljs';
+import { exec } from 'shelljs';
 import { getObjectFromFile } from './utils';
 import {
   CONFIG_FILE,
-  SMPC,
+  SMARTPY_CLI,
+  BUILD_CACHE,
+  DIST_DIR,
   KEY_GROUP_REGEXP,
   SMP_TARGET_OBJECT,
 } from './constant';
@@ -30,14 +32,14 @@ export function buildStorage(
     : michelsonStorage;
 }
 
-function buildFromPath(path: string, config: SmpConfig): void {
-  const sourceRoot = Path.join(pwd().toString(), config.srcDir);
-  const dir = Path.dirname(path);
-  const filename = Path.basename(path);
-
-  smpLog.info(`Building ${filename.split('.')[0]}...`);
+// All the contracts are built by one smartpy_cli batch, each into the dist
+// directory next to it. Unchanged contracts are restored from the build
+// cache instead of being compiled again.
+export function buildAll(): void {
+  const config: SmpConfig = getObjectFromFile(CONFIG_FILE);
+  const pattern = Path.join(config.srcDir, config.pattern);
 
-  const ccCmd = `${SMPC} ${path} ${dir}/dist`;
+  const ccCmd = `${SMARTPY_CLI} --batch '${pattern}' --compile ${DIST_DIR} --cache ${BUILD_CACHE}`;
   smpLog.info(`Building command: ${ccCmd}`);
 
   const result = exec(ccCmd, { fatal: true });
@@ -46,15 +48,3 @@ function buildFromPath(path: string, config: SmpConfig): void {
     throw new Error(result.stderr);
   }
 }
-
-export function buildAll(): void {
-  const config = getObjectFromFile(CONFIG_FILE);
-  const sourcesDirectory = config.srcDir;
-  const filesPattern = config.pattern;
-
-  const paths = ls(Path.join(sourcesDirectory, filesPattern));
-
-  for (const filePath of paths) {
-    buildFromPath(filePath, config);
-  }
-}
@@ -1,4 +1,6 @@
 export const CONFIG_FILE = 'smpconfig.json';
-export const SMPC = 'npx smp compile';
+export const SMARTPY_CLI = 'python3 package/smartpy_cli.py';
+export const BUILD_CACHE = '.smartpy_cache';
+export const DIST_DIR = 'dist';
 export const SMP_TARGET_OBJECT = 'contract';
 export const KEY_GROUP_REGEXP = /tz1@(?<key>[^@]*)@/;
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Replays calls on the local chain of smartpy_interpreter, for the specs
+# comparing it with a node (src/bond/test/LocalChain.spec.ts).
+#
+# Run it from the cast-tz-v1 directory, after build:tez, with the calls on
+# its standard input:
+#   python3 scripts/toolchain/localchain.py < calls.json
+#
+# The input gives the implicit accounts by name, the calls and the names of
+# the contracts whose storage is wanted:
+#   {"accounts": {"ADMIN": "tz1...", "REGISTRAR": "tz1...", ...},
+#    "calls": [{"sender": "REGISTRAR", "destination": "FACTORY_BOND",
+#               "entrypoint": "createForgeBond", "params": {...},
+#               "originates": "TOKEN"}, ...],
+#    "storages": ["TOKEN"]}
+# origination.json is applied first, with the contracts of dist, and
+# registers the contracts by name as platform.ts does. tz1@NAME@ in params
+# stands for the address of NAME and records for the parameters of the
+# entry points. A call with "originates" registers the contract it creates
+# under that name.
+#
+# The output (JSON on standard output) gives for every call the calls it
+# made to the event sink, or its failure, and the storages. Values are
+# written as Taquito decodes them, numbers as strings, with the addresses of
+# the contracts replaced by tz1@NAME@: they differ from a node's.
+
+import json
+import os
+import sys
+
+root = os.getcwd()
+sys.path.insert(0, os.path.join(root, "package"))
+
+import smartpy_interpreter as interpreter
+
+
+def from_json(v, context):
+    if isinstance(v, dict):
+        return interpreter.Record({k: from_json(x, context) for (k, x) in v.items()})
+    if isinstance(v, list):
+        return [from_json(x, context) for x in v]
+    if isinstance(v, str):
+        return interpreter.placeholder.sub(lambda m: context[m.group(1)], v)
+    return v
+
+
+def to_json(v, names):
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, int):
+        return str(v)
+    if isinstance(v, str):
+        return names.get(v, v)
+    if isinstance(v, bytes):
+        return v.hex()
+    if isinstance(v, interpreter.Record):
+        return {k: to_json(x, names) for (k, x) in v.fields.items()}
+    if isinstance(v, interpreter.Variant):
+        if v.name == "Some":
+            return to_json(v.value, names)
+        if v.name == "None":
+            return None
+        return {v.name: to_json(v.value, names)}
+    if isinstance(v, dict):
+        return {to_json(k, names): to_json(x, names) for (k, x) in v.items()}
+    if isinstance(v, (set, frozenset)):
+        return [to_json(x, names) for x in sorted(v)]
+    if isinstance(v, (list, tuple)):
+        return [to_json(x, names) for x in v]
+    return repr(v)
+
+
+def replay(document, plan):
+    chain = interpreter.LocalChain()
+    context = dict(document["accounts"])
+    interpreter.apply_plan(chain, plan, context)
+    calls = []
+    for call in document["calls"]:
+        try:
+            applied = chain.transfer(
+                context[call["sender"]],
+                context[call["destination"]],
+                call["entrypoint"],
+                from_json(call["params"], context),
+            )
+        except interpreter.Failure as e:
+            calls.append({"failed": e.value})
+            continue
+        if "originates" in call:
+            (address,) = [op.address for (_, op) in applied if op.kind == "originate"]
+            context[call["originates"]] = address
+        calls.append(
+            {
+                "sink": [
+                    (op.destination.entry_point, op.parameter)
+                    for (_, op) in applied
+                    if op.kind == "transfer" and op.destination.address == context["SINK"]
+                ]
+            }
+        )
+    names = {
+        address: "tz1@%s@" % name for (name, address) in context.items() if address.startswith("KT1")
+    }
+    return {
+        "calls": [
+            {"failed": to_json(c["failed"], names)}
+            if "failed" in c
+            else {"sink": [{"entrypoint": e, "value": to_json(p, names)} for (e, p) in c["sink"]]}
+            for c in calls
+        ],
+        "storages": {
+            name: to_json(chain.accounts[context[name]].storage, names) for name in document.get("storages", [])
+        },
+    }
+
+
+if __name__ == "__main__":
+    document = json.load(sys.stdin)
+    plan = json.load(open(document.get("plan", "origination.json")))
+    json.dump(replay(document, plan), sys.stdout, indent=2)
@@ -23,6 +23,10 @@ class EventSink(sp.Contract):
     def SubscriptionInitiated(self, params):
         sp.set_type(params, T_SubscriptionInitiatedInput)
 
+    @sp.entry_point
+    def DvPSettled(self, params):
+        sp.set_type(params, T_DvPSettledInput)
+
     @sp.entry_point
     def PaymentTransferred(self, params):
         sp.set_type(params, T_PaymentTransferredInput)
@@ -51,5 +55,9 @@ class EventSink(sp.Contract):
     def Transfer(self, params):
         sp.set_type(params, T_TransferInput)
 
+    @sp.entry_point
+    def events(self, params):
+        sp.set_type(params, T_EventsInput)
+
 sp.add_compilation_target("EventSink", (EventSink()))
 contract = EventSink()
@@ -1,10 +1,13 @@
 FORGE_BOND_CREATED = "forgeBondCreated"
 FORGE_STRUCTURED_PRODUCT_CREATED = "forgeStructuredProductCreated"
 SUBSCRIPTION_INITIATED = "SubscriptionInitiated"
+DVP_SETTLED = "DvPSettled"
 PAYMENT_TRANSFERRED = "PaymentTransferred"
 PAYMENT_RECEIVED = "PaymentReceived"
 NEW_OPERATOR = "newOperator"
 REVOKE_OPERATOR = "revokeOperator"
 INSTRUMENT_LISTED = "InstrumentListed"
 INSTRUMENT_UNLISTED = "InstrumentUnlisted"
-TRANSFER = "Transfer"
\ No newline at end of file
+TRANSFER = "Transfer"
+SETTLEMENT_FAILED = "SettlementFailed"
+EVENTS = "events"
\ No newline at end of file
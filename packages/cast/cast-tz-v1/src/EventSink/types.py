@@ -28,6 +28,10 @@ T_PaymentTransferredInput = T_paymentNotif
 
 T_PaymentReceivedInput = T_paymentNotif
 
+# A settlement transaction a best effort batch skipped, with the error it
+# would have failed with.
+T_settlementFailure = sp.TRecord(settlementId=sp.TNat, error=sp.TString)
+
 T_operatorChange = sp.TRecord(
     by=sp.TAddress, operator=sp.TAddress, operatorRole=sp.TNat)
 
@@ -39,4 +43,25 @@ T_TransferInput = sp.TRecord(
     _from=sp.TAddress,
     _to=sp.TAddress,
     _value=sp.TNat,
-)
\ No newline at end of file
+)
+
+T_DvPSettledInput = sp.TRecord(
+    payment=T_paymentNotif,
+    transfer=T_TransferInput
+)
+
+# The events of the instruments, each case named after the entry point
+# taking it alone and carrying its input. SettlementFailed, a settlement
+# transaction a best effort batch skipped, is only sent in events.
+T_event = sp.TVariant(
+    SubscriptionInitiated=T_SubscriptionInitiatedInput,
+    DvPSettled=T_DvPSettledInput,
+    PaymentReceived=T_PaymentReceivedInput,
+    PaymentTransferred=T_PaymentTransferredInput,
+    Transfer=T_TransferInput,
+    newOperator=T_newOperatorInput,
+    revokeOperator=T_revokeOperatorInput,
+    SettlementFailed=T_settlementFailure
+)
+
+T_EventsInput = sp.TList(T_event)
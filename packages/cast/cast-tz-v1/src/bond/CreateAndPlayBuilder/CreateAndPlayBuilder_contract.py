@@ -29,6 +29,16 @@ class CreateAndPlayBuilder(sp.Contract):
         self.data.bytesScripts[sp.pack(NAME.INITIATE_SUBSCRIPTION)] = sp.pack(
             callInitiateSubscription.open_some())
 
+        callInitiateSubscriptions = sp.some(
+            sp.build_lambda(SubscriptionLambda.initiateSubscriptions))
+        self.data.bytesScripts[sp.pack(NAME.INITIATE_SUBSCRIPTIONS)] = sp.pack(
+            callInitiateSubscriptions.open_some())
+
+        callSettleDvP = sp.some(
+            sp.build_lambda(SubscriptionLambda.settleDvP))
+        self.data.bytesScripts[sp.pack(NAME.SETTLE_DVP)] = sp.pack(
+            callSettleDvP.open_some())
+
         callConfirmPaymentReceived = sp.some(
             sp.build_lambda(SettlementLambda.confirmPaymentReceived))
         self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENT_RECEIVED)] = sp.pack(
@@ -39,6 +49,16 @@ class CreateAndPlayBuilder(sp.Contract):
         self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENT_TRANSFERRED)] = sp.pack(
             callConfirmPaymentTransferred.open_some())
 
+        callConfirmPaymentsReceived = sp.some(
+            sp.build_lambda(SettlementLambda.confirmPaymentsReceived))
+        self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENTS_RECEIVED)] = sp.pack(
+            callConfirmPaymentsReceived.open_some())
+
+        callConfirmPaymentsTransferred = sp.some(
+            sp.build_lambda(SettlementLambda.confirmPaymentsTransferred))
+        self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENTS_TRANSFERRED)] = sp.pack(
+            callConfirmPaymentsTransferred.open_some())
+
         callAuthorizeOperator = sp.some(
             sp.build_lambda(OperatorLambda.authorizeOperator))
         self.data.bytesScripts[sp.pack(NAME.AUTHORIZE_OPERATOR)] = sp.pack(
@@ -54,8 +74,12 @@ class CreateAndPlayBuilder(sp.Contract):
 
         entryPoints = {
             sp.pack(NAME.INITIATE_SUBSCRIPTION): self.data.bytesScripts[sp.pack(NAME.INITIATE_SUBSCRIPTION)],
+            sp.pack(NAME.INITIATE_SUBSCRIPTIONS): self.data.bytesScripts[sp.pack(NAME.INITIATE_SUBSCRIPTIONS)],
+            sp.pack(NAME.SETTLE_DVP): self.data.bytesScripts[sp.pack(NAME.SETTLE_DVP)],
             sp.pack(NAME.CONFIRM_PAYMENT_RECEIVED): self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENT_RECEIVED)],
             sp.pack(NAME.CONFIRM_PAYMENT_TRANSFERRED): self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENT_TRANSFERRED)],
+            sp.pack(NAME.CONFIRM_PAYMENTS_RECEIVED): self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENTS_RECEIVED)],
+            sp.pack(NAME.CONFIRM_PAYMENTS_TRANSFERRED): self.data.bytesScripts[sp.pack(NAME.CONFIRM_PAYMENTS_TRANSFERRED)],
             sp.pack(NAME.AUTHORIZE_OPERATOR): self.data.bytesScripts[sp.pack(NAME.AUTHORIZE_OPERATOR)],
             sp.pack(NAME.REVOKE_OPERATOR_AUTHORIZATION): self.data.bytesScripts[sp.pack(NAME.REVOKE_OPERATOR_AUTHORIZATION)],
         }
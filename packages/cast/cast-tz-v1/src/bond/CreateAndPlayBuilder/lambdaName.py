@@ -1,5 +1,9 @@
 INITIATE_SUBSCRIPTION = "callInitiateSubscription"
+INITIATE_SUBSCRIPTIONS = "callInitiateSubscriptions"
+SETTLE_DVP = "callSettleDvP"
 CONFIRM_PAYMENT_RECEIVED = "callConfirmPaymentReceived"
 CONFIRM_PAYMENT_TRANSFERRED = "callConfirmPaymentTransferred"
+CONFIRM_PAYMENTS_RECEIVED = "callConfirmPaymentsReceived"
+CONFIRM_PAYMENTS_TRANSFERRED = "callConfirmPaymentsTransferred"
 AUTHORIZE_OPERATOR = "callAuthorizeOperator"
 REVOKE_OPERATOR_AUTHORIZATION = "callRevokeOperatorAuthorization"
@@ -0,0 +1,340 @@
+import { execFileSync } from 'child_process';
+import {
+  BigMapAbstraction,
+  TezosOperationError,
+  TezosToolkit,
+} from '@taquito/taquito';
+import { importKey } from '@taquito/signer';
+import { BigNumber } from 'bignumber.js';
+import { expect } from 'chai';
+import * as faker from 'faker';
+import * as minimist from 'minimist';
+import {
+  extractAddressFromSecret,
+  getNetworkConfig,
+  getTezosToolkitRegistrar,
+} from '../../../scripts/toolchain/utils';
+import { NetworkConfig } from '../../../scripts/toolchain/type';
+import { getEventSinkCalls } from '../../utils/eventUtils';
+import { buildTokenBond, SETTLER_ROLE } from '../../utils/tokenUtils';
+
+// The same calls are sent to the sandbox and replayed on the local chain of
+// smartpy_interpreter (scripts/toolchain/localchain.py), with the contracts
+// built by build:tez. Both must make the same event sink calls, fail the
+// same calls and leave the same storage.
+
+type Call = {
+  sender: string;
+  destination: string;
+  entrypoint: string;
+  // In the order of the parameters of the entry point, tz1@NAME@ standing
+  // for the address of NAME.
+  params: { [field: string]: unknown };
+  originates?: string;
+};
+
+type CallResult =
+  | { failed: unknown }
+  | { sink: { entrypoint: string; value: unknown }[] };
+
+const PLACEHOLDER = /tz1@([^@]*)@/g;
+
+const resolve = (value: unknown, addresses: { [name: string]: string }) =>
+  typeof value === 'string'
+    ? value.replace(PLACEHOLDER, (_, name) => addresses[name])
+    : value;
+
+// A value decoded by Taquito as localchain.py writes it: numbers as strings
+// and the addresses of contracts, which differ between the chains, as
+// tz1@NAME@.
+const normalize = (
+  value: unknown,
+  names: { [address: string]: string },
+): unknown => {
+  if (BigNumber.isBigNumber(value)) {
+    return value.toFixed();
+  }
+  if (typeof value === 'string') {
+    return names[value] ?? value;
+  }
+  if (Array.isArray(value)) {
+    return value.map((v) => normalize(v, names));
+  }
+  if (value !== null && typeof value === 'object') {
+    return Object.keys(value).reduce(
+      (acc, key) => ({ ...acc, [key]: normalize(value[key], names) }),
+      {},
+    );
+  }
+  return value;
+};
+
+const SCALARS = [
+  'owner',
+  'currentSupply',
+  'initialSupply',
+  'isinCode',
+  'name',
+  'symbol',
+  'currency',
+  'eventSinkContractAddress',
+];
+
+const pick = (storage: any): any =>
+  SCALARS.reduce((acc, field) => ({ ...acc, [field]: storage[field] }), {});
+
+const union = (...keys: string[][]): string[] =>
+  Array.from(new Set(([] as string[]).concat(...keys)));
+
+// The entries of a big_map at keys, the missing ones left out.
+const bigMapEntries = async (
+  bigMap: BigMapAbstraction,
+  keys: string[],
+  names: { [address: string]: string },
+): Promise<{ [key: string]: unknown }> => {
+  const values = await Promise.all(keys.map((key) => bigMap.get(key)));
+  return keys.reduce(
+    (acc, key, i) =>
+      values[i] === undefined
+        ? acc
+        : { ...acc, [key]: normalize(values[i], names) },
+    {},
+  );
+};
+
+describe('ForgeBond: local chain against the sandbox', function () {
+  let Tezos: TezosToolkit;
+  let networkConfig: NetworkConfig;
+  let secrets: { [name: string]: string };
+  let addresses: { [name: string]: string };
+  let calls: Call[];
+  let sandboxResults: CallResult[];
+  let local: {
+    calls: CallResult[];
+    storages: { [name: string]: any };
+  };
+
+  const contractNames = (): { [address: string]: string } =>
+    Object.keys(addresses)
+      .filter((name) => addresses[name].startsWith('KT1'))
+      .reduce(
+        (acc, name) => ({ ...acc, [addresses[name]]: `tz1@${name}@` }),
+        {},
+      );
+
+  const send = async (call: Call): Promise<CallResult> => {
+    await importKey(Tezos, secrets[call.sender]);
+    const contract = await Tezos.contract.at(addresses[call.destination]);
+    const params = Object.keys(call.params).map((field) =>
+      resolve(call.params[field], addresses),
+    );
+    let operation;
+    try {
+      operation = await contract.methods[call.entrypoint](...params).send();
+      await operation.confirmation();
+    } catch (e) {
+      if (e instanceof TezosOperationError) {
+        return { failed: e.message };
+      }
+      throw e;
+    }
+    if (call.originates !== undefined) {
+      for (const content of operation.operationResults) {
+        const internals = content.metadata.internal_operation_results ?? [];
+        for (const internal of internals) {
+          if (internal.kind === 'origination') {
+            addresses[call.originates] =
+              internal.result.originated_contracts[0];
+          }
+        }
+      }
+    }
+    const sinkCalls = await getEventSinkCalls(
+      Tezos,
+      operation,
+      addresses.SINK,
+    );
+    return {
+      sink: sinkCalls.map(({ entrypoint, value }) => ({
+        entrypoint,
+        value: normalize(value, contractNames()),
+      })),
+    };
+  };
+
+  before(async function () {
+    const argv = minimist<{ ['network-folder']: string }>(
+      process.argv.slice(2),
+    );
+    const networkFolder = argv['network-folder'] ?? process.env.NETWORK_FOLDER;
+    networkConfig = getNetworkConfig(networkFolder);
+    Tezos = await getTezosToolkitRegistrar(networkConfig);
+
+    secrets = {
+      REGISTRAR: networkConfig.keysConfig.REGISTRAR,
+      SETTLER: networkConfig.keysConfig.ISSUER_1,
+    };
+    const accounts = {
+      ADMIN: networkConfig.contractConfig.ADMIN,
+      REGISTRAR: networkConfig.contractConfig.REGISTRAR,
+      SETTLER: extractAddressFromSecret(networkConfig.keysConfig.ISSUER_1),
+    };
+    addresses = { ...networkConfig.contractConfig, ...accounts };
+
+    const token = buildTokenBond('tz1@REGISTRAR@', 'tz1@ADMIN@');
+    const txId = 1;
+    calls = [
+      {
+        sender: 'REGISTRAR',
+        destination: 'FACTORY_BOND',
+        entrypoint: 'createForgeBond',
+        params: {
+          registryAddress: 'tz1@REGISTRY@',
+          initialSupply: token.initialSupply,
+          isinCode: token.isinCode,
+          name: token.name,
+          symbol: token.symbol,
+          denomination: token.denomination,
+          divisor: token.divisor,
+          startDate: token.startDate,
+          initialMaturityDate: token.initialMaturityDate,
+          firstCouponDate: token.firstCouponDate,
+          couponFrequencyInMonths: token.couponFrequencyInMonths,
+          interestRateInBips: token.interestRateInBips,
+          callable: token.callable,
+          isSoftBullet: token.isSoftBullet,
+          softBulletPeriodInMonths: token.softBulletPeriodInMonths,
+          currency: token.currency,
+          registrar: token.registrar,
+          settler: 'tz1@SETTLER@',
+          owner: token.owner,
+        },
+        originates: 'TOKEN',
+      },
+      {
+        sender: 'REGISTRAR',
+        destination: 'TOKEN',
+        entrypoint: 'initiateSubscription',
+        params: {
+          txId,
+          operationId: txId,
+          deliverySenderAccountNumber: 'tz1@ADMIN@',
+          deliveryReceiverAccountNumber: 'tz1@REGISTRAR@',
+          deliveryQuantity: 2,
+          txHash: faker.datatype.hexaDecimal(12),
+        },
+      },
+      // Fails: the registrar is not the settler.
+      {
+        sender: 'REGISTRAR',
+        destination: 'TOKEN',
+        entrypoint: 'confirmPaymentReceived',
+        params: { txId },
+      },
+      {
+        sender: 'SETTLER',
+        destination: 'TOKEN',
+        entrypoint: 'confirmPaymentReceived',
+        params: { txId },
+      },
+      {
+        sender: 'SETTLER',
+        destination: 'TOKEN',
+        entrypoint: 'confirmPaymentTransferred',
+        params: { txId },
+      },
+      {
+        sender: 'REGISTRAR',
+        destination: 'TOKEN',
+        entrypoint: 'run',
+        params: {
+          _operator: 'tz1@SETTLER@',
+          _operatorRole: SETTLER_ROLE,
+          entrypointName: 'callAuthorizeOperator',
+        },
+      },
+      {
+        sender: 'REGISTRAR',
+        destination: 'TOKEN',
+        entrypoint: 'run',
+        params: {
+          _operator: 'tz1@SETTLER@',
+          _operatorRole: SETTLER_ROLE,
+          entrypointName: 'callRevokeOperatorAuthorization',
+        },
+      },
+    ];
+
+    console.log('===== BEGIN BEFORE HOOK =====');
+    sandboxResults = [];
+    for (const call of calls) {
+      sandboxResults.push(await send(call));
+    }
+    console.log('new tokenContractAddress: ', addresses.TOKEN);
+
+    local = JSON.parse(
+      execFileSync('python3', ['scripts/toolchain/localchain.py'], {
+        input: JSON.stringify({ accounts, calls, storages: ['TOKEN'] }),
+        maxBuffer: 64 * 1024 * 1024,
+      }).toString(),
+    );
+    console.log('===== END BEFORE HOOK =====');
+  });
+
+  it('should make the same event sink calls and fail the same calls', async function () {
+    expect(sandboxResults).to.deep.equal(local.calls);
+  });
+
+  it('should leave the same storage', async function () {
+    const names = contractNames();
+    const storage = (await (
+      await Tezos.contract.at(addresses.TOKEN)
+    ).storage()) as any;
+    const expected = local.storages.TOKEN;
+
+    expect(normalize(pick(storage), names)).to.deep.equal(pick(expected));
+    expect(normalize(storage.accounts.count, names)).to.equal(
+      expected.accounts.count,
+    );
+
+    const count = Math.max(
+      storage.accounts.count.toNumber(),
+      Number(expected.accounts.count),
+    );
+    const positions = Array.from({ length: count }, (_, i) => i.toString());
+    const indexed = await bigMapEntries(
+      storage.accounts.addresses,
+      positions,
+      names,
+    );
+    expect(indexed).to.deep.equal(expected.accounts.addresses);
+
+    // Balances and roles are read at every address either chain knows of.
+    const accounts = union(
+      Object.keys(indexed).map((i) => indexed[i] as string),
+      Object.keys(expected.balances),
+      Object.keys(expected.operatorsAuthorizations),
+    );
+    expect(
+      await bigMapEntries(storage.balances, accounts, names),
+    ).to.deep.equal(expected.balances);
+    expect(
+      await bigMapEntries(storage.operatorsAuthorizations, accounts, names),
+    ).to.deep.equal(expected.operatorsAuthorizations);
+
+    const repository = storage.settlementTransactionRepository;
+    const expectedRepository = expected.settlementTransactionRepository;
+    const txIds = union(
+      calls
+        .filter((call) => call.params.txId !== undefined)
+        .map((call) => String(call.params.txId)),
+      Object.keys(expectedRepository.settlementTransactionById),
+    );
+    expect(
+      await bigMapEntries(repository.settlementTransactionById, txIds, names),
+    ).to.deep.equal(expectedRepository.settlementTransactionById);
+    expect(
+      await bigMapEntries(repository.operationTypeByOperationId, txIds, names),
+    ).to.deep.equal(expectedRepository.operationTypeByOperationId);
+  });
+});
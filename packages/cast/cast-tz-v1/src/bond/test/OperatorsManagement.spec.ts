@@ -39,6 +39,7 @@ const TOKEN_LOCKED = 2;
 const ERROR = 255;
 const REGISTRAR_ROLE = 1;
 const SETTLER_ROLE = 2;
+const UNKNOWN_ROLE = 3;
 
 describe('ForgeToken: authorizeOperator & revokeOperatorAuthozization', function () {
   let factoryContract;
@@ -142,4 +143,34 @@ describe('ForgeToken: authorizeOperator & revokeOperatorAuthozization', function
       /.*undefined operator*/,
     );
   });
+
+  it('should fail when authorizeOperator() is called with an unknown role', async function () {
+    await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+    const authorizeOperatorOp = tokenContract.methods
+      .run(
+        networkConfig.contractConfig.ADMIN,
+        UNKNOWN_ROLE,
+        'callAuthorizeOperator',
+      )
+      .send();
+
+    await expect(authorizeOperatorOp).to.be.rejectedWith(
+      /.*unknown operator role*/,
+    );
+  });
+
+  it('should fail when revokeOperatorAuthorization() is called with an unknown role', async function () {
+    await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+    const revokeOperatorAuthorizationOp = tokenContract.methods
+      .run(
+        networkConfig.contractConfig.ADMIN,
+        UNKNOWN_ROLE,
+        'callRevokeOperatorAuthorization',
+      )
+      .send();
+
+    await expect(revokeOperatorAuthorizationOp).to.be.rejectedWith(
+      /.*unknown operator role*/,
+    );
+  });
 });
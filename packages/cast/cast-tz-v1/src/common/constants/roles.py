@@ -2,3 +2,10 @@ import smartpy as sp
 
 REGISTRAR = sp.nat(1)
 SETTLER = sp.nat(2)
+
+ROLES = [REGISTRAR, SETTLER]
+
+
+# The roles of an operator are stored as a bitmask, with bit n set for role n.
+def mask(role):
+    return sp.nat(1) << role
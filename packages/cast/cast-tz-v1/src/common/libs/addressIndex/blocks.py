@@ -0,0 +1,11 @@
+from src.globals import *
+from src.common.libs.addressIndex.types import *
+
+
+def newAddressIndex(address: sp.TAddress) -> T_addressIndex:
+    return sp.record(count=sp.nat(1), addresses=sp.big_map({sp.nat(0): address}))
+
+
+def append(index: T_addressIndex, address: sp.TAddress):
+    index.addresses[index.count] = address
+    index.count += 1
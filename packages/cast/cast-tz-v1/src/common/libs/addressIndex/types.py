@@ -0,0 +1,10 @@
+from src.globals import *
+
+# Addresses numbered from 0 in the order they were added: the big_maps keyed
+# by address can only be read by key, so clients enumerate their keys here.
+# Addresses are never removed and may be added again; clients read their
+# entries by key and skip the missing ones.
+T_addressIndex = sp.TRecord(
+    count=sp.TNat,
+    addresses=sp.TBigMap(sp.TNat, sp.TAddress)
+)
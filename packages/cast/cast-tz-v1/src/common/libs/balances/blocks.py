@@ -2,7 +2,7 @@ from src.globals import *
 from src.common.libs.balances.types import *
 
 
-def lock(balances: T_balances, account: sp.TAddress, quantity: sp.TNat) -> T_balances:
+def lock(balances: T_balanceEntries, account: sp.TAddress, quantity: sp.TNat) -> T_balanceEntries:
     sp.verify(
         balances.contains(account),
         message="Attempt to lock empty balances"
@@ -18,3 +18,18 @@ def lock(balances: T_balances, account: sp.TAddress, quantity: sp.TNat) -> T_bal
     M_newBalances[account].locked = balances[account].locked + quantity
 
     return M_newBalances
+
+
+# The entries of balances of accounts, for a lambda. Accounts without a
+# balance are left out.
+def balanceEntries(balances: T_balances, accounts) -> T_balanceEntries:
+    entries = sp.local(
+        "balanceEntries", sp.map(tkey=sp.TAddress, tvalue=T_balance))
+    for account in accounts:
+        addBalanceEntry(entries.value, balances, account)
+    return entries.value
+
+
+def addBalanceEntry(entries: T_balanceEntries, balances: T_balances, account: sp.TAddress):
+    sp.if balances.contains(account):
+        entries[account] = balances[account]
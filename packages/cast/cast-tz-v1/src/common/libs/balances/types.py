@@ -2,6 +2,11 @@ import smartpy as sp
 
 T_balance = sp.TRecord(balance=sp.TNat, locked=sp.TNat)
 
-T_balances = sp.TMap(
+T_balances = sp.TBigMap(
+    sp.TAddress, T_balance
+)
+
+# The entries of balances a lambda reads and updates, by account.
+T_balanceEntries = sp.TMap(
     sp.TAddress, T_balance
 )
@@ -0,0 +1,18 @@
+from src.globals import *
+import src.EventSink.constants as EVENT
+import src.EventSink.types as T_Event
+
+
+# Events sent to the event sink in one operation, each named by the entry
+# point of the event sink taking it alone. The instruments send all their
+# events this way, one event included.
+def callEventSinkWithEvents(eventSink: sp.TAddress, events):
+    sp.transfer(
+        events,
+        sp.mutez(0),
+        sp.contract(
+            t=T_Event.T_EventsInput,
+            address=eventSink,
+            entry_point=EVENT.EVENTS
+        ).open_some(message="Bad event sink contract address")
+    )
@@ -3,21 +3,40 @@ import src.common.constants.roles as ROLE
 import src.common.constants.settlementStatus as ST_STATUS
 
 
+def hasRole(roles, operatorRole):
+    return (roles & ROLE.mask(operatorRole)) != 0
+
+
+# mask shifts by the role: the roles given by a caller must be checked.
+def verifyKnownRole(operatorRole):
+    isKnown = operatorRole == ROLE.ROLES[0]
+    for role in ROLE.ROLES[1:]:
+        isKnown = isKnown | (operatorRole == role)
+    sp.verify(isKnown, message="unknown operator role")
+
+
 def isOperatorWithRoleAuthorized(sender, operatorsAuthorizations, operatorRole):
-    sp.verify(operatorsAuthorizations.contains(
-        sender), message="undefined operator")
+    roles = operatorsAuthorizations.get(sender, message="undefined operator")
 
-    sp.if (operatorRole == ROLE.REGISTRAR):
-        sp.verify(
-            operatorsAuthorizations[sender].contains(ROLE.REGISTRAR),
-            message="only operator with registrar role can lock token")
+    sp.if ~ hasRole(roles, operatorRole):
+        sp.if (operatorRole == ROLE.REGISTRAR):
+            sp.failwith("only operator with registrar role can lock token")
 
-    sp.if (operatorRole == ROLE.SETTLER):
-        sp.verify(
-            operatorsAuthorizations[sender].contains(ROLE.SETTLER),
-            message="only operator with settler role can settle token")
+        sp.if (operatorRole == ROLE.SETTLER):
+            sp.failwith("only operator with settler role can settle token")
 
 
 def onlyIssuer(sender, owner):
     sp.verify((owner == sender),
               message="Only issuer can perform this action")
+
+
+# The entries of operatorsAuthorizations of operators, for a lambda.
+def operatorsAuthorizationsEntries(operatorsAuthorizations, operators):
+    entries = sp.local(
+        "operatorsAuthorizationsEntries",
+        sp.map(tkey=sp.TAddress, tvalue=sp.TNat))
+    for operator in operators:
+        sp.if operatorsAuthorizations.contains(operator):
+            entries.value[operator] = operatorsAuthorizations[operator]
+    return entries.value
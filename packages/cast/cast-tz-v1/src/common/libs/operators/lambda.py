@@ -4,6 +4,8 @@ from src.common.libs.operators.types import *
 
 OperatorBlocks = SPU.importContract(
     "common/libs/operators/blocks.py")
+Updates = SPU.importContract(
+    "common/libs/updates/blocks.py")
 
 
 @safeLambda(S_authorizeOperator)
@@ -12,38 +14,39 @@ def authorizeOperator(params: S_authorizeOperator.inputType):
     # self.onlyIssuer(params._sender, params._owner)
     OperatorBlocks.isOperatorWithRoleAuthorized(
         params._sender, params._operatorsAuthorizations, ROLE.REGISTRAR)
-
-    operatorsAuthorizations = sp.local(
-        "operatorsAuthorizations", params._operatorsAuthorizations)
-
-    sp.if ~ operatorsAuthorizations.value.contains(params._operator):
-        operatorsAuthorizations.value[params._operator] = sp.set(t=sp.TNat)
+    OperatorBlocks.verifyKnownRole(params._operatorRole)
 
     # verify if operator is already existant with the same role.
-    sp.verify(operatorsAuthorizations.value[params._operator].contains(
-        params._operatorRole), message="already authorized")
+    sp.verify(OperatorBlocks.hasRole(
+        params._operatorsAuthorizations.get(params._operator, sp.nat(0)),
+        params._operatorRole
+    ), message="already authorized")
 
-    operatorsAuthorizations.value[params._operator].add(
-        params._operatorRole)
-
-    return operatorsAuthorizations.value
+    updates = sp.local("updates", sp.list([Updates.setRoles(
+        params._operator,
+        params._operatorsAuthorizations.get(params._operator, sp.nat(0))
+        | ROLE.mask(params._operatorRole))]))
+    # A new operator is added to the accounts index.
+    sp.if ~params._operatorsAuthorizations.contains(params._operator):
+        updates.value.push(Updates.addAccount(params._operator))
+    return updates.value
 
 
 @safeLambda(S_revokeOperatorAuthorization)
 def revokeOperatorAuthorization(params):
     OperatorBlocks.isOperatorWithRoleAuthorized(
         params._sender, params._operatorsAuthorizations, ROLE.REGISTRAR)
-
-    operatorsAuthorizations = sp.local(
-        "operatorsAuthorizations", params._operatorsAuthorizations)
-
-    sp.verify(operatorsAuthorizations.value.contains(
-        params._operator), message="undefined operator")
-
-    sp.verify(operatorsAuthorizations.value[params._operator].contains(
-        params._operatorRole), message="undefined operator role")
-
-    operatorsAuthorizations.value[params._operator].remove(
-        params._operatorRole)
-
-    return operatorsAuthorizations.value
+    OperatorBlocks.verifyKnownRole(params._operatorRole)
+
+    roles = sp.local("roles", params._operatorsAuthorizations.get(
+        params._operator, message="undefined operator")).value
+    sp.verify(OperatorBlocks.hasRole(roles, params._operatorRole),
+              message="undefined operator role")
+
+    # An operator left without any role is removed.
+    remainingRoles = sp.local(
+        "remainingRoles", sp.as_nat(roles - ROLE.mask(params._operatorRole))).value
+    updates = sp.local("updates", sp.list([Updates.removeOperator(params._operator)]))
+    sp.if remainingRoles != 0:
+        updates.value = sp.list([Updates.setRoles(params._operator, remainingRoles)])
+    return updates.value
@@ -1,24 +1,30 @@
 from src.globals import *
+from src.common.libs.updates.types import *
 
-T_operatorsAuthorizations = sp.TMap(sp.TAddress, sp.TSet(sp.TNat))
+# Roles bitmask by operator, see roles.mask.
+T_operatorsAuthorizations = sp.TBigMap(sp.TAddress, sp.TNat)
+
+# The entries of operatorsAuthorizations a lambda checks, by operator.
+T_operatorsAuthorizationEntries = sp.TMap(sp.TAddress, sp.TNat)
 
 inputT = sp.TRecord(
     _owner=sp.TAddress,
     _sender=sp.TAddress,
-    _operatorsAuthorizations=T_operatorsAuthorizations,
+    _operatorsAuthorizations=T_operatorsAuthorizationEntries,
     _operator=sp.TAddress,
     _operatorRole=sp.TNat
 )
 
+# _operatorsAuthorizations only holds the entries of _sender and _operator.
 S_ModifyOperatorAutorization = Signature(
     sp.TRecord(
         _owner=sp.TAddress,
         _sender=sp.TAddress,
-        _operatorsAuthorizations=T_operatorsAuthorizations,
+        _operatorsAuthorizations=T_operatorsAuthorizationEntries,
         _operator=sp.TAddress,
         _operatorRole=sp.TNat
     ),
-    T_operatorsAuthorizations
+    T_storageUpdates
 )
 
 S_revokeOperatorAuthorization = S_ModifyOperatorAutorization
@@ -4,18 +4,16 @@ import src.common.constants.settlementStatus as ST_STATUS
 from src.common.libs.subscription.types import *
 
 
-def isSettlementTransactionStatusCorrect(SettlementTransactionRepository, settlementTransactionId, expectedStatus):
+def isSettlementTransactionStatusCorrect(settlementTransaction, expectedStatus):
     sp.if (expectedStatus == ST_STATUS.TOKEN_LOCKED):
         sp.verify(
-            SettlementTransactionRepository.settlementTransactionById[
-                settlementTransactionId].status == ST_STATUS.TOKEN_LOCKED,
+            settlementTransaction.status == ST_STATUS.TOKEN_LOCKED,
             message="subscription ticket not locked"
         )
 
     sp.if (expectedStatus == ST_STATUS.CASH_RECEIVED):
         sp.verify(
-            SettlementTransactionRepository.settlementTransactionById[
-                settlementTransactionId].status == ST_STATUS.CASH_RECEIVED,
+            settlementTransaction.status == ST_STATUS.CASH_RECEIVED,
             message="Cash Not received"
         )
 
@@ -52,3 +50,16 @@ def addStateToSatelessST(st: T_settlementTransactionStateless, state: ST_STATUS)
         status=state,
         txHash=st.txHash
     )
+
+
+def deliver(balances: T_balanceEntries, issuer: sp.TAddress, st: T_settlementTransaction):
+    investor = st.deliveryReceiverAccountNumber
+
+    amount = st.deliveryQuantity
+
+    sp.if ~ balances.contains(investor):
+        balances[investor] = sp.record(locked=sp.nat(0), balance=sp.nat(0))
+
+    balances[investor].balance += amount
+    balances[issuer].balance = sp.as_nat(balances[issuer].balance - amount)
+    balances[issuer].locked = sp.as_nat(balances[issuer].locked - amount)
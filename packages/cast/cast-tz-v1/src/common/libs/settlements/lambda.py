@@ -7,6 +7,8 @@ OperatorBlocks = SPU.importContract(
     "common/libs/operators/blocks.py")
 SettlementBlocks = SPU.importContract(
     "common/libs/settlements/blocks.py")
+Updates = SPU.importContract(
+    "common/libs/updates/blocks.py")
 
 
 @safeLambda(S_confirmPaymentReceived)
@@ -17,39 +19,25 @@ def confirmPaymentReceived(params):
         ROLE.SETTLER
     )
 
-    M_str = sp.local(
-        "settlementTransactionRepository",
-        params.settlementTransactionRepository
-    ).value
+    M_st = sp.local("settlementTransaction", params.settlementTransaction).value
 
     M_balances = sp.local("balances", params.balances).value
 
     # SettlementBlocks.isSettlementTransactionStatusCorrect(
-    #     M_str,
-    #     params.txId,
+    #     M_st,
     #     ST_STATUS.TOKEN_LOCKED
     # )
 
-    txId = params.txId
+    SettlementBlocks.deliver(M_balances, params.owner, M_st)
 
-    issuer = params.owner
+    M_st.status = ST_STATUS.CASH_RECEIVED
 
-    investor = M_str.settlementTransactionById[txId].deliveryReceiverAccountNumber
+    M_updates = sp.local("updates", sp.list(
+        [Updates.setSettlementTransaction(M_st)], t=T_storageUpdate)).value
 
-    amount = M_str.settlementTransactionById[txId].deliveryQuantity
+    Updates.setBalances(M_updates, M_balances, params.balances)
 
-    sp.if ~ M_balances.contains(investor):
-        M_balances[investor] = sp.record(locked=sp.nat(0), balance=sp.nat(0))
-
-    M_balances[investor].balance += amount
-    M_balances[issuer].balance = sp.as_nat(M_balances[issuer].balance - amount)
-    M_balances[issuer].locked = sp.as_nat(M_balances[issuer].locked - amount)
-    M_str.settlementTransactionById[txId].status = ST_STATUS.CASH_RECEIVED
-
-    return sp.record(
-        newSettlementTransactionRepository=M_str,
-        newBalances=M_balances
-    )
+    return M_updates
 
 
 @safeLambda(S_ConfirmPaymentTransferred)
@@ -59,19 +47,63 @@ def confirmPaymentTransferred(params):
         params.operatorsAuthorizations,
         ROLE.SETTLER
     )
-    txId = params.txId
 
-    M_str = sp.local(
-        "settlementTransactionRepository",
-        params.settlementTransactionRepository
-    ).value
+    M_st = sp.local("settlementTransaction", params.settlementTransaction).value
 
     SettlementBlocks.isSettlementTransactionStatusCorrect(
-        M_str,
-        txId,
+        M_st,
         ST_STATUS.CASH_RECEIVED
     )
 
-    M_str.settlementTransactionById[txId].status = ST_STATUS.CASH_SENT
+    M_st.status = ST_STATUS.CASH_SENT
+
+    return sp.list([Updates.setSettlementTransaction(M_st)])
+
+
+@safeLambda(S_confirmPaymentsReceived)
+def confirmPaymentsReceived(params):
+    OperatorBlocks.isOperatorWithRoleAuthorized(
+        params.sender,
+        params.operatorsAuthorizations,
+        ROLE.SETTLER
+    )
+
+    M_balances = sp.local("balances", params.balances).value
+
+    M_updates = sp.local("updates", sp.list(t=T_storageUpdate)).value
+
+    sp.for st in params.settlementTransactions:
+        SettlementBlocks.isSettlementTransactionStatusCorrect(
+            st,
+            ST_STATUS.TOKEN_LOCKED
+        )
+        SettlementBlocks.deliver(M_balances, params.owner, st)
+        M_updates.push(Updates.setSettlementTransaction(
+            SettlementBlocks.addStateToSatelessST(st, ST_STATUS.CASH_RECEIVED)
+        ))
+
+    Updates.setBalances(M_updates, M_balances, params.balances)
+
+    return M_updates
+
+
+@safeLambda(S_ConfirmPaymentsTransferred)
+def confirmPaymentsTransferred(params):
+    OperatorBlocks.isOperatorWithRoleAuthorized(
+        params.sender,
+        params.operatorsAuthorizations,
+        ROLE.SETTLER
+    )
+
+    M_updates = sp.local("updates", sp.list(t=T_storageUpdate)).value
+
+    sp.for st in params.settlementTransactions:
+        SettlementBlocks.isSettlementTransactionStatusCorrect(
+            st,
+            ST_STATUS.CASH_RECEIVED
+        )
+        M_updates.push(Updates.setSettlementTransaction(
+            SettlementBlocks.addStateToSatelessST(st, ST_STATUS.CASH_SENT)
+        ))
 
-    return M_str
+    return M_updates
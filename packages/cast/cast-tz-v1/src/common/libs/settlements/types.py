@@ -1,8 +1,5 @@
 from src.globals import *
 
-from src.common.libs.operators.types import *
-from src.common.libs.balances.types import *
-
 T_settlementTransactionId = sp.TNat
 
 T_settlementTransaction = sp.TRecord(
@@ -16,11 +13,11 @@ T_settlementTransaction = sp.TRecord(
 )
 
 T_settlementTransactionRepository = sp.TRecord(
-    settlementTransactionById=sp.TMap(
+    settlementTransactionById=sp.TBigMap(
         T_settlementTransactionId,
         T_settlementTransaction
     ),
-    operationTypeByOperationId=sp.TMap(sp.TNat, sp.TNat),
+    operationTypeByOperationId=sp.TBigMap(sp.TNat, sp.TNat),
 )
 
 T_settlementTransactionStateless = sp.TRecord(
@@ -31,29 +28,3 @@ T_settlementTransactionStateless = sp.TRecord(
     deliveryQuantity=sp.TNat,
     txHash=sp.TString
 )
-
-S_confirmPaymentReceived = Signature(
-    sp.TRecord(
-        txId=sp.TNat,
-        sender=sp.TAddress,
-        owner=sp.TAddress,
-        operatorsAuthorizations=T_operatorsAuthorizations,
-        settlementTransactionRepository=T_settlementTransactionRepository,
-        balances=T_balances
-    ),
-    sp.TRecord(
-        newSettlementTransactionRepository=T_settlementTransactionRepository,
-        newBalances=T_balances
-    )
-)
-
-S_ConfirmPaymentTransferred = Signature(
-    sp.TRecord(
-        txId=sp.TNat,
-        sender=sp.TAddress,
-        owner=sp.TAddress,
-        operatorsAuthorizations=T_operatorsAuthorizations,
-        settlementTransactionRepository=T_settlementTransactionRepository,
-    ),
-    T_settlementTransactionRepository
-)
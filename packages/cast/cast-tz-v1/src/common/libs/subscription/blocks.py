@@ -0,0 +1,219 @@
+from src.globals import *
+import src.EventSink.constants as EVENT
+import src.EventSink.types as T_Event
+import src.common.constants.operations as OP
+import src.common.constants.settlementStatus as ST_STATUS
+from src.common.libs.subscription.types import *
+
+Balances = SPU.importContract(
+    "common/libs/balances/blocks.py")
+Events = SPU.importContract(
+    "common/libs/events/blocks.py")
+Operators = SPU.importContract(
+    "common/libs/operators/blocks.py")
+Updates = SPU.importContract(
+    "common/libs/updates/blocks.py")
+
+# The entry points shared by the instruments, data being the storage of the
+# instrument and lambdaName the name of its lambda in entrypointsBigMap.
+
+
+def initiateSubscriptions(data, params, lambdaName):
+    sp.set_type(params, sp.TList(T_initiateSubscriptionParams))
+
+    sp.verify(sp.len(params) > 0, message="empty subscription batch")
+
+    L_initSubscriptions = loadLambda(
+        data.entrypointsBigMap,
+        lambdaName,
+        S_initiateSubscriptions
+    )
+
+    txIds = sp.local("txIds", sp.set(t=sp.TNat))
+    newSettlementTransactions = sp.local(
+        "newSettlementTransactions", sp.list(t=T_settlementTransactionStateless))
+    events = sp.local("events", sp.list(t=T_Event.T_event))
+
+    sp.for subscription in params:
+        sp.verify(~data.settlementTransactionRepository.settlementTransactionById.contains(
+            subscription.txId) & ~txIds.value.contains(subscription.txId), message="settlementTransactionId already used")
+
+        sp.verify_equal(data.owner, subscription.deliverySenderAccountNumber, message="deliverySenderAccountNumber must match token owner")
+
+        txIds.value.add(subscription.txId)
+
+        newSettlementTransactions.value.push(sp.record(
+            txId=subscription.txId,
+            operationId=subscription.operationId,
+            deliverySenderAccountNumber=subscription.deliverySenderAccountNumber,
+            deliveryReceiverAccountNumber=subscription.deliveryReceiverAccountNumber,
+            deliveryQuantity=subscription.deliveryQuantity,
+            txHash=subscription.txHash
+        ))
+
+        events.value.push(sp.variant(EVENT.SUBSCRIPTION_INITIATED, sp.record(
+            settlementId=subscription.txId
+        )))
+
+    Updates.apply(data, L_initSubscriptions(sp.record(
+        sender=sp.sender,
+        issuer=data.owner,
+        newSettlementTransactions=newSettlementTransactions.value,
+        operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+            data.operatorsAuthorizations, [sp.sender]),
+        balances=Balances.balanceEntries(data.balances, [data.owner])
+    )))
+
+    # The events of the batch in one operation, in the order of params.
+    Events.callEventSinkWithEvents(data.eventSinkContractAddress, events.value.rev())
+
+
+def settleDvP(data, params, lambdaName):
+    sp.set_type(params, T_initiateSubscriptionParams)
+
+    L_settleDvP = loadLambda(
+        data.entrypointsBigMap,
+        lambdaName,
+        S_settleDvP
+    )
+
+    sp.verify(~data.settlementTransactionRepository.settlementTransactionById.contains(
+        params.txId), message="settlementTransactionId already used")
+
+    sp.verify_equal(data.owner, params.deliverySenderAccountNumber, message="deliverySenderAccountNumber must match token owner")
+
+    Updates.apply(data, L_settleDvP(sp.record(
+        sender=sp.sender,
+        newSettlementTransaction=sp.record(
+            txId=params.txId,
+            operationId=params.operationId,
+            deliverySenderAccountNumber=params.deliverySenderAccountNumber,
+            deliveryReceiverAccountNumber=params.deliveryReceiverAccountNumber,
+            deliveryQuantity=params.deliveryQuantity,
+            txHash=params.txHash
+        ),
+        operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+            data.operatorsAuthorizations, [sp.sender]),
+        balances=Balances.balanceEntries(data.balances, [
+            params.deliverySenderAccountNumber,
+            params.deliveryReceiverAccountNumber
+        ])
+    )))
+
+    Events.callEventSinkWithEvents(data.eventSinkContractAddress, [
+        sp.variant(EVENT.DVP_SETTLED, sp.record(
+            payment=sp.record(
+                settlementId=params.txId,
+                settlementTransactionOperationType=OP.SUBSCRIPTION
+            ),
+            transfer=sp.record(
+                _from=params.deliverySenderAccountNumber,
+                _to=params.deliveryReceiverAccountNumber,
+                _value=params.deliveryQuantity
+            )
+        ))
+    ])
+
+
+def settlementFailure(events, bestEffort, txId, error):
+    sp.if bestEffort:
+        events.push(sp.variant(EVENT.SETTLEMENT_FAILED, sp.record(settlementId=txId, error=error)))
+    sp.else:
+        sp.failwith(error)
+
+
+# Calls found with each settlement transaction of params.txIds in status.
+# The others fail the call, or push a SettlementFailed event to events in
+# best effort.
+def settlementTransactionsWithStatus(data, params, status, error, events, found):
+    sp.set_type(params, T_confirmPaymentsParams)
+    sp.verify(sp.len(params.txIds) > 0, message="empty confirmation batch")
+    txIds = sp.local("txIds", sp.set(t=sp.TNat))
+    sp.for txId in params.txIds:
+        sp.if txIds.value.contains(txId):
+            settlementFailure(events, params.bestEffort, txId, "duplicate settlementTransactionId")
+        sp.else:
+            txIds.value.add(txId)
+            sp.if data.settlementTransactionRepository.settlementTransactionById.contains(txId):
+                st = sp.local(
+                    "settlementTransaction",
+                    data.settlementTransactionRepository.settlementTransactionById[txId]
+                ).value
+                sp.if st.status == status:
+                    found(st)
+                sp.else:
+                    settlementFailure(events, params.bestEffort, txId, error)
+            sp.else:
+                settlementFailure(events, params.bestEffort, txId, "unknown settlementTransactionId")
+
+
+def confirmPaymentsReceived(data, params, lambdaName):
+    L_confirmPaymentsReceived = loadLambda(
+        data.entrypointsBigMap,
+        lambdaName,
+        S_confirmPaymentsReceived
+    )
+
+    settlementTransactions = sp.local(
+        "settlementTransactions", sp.list(t=T_settlementTransaction))
+    balances = Balances.balanceEntries(data.balances, [data.owner])
+    events = sp.local("events", sp.list(t=T_Event.T_event))
+
+    # The events of confirmPaymentReceived for each settlement transaction.
+    def found(st):
+        settlementTransactions.value.push(st)
+        Balances.addBalanceEntry(balances, data.balances, st.deliveryReceiverAccountNumber)
+        events.value.push(sp.variant(EVENT.TRANSFER, sp.record(
+            _from=st.deliverySenderAccountNumber,
+            _to=st.deliveryReceiverAccountNumber,
+            _value=st.deliveryQuantity,
+        )))
+        events.value.push(sp.variant(EVENT.PAYMENT_RECEIVED, sp.record(
+            settlementId=st.txId,
+            settlementTransactionOperationType=OP.SUBSCRIPTION
+        )))
+
+    settlementTransactionsWithStatus(
+        data, params, ST_STATUS.TOKEN_LOCKED, "subscription ticket not locked", events.value, found)
+
+    Updates.apply(data, L_confirmPaymentsReceived(sp.record(
+        sender=sp.sender,
+        owner=data.owner,
+        operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+            data.operatorsAuthorizations, [sp.sender]),
+        settlementTransactions=settlementTransactions.value,
+        balances=balances
+    )))
+
+    Events.callEventSinkWithEvents(data.eventSinkContractAddress, events.value.rev())
+
+
+def confirmPaymentsTransferred(data, params, lambdaName):
+    L_confirmPaymentsTransferred = loadLambda(
+        data.entrypointsBigMap,
+        lambdaName,
+        S_ConfirmPaymentsTransferred
+    )
+
+    settlementTransactions = sp.local(
+        "settlementTransactions", sp.list(t=T_settlementTransaction))
+    events = sp.local("events", sp.list(t=T_Event.T_event))
+
+    def found(st):
+        settlementTransactions.value.push(st)
+        events.value.push(sp.variant(EVENT.PAYMENT_TRANSFERRED, sp.record(
+            settlementId=st.txId,
+            settlementTransactionOperationType=OP.SUBSCRIPTION
+        )))
+
+    settlementTransactionsWithStatus(
+        data, params, ST_STATUS.CASH_RECEIVED, "Cash Not received", events.value, found)
+
+    Updates.apply(data, L_confirmPaymentsTransferred(sp.record(
+        sender=sp.sender,
+        operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+            data.operatorsAuthorizations, [sp.sender]),
+        settlementTransactions=settlementTransactions.value
+    )))
+
+    Events.callEventSinkWithEvents(data.eventSinkContractAddress, events.value.rev())
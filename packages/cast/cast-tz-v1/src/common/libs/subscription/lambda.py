@@ -11,6 +11,8 @@ Settlement = SPU.importContract(
     "common/libs/settlements/blocks.py")
 Balances = SPU.importContract(
     "common/libs/balances/blocks.py")
+Updates = SPU.importContract(
+    "common/libs/updates/blocks.py")
 
 
 @safeLambda(S_initiateSubscription)
@@ -21,32 +23,91 @@ def initiateSubscription(params):
         ROLE.REGISTRAR
     )
 
-    M_stR = sp.local(
-        "settlementRepositoryTransaction",
-        params.settlementTransactionRepository
-    ).value
-
-    M_balances = sp.local("balances", params.balances).value
-
     st = params.newSettlementTransaction
-    txId = params.newSettlementTransaction.txId
-    operationId = params.newSettlementTransaction.operationId
 
     # Settlement.abortIfSettlementTransactionIdExist(M_stR, txId)
 
     M_balances = Balances.lock(
-        M_balances,
+        params.balances,
         st.deliverySenderAccountNumber,
         st.deliveryQuantity
     )
 
-    M_stR.settlementTransactionById[txId] = Settlement.addStateToSatelessST(
-        st,
-        ST_STATUS.TOKEN_LOCKED
+    M_updates = sp.local("updates", sp.list([
+        Updates.setSettlementTransaction(
+            Settlement.addStateToSatelessST(st, ST_STATUS.TOKEN_LOCKED)
+        ),
+        Updates.setOperationType(st.operationId, OP.SUBSCRIPTION),
+    ], t=T_storageUpdate)).value
+
+    Updates.setBalances(M_updates, M_balances, params.balances)
+
+    return M_updates
+
+
+@safeLambda(S_initiateSubscriptions)
+def initiateSubscriptions(params):
+    Operator.isOperatorWithRoleAuthorized(
+        params.sender,
+        params.operatorsAuthorizations,
+        ROLE.REGISTRAR
     )
-    M_stR.operationTypeByOperationId[operationId] = OP.SUBSCRIPTION
 
-    return sp.record(
-        newSettlementRepository=M_stR,
-        newBalances=M_balances,
+    M_updates = sp.local("updates", sp.list(t=T_storageUpdate)).value
+
+    M_quantity = sp.local("quantity", sp.nat(0))
+
+    sp.for st in params.newSettlementTransactions:
+        M_updates.push(Updates.setSettlementTransaction(
+            Settlement.addStateToSatelessST(st, ST_STATUS.TOKEN_LOCKED)
+        ))
+        M_updates.push(Updates.setOperationType(
+            st.operationId, OP.SUBSCRIPTION))
+        M_quantity.value += st.deliveryQuantity
+
+    # The batch is locked at once: the disposable balance of the issuer
+    # covers every subscription iff it covers their sum.
+    M_balances = Balances.lock(
+        params.balances,
+        params.issuer,
+        M_quantity.value
     )
+
+    Updates.setBalances(M_updates, M_balances, params.balances)
+
+    return M_updates
+
+
+@safeLambda(S_settleDvP)
+def settleDvP(params):
+    Operator.isOperatorWithRoleAuthorized(
+        params.sender,
+        params.operatorsAuthorizations,
+        ROLE.REGISTRAR
+    )
+    Operator.isOperatorWithRoleAuthorized(
+        params.sender,
+        params.operatorsAuthorizations,
+        ROLE.SETTLER
+    )
+
+    st = params.newSettlementTransaction
+
+    M_balances = Balances.lock(
+        params.balances,
+        st.deliverySenderAccountNumber,
+        st.deliveryQuantity
+    )
+
+    M_st = Settlement.addStateToSatelessST(st, ST_STATUS.CASH_SENT)
+
+    Settlement.deliver(M_balances, st.deliverySenderAccountNumber, M_st)
+
+    M_updates = sp.local("updates", sp.list([
+        Updates.setSettlementTransaction(M_st),
+        Updates.setOperationType(st.operationId, OP.SUBSCRIPTION),
+    ], t=T_storageUpdate)).value
+
+    Updates.setBalances(M_updates, M_balances, params.balances)
+
+    return M_updates
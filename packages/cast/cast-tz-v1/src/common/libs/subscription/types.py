@@ -2,19 +2,93 @@ from src.globals import *
 from src.common.libs.balances.types import *
 from src.common.libs.operators.types import *
 from src.common.libs.settlements.types import *
+from src.common.libs.updates.types import *
 
+T_initiateSubscriptionParams = sp.TRecord(
+    txId=sp.TNat,
+    operationId=sp.TNat,
+    deliverySenderAccountNumber=sp.TAddress,
+    deliveryReceiverAccountNumber=sp.TAddress,
+    deliveryQuantity=sp.TNat,
+    txHash=sp.TString
+).layout(("txId", ("operationId", ("deliverySenderAccountNumber", ("deliveryReceiverAccountNumber", ("deliveryQuantity", "txHash"))))))
+
+# operatorsAuthorizations and balances only hold the entries of the accounts
+# involved.
 T_initiateSubscriptionInput = sp.TRecord(
     sender=sp.TAddress,
     newSettlementTransaction=T_settlementTransactionStateless,
-    settlementTransactionRepository=T_settlementTransactionRepository,
-    operatorsAuthorizations=T_operatorsAuthorizations,
-    balances=T_balances
+    operatorsAuthorizations=T_operatorsAuthorizationEntries,
+    balances=T_balanceEntries
 )
 
-T_initiateSubscriptionOutput = sp.TRecord(
-    newSettlementRepository=T_settlementTransactionRepository,
-    newBalances=T_balances
+S_initiateSubscription = Signature(
+    T_initiateSubscriptionInput, T_storageUpdates)
+
+# All the settlement transactions are delivered by issuer.
+S_initiateSubscriptions = Signature(
+    sp.TRecord(
+        sender=sp.TAddress,
+        issuer=sp.TAddress,
+        newSettlementTransactions=sp.TList(T_settlementTransactionStateless),
+        operatorsAuthorizations=T_operatorsAuthorizationEntries,
+        balances=T_balanceEntries
+    ),
+    T_storageUpdates
 )
 
-S_initiateSubscription = Signature(
-    T_initiateSubscriptionInput, T_initiateSubscriptionOutput)
+# The sender holds both the registrar and the settler roles.
+S_settleDvP = Signature(
+    sp.TRecord(
+        sender=sp.TAddress,
+        newSettlementTransaction=T_settlementTransactionStateless,
+        operatorsAuthorizations=T_operatorsAuthorizationEntries,
+        balances=T_balanceEntries
+    ),
+    T_storageUpdates
+)
+
+S_confirmPaymentReceived = Signature(
+    sp.TRecord(
+        sender=sp.TAddress,
+        owner=sp.TAddress,
+        operatorsAuthorizations=T_operatorsAuthorizationEntries,
+        settlementTransaction=T_settlementTransaction,
+        balances=T_balanceEntries
+    ),
+    T_storageUpdates
+)
+
+S_ConfirmPaymentTransferred = Signature(
+    sp.TRecord(
+        sender=sp.TAddress,
+        operatorsAuthorizations=T_operatorsAuthorizationEntries,
+        settlementTransaction=T_settlementTransaction,
+    ),
+    T_storageUpdates
+)
+
+T_confirmPaymentsParams = sp.TRecord(
+    txIds=sp.TList(sp.TNat),
+    bestEffort=sp.TBool
+)
+
+S_confirmPaymentsReceived = Signature(
+    sp.TRecord(
+        sender=sp.TAddress,
+        owner=sp.TAddress,
+        operatorsAuthorizations=T_operatorsAuthorizationEntries,
+        settlementTransactions=sp.TList(T_settlementTransaction),
+        balances=T_balanceEntries
+    ),
+    T_storageUpdates
+)
+
+S_ConfirmPaymentsTransferred = Signature(
+    sp.TRecord(
+        sender=sp.TAddress,
+        operatorsAuthorizations=T_operatorsAuthorizationEntries,
+        settlementTransactions=sp.TList(T_settlementTransaction),
+    ),
+    T_storageUpdates
+)
@@ -0,0 +1,59 @@
+from src.globals import *
+import src.common.constants.roles as ROLE
+from src.common.libs.updates.types import *
+
+AddressIndex = SPU.importContract("common/libs/addressIndex/blocks.py")
+
+
+def setSettlementTransaction(st: T_settlementTransaction) -> T_storageUpdate:
+    return sp.variant("setSettlementTransaction", st)
+
+
+def setOperationType(operationId: sp.TNat, operationType: sp.TNat) -> T_storageUpdate:
+    return sp.variant(
+        "setOperationType",
+        sp.record(operationId=operationId, operationType=operationType)
+    )
+
+
+def setBalance(account: sp.TAddress, balance: T_balance) -> T_storageUpdate:
+    return sp.variant("setBalance", sp.record(account=account, balance=balance))
+
+
+def addAccount(account: sp.TAddress) -> T_storageUpdate:
+    return sp.variant("addAccount", account)
+
+
+def setBalances(updates: T_storageUpdates, balances: T_balanceEntries, previous: T_balanceEntries):
+    # Accounts absent from the previous entries are new holders, added to
+    # the accounts index.
+    sp.for entry in balances.items():
+        sp.if ~previous.contains(entry.key):
+            updates.push(addAccount(entry.key))
+        updates.push(setBalance(entry.key, entry.value))
+
+
+def setRoles(operator: sp.TAddress, roles: sp.TNat) -> T_storageUpdate:
+    return sp.variant("setRoles", sp.record(operator=operator, roles=roles))
+
+
+def removeOperator(operator: sp.TAddress) -> T_storageUpdate:
+    return sp.variant("removeOperator", operator)
+
+
+def apply(data, updates: T_storageUpdates):
+    sp.for update in updates:
+        with update.match_cases() as arg:
+            with arg.match("setSettlementTransaction") as st:
+                data.settlementTransactionRepository.settlementTransactionById[st.txId] = st
+            with arg.match("setOperationType") as operation:
+                data.settlementTransactionRepository.operationTypeByOperationId[
+                    operation.operationId] = operation.operationType
+            with arg.match("setBalance") as entry:
+                data.balances[entry.account] = entry.balance
+            with arg.match("addAccount") as account:
+                AddressIndex.append(data.accounts, account)
+            with arg.match("setRoles") as entry:
+                data.operatorsAuthorizations[entry.operator] = entry.roles
+            with arg.match("removeOperator") as operator:
+                del data.operatorsAuthorizations[operator]
@@ -0,0 +1,16 @@
+from src.globals import *
+from src.common.libs.balances.types import *
+from src.common.libs.settlements.types import *
+
+T_storageUpdate = sp.TVariant(
+    setSettlementTransaction=T_settlementTransaction,
+    setOperationType=sp.TRecord(operationId=sp.TNat, operationType=sp.TNat),
+    setBalance=sp.TRecord(account=sp.TAddress, balance=T_balance),
+    setRoles=sp.TRecord(operator=sp.TAddress, roles=sp.TNat),
+    removeOperator=sp.TAddress,
+    addAccount=sp.TAddress,
+)
+
+# What a lambda returns: the entries it changes, applied in order by
+# updates/blocks.apply.
+T_storageUpdates = sp.TList(T_storageUpdate)
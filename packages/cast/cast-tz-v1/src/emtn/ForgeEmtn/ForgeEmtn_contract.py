@@ -3,13 +3,13 @@ import os
 sys.path.append(os.getcwd())
 
 import smartpy as sp
+import src.smpUtils as smpUtils
 
 from src.emtn.ForgeEmtn.types import *
 import src.EventSink.constants as EVENT
 import src.emtn.CreateAndPlayBuilder.lambdaName as LAMBDA
 import src.common.constants.roles as ROLE
 import src.common.constants.settlementStatus as ST_STATUS
-import src.EventSink.types as T_Event
 from src.common.constants.init import *
 import src.common.constants.operations as OP
 
@@ -17,6 +17,12 @@ from src.common.libs.subscription.types import *
 from src.common.libs.settlements.types import *
 from src.common.debug import *
 
+Updates = smpUtils.importContract("common/libs/updates/blocks.py")
+Balances = smpUtils.importContract("common/libs/balances/blocks.py")
+Events = smpUtils.importContract("common/libs/events/blocks.py")
+Operators = smpUtils.importContract("common/libs/operators/blocks.py")
+Subscription = smpUtils.importContract("common/libs/subscription/blocks.py")
+
 
 class ForgeEmtn(sp.Contract):
     def __init__(self):
@@ -33,87 +39,13 @@ class ForgeEmtn(sp.Contract):
         sp.for x in params.items():
             self.data.entrypointsBigMap[x.key] = x.value
 
-    def callEventSinkWithSettlementId(self, settlementId, eventName):
-
-        maybeContract = sp.contract(
-            t=T_Event.T_LightNotif,
-            address=self.data.eventSinkContractAddress,
-            entry_point=eventName
-        )
-        sp.verify(maybeContract.is_some(), "Bad event sink contract address")
-
-        sp.transfer(
-            sp.record(
-                settlementId=settlementId,
-            ),
-            sp.mutez(0),
-            maybeContract.open_some()
-        )
-
-    def callEventSinkWithSettlementIdAndSettlementTransactionOperationType(self, settlementId, settlementTransactionOperationType, eventName):
-
-        maybeContract = sp.contract(
-            t=T_Event.T_paymentNotif,
-            address=self.data.eventSinkContractAddress,
-            entry_point=eventName
-        )
-        sp.verify(maybeContract.is_some(), "Bad event sink contract address")
-
-        sp.transfer(
-            sp.record(
-                settlementId=settlementId,
-                settlementTransactionOperationType=settlementTransactionOperationType,
-            ),
-            sp.mutez(0),
-            maybeContract.open_some()
-        )
-
-    def callOperatorEventSink(self, operator, operatorRole, eventName):
-        maybeContract = sp.contract(
-            t=T_Event.T_operatorChange,
-            address=self.data.eventSinkContractAddress,
-            entry_point=eventName
-        )
-        sp.verify(maybeContract.is_some(), "Bad event sink contract address")
-
-        sp.transfer(
-            sp.record(by=sp.sender, operator=operator,
-                      operatorRole=operatorRole),
-            sp.tez(0),
-            maybeContract.open_some())
-
-    def callEventSinkTransfer(self, txId, stR):
-        st = stR.settlementTransactionById[txId]
-
-        transferInfo = sp.record(
-            _from=st.deliverySenderAccountNumber,
-            _to=st.deliveryReceiverAccountNumber,
-            _value=st.deliveryQuantity,
-        )
-
-        sp.set_type(transferInfo, T_Event.T_TransferInput)
-
-        maybeContract = sp.contract(
-            t=T_Event.T_TransferInput,
-            address=self.data.eventSinkContractAddress,
-            entry_point=EVENT.TRANSFER
-        )
-        sp.verify(maybeContract.is_some(), "Bad event sink contract address")
-
-        sp.transfer(
-            transferInfo,
-            sp.tez(0),
-            maybeContract.open_some())
-
-
-
     ############# ENTRYPOINTS: #############
 
     ############# initiateSubscription #############
 
     @sp.entry_point
     def initiateSubscription(self, params):
-        sp.set_type(params, sp.TRecord(txId = sp.TNat, operationId = sp.TNat, deliverySenderAccountNumber = sp.TAddress, deliveryReceiverAccountNumber = sp.TAddress, deliveryQuantity = sp.TNat, txHash = sp.TString).layout(("txId", ("operationId", ("deliverySenderAccountNumber",("deliveryReceiverAccountNumber",("deliveryQuantity","txHash")))))))
+        sp.set_type(params, T_initiateSubscriptionParams)
         
         L_initSubscription = loadLambda(
             self.data.entrypointsBigMap,
@@ -135,30 +67,42 @@ class ForgeEmtn(sp.Contract):
             txHash=params.txHash
         )
 
-        result = L_initSubscription(sp.record(
+        Updates.apply(self.data, L_initSubscription(sp.record(
             sender=sp.sender,
             newSettlementTransaction=newSettlementTransaction,
-            settlementTransactionRepository=self.data.settlementTransactionRepository,
-            operatorsAuthorizations=self.data.operatorsAuthorizations,
-            balances=self.data.balances
-        ))
+            operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+                self.data.operatorsAuthorizations, [sp.sender]),
+            balances=Balances.balanceEntries(self.data.balances, [params.deliverySenderAccountNumber])
+        )))
 
-        self.data.settlementTransactionRepository = result.newSettlementRepository
-        self.data.balances = result.newBalances
+        Events.callEventSinkWithEvents(self.data.eventSinkContractAddress, [
+            sp.variant(EVENT.SUBSCRIPTION_INITIATED, sp.record(settlementId=params.txId))
+        ])
 
-        self.callEventSinkWithSettlementId(
-            settlementId=params.txId,
-            eventName=EVENT.SUBSCRIPTION_INITIATED
-        )
+    ############# initiateSubscriptions #############
+
+    @sp.entry_point
+    def initiateSubscriptions(self, params):
+        Subscription.initiateSubscriptions(self.data, params, LAMBDA.INITIATE_SUBSCRIPTIONS)
+
+    ############# settleDvP #############
+
+    @sp.entry_point
+    def settleDvP(self, params):
+        Subscription.settleDvP(self.data, params, LAMBDA.SETTLE_DVP)
 
     ############# confirmPaymentReceived #############
 
     @sp.entry_point
     def confirmPaymentReceived(self, params):
 
+        st = sp.local(
+            "settlementTransaction",
+            self.data.settlementTransactionRepository.settlementTransactionById[params.txId]
+        ).value
+
         sp.verify(
-            self.data.settlementTransactionRepository.settlementTransactionById[
-                params.txId].status == ST_STATUS.TOKEN_LOCKED,
+            st.status == ST_STATUS.TOKEN_LOCKED,
             message="subscription ticket not locked"
         )
 
@@ -168,25 +112,29 @@ class ForgeEmtn(sp.Contract):
             S_confirmPaymentReceived
         )
 
-        result = L_confirmPaymentReceived(sp.record(
-            txId=params.txId,
+        Updates.apply(self.data, L_confirmPaymentReceived(sp.record(
             sender=sp.sender,
             owner=self.data.owner,
-            operatorsAuthorizations=self.data.operatorsAuthorizations,
-            settlementTransactionRepository=self.data.settlementTransactionRepository,
-            balances=self.data.balances
-        ))
-
-        self.data.settlementTransactionRepository = result.newSettlementTransactionRepository
-        self.data.balances = result.newBalances
-
-        self.callEventSinkTransfer(params.txId, self.data.settlementTransactionRepository)
-
-        self.callEventSinkWithSettlementIdAndSettlementTransactionOperationType(
-            settlementId=params.txId,
-            settlementTransactionOperationType=OP.SUBSCRIPTION,
-            eventName=EVENT.PAYMENT_RECEIVED
-        )
+            operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+                self.data.operatorsAuthorizations, [sp.sender]),
+            settlementTransaction=st,
+            balances=Balances.balanceEntries(self.data.balances, [
+                self.data.owner,
+                st.deliveryReceiverAccountNumber
+            ])
+        )))
+
+        Events.callEventSinkWithEvents(self.data.eventSinkContractAddress, [
+            sp.variant(EVENT.TRANSFER, sp.record(
+                _from=st.deliverySenderAccountNumber,
+                _to=st.deliveryReceiverAccountNumber,
+                _value=st.deliveryQuantity,
+            )),
+            sp.variant(EVENT.PAYMENT_RECEIVED, sp.record(
+                settlementId=params.txId,
+                settlementTransactionOperationType=OP.SUBSCRIPTION
+            ))
+        ])
 
     ############# confirmPaymentTransferred #############
 
@@ -199,21 +147,30 @@ class ForgeEmtn(sp.Contract):
             S_ConfirmPaymentTransferred
         )
 
-        result = L_confirmPaymentTransferred(sp.record(
-            txId=params.txId,
+        Updates.apply(self.data, L_confirmPaymentTransferred(sp.record(
             sender=sp.sender,
-            owner=self.data.owner,
-            operatorsAuthorizations=self.data.operatorsAuthorizations,
-            settlementTransactionRepository=self.data.settlementTransactionRepository,
-        ))
+            operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+                self.data.operatorsAuthorizations, [sp.sender]),
+            settlementTransaction=self.data.settlementTransactionRepository.settlementTransactionById[
+                params.txId],
+        )))
+
+        Events.callEventSinkWithEvents(self.data.eventSinkContractAddress, [
+            sp.variant(EVENT.PAYMENT_TRANSFERRED, sp.record(
+                settlementId=params.txId,
+                settlementTransactionOperationType=OP.SUBSCRIPTION
+            ))
+        ])
 
-        self.data.settlementTransactionRepository = result
+    ############# confirmPaymentsReceived & confirmPaymentsTransferred #############
 
-        self.callEventSinkWithSettlementIdAndSettlementTransactionOperationType(
-            settlementId=params.txId,
-            settlementTransactionOperationType=OP.SUBSCRIPTION,
-            eventName=EVENT.PAYMENT_TRANSFERRED
-        )
+    @sp.entry_point
+    def confirmPaymentsReceived(self, params):
+        Subscription.confirmPaymentsReceived(self.data, params, LAMBDA.CONFIRM_PAYMENTS_RECEIVED)
+
+    @sp.entry_point
+    def confirmPaymentsTransferred(self, params):
+        Subscription.confirmPaymentsTransferred(self.data, params, LAMBDA.CONFIRM_PAYMENTS_TRANSFERRED)
 
     ############# authorizeOperator & revokeOperatorAuthorization #############
 
@@ -223,42 +180,34 @@ class ForgeEmtn(sp.Contract):
                                        _operator=sp.TAddress, _operatorRole=sp.TNat))
 
         # entrypointName = callAuthorizeOperator or callRevokeOperatorAuthorization
-        epBytesScript = self.data.entrypointsBigMap[sp.pack(
-            params.entrypointName)]
-
-        epScript = sp.unpack(
-            epBytesScript,
-            t=sp.TLambda(
-                sp.TRecord(
-                    _owner=sp.TAddress,
-                    _sender=sp.TAddress,
-                    _operatorsAuthorizations=T_operatorsAuthorizations,
-                    _operator=sp.TAddress,
-                    _operatorRole=sp.TNat
-                ),
-                T_operatorsAuthorizations
-            ))
+        epScript = loadLambda(
+            self.data.entrypointsBigMap,
+            params.entrypointName,
+            S_ModifyOperatorAutorization
+        )
 
-        epParams = sp.record(
+        Updates.apply(self.data, epScript(sp.record(
             _owner=self.data.owner,
             _sender=sp.sender,
-            _operatorsAuthorizations=self.data.operatorsAuthorizations,
+            _operatorsAuthorizations=Operators.operatorsAuthorizationsEntries(
+                self.data.operatorsAuthorizations,
+                [sp.sender, params._operator]),
             _operator=params._operator,
             _operatorRole=params._operatorRole
-        )
-
-        updatedOperatorsAuthorizations = epScript.open_some()(epParams)
-
-        self.data.operatorsAuthorizations = updatedOperatorsAuthorizations
+        )))
 
         # EventSink call will be fired according to entrypoint name passed in params only after operation success.
 
+        operatorChange = sp.record(
+            by=sp.sender, operator=params._operator, operatorRole=params._operatorRole)
         sp.if (params.entrypointName == LAMBDA.AUTHORIZE_OPERATOR):
-            self.callOperatorEventSink(
-                params._operator, params._operatorRole, "newOperator")
+            Events.callEventSinkWithEvents(self.data.eventSinkContractAddress, [
+                sp.variant(EVENT.NEW_OPERATOR, operatorChange)
+            ])
         sp.if (params.entrypointName == LAMBDA.REVOKE_OPERATOR_AUTHORIZATION):
-            self.callOperatorEventSink(
-                params._operator, params._operatorRole, "revokeOperator")
+            Events.callEventSinkWithEvents(self.data.eventSinkContractAddress, [
+                sp.variant(EVENT.REVOKE_OPERATOR, operatorChange)
+            ])
 
 sp.add_compilation_target("ForgeEmtn", (ForgeEmtn()))
 contract = ForgeEmtn()
@@ -1,10 +1,12 @@
 from src.common.libs.operators.types import *
 from src.common.libs.settlements.types import *
 from src.common.libs.balances.types import *
+from src.common.libs.addressIndex.types import *
 
 T_forgeEmtnStorage = sp.TRecord(
     settlementTransactionRepository=T_settlementTransactionRepository,
     balances=T_balances,
+    accounts=T_addressIndex,
     operatorsAuthorizations=T_operatorsAuthorizations,
     entrypointsBigMap=sp.TBigMap(sp.TBytes, sp.TBytes),
     owner=sp.TAddress,
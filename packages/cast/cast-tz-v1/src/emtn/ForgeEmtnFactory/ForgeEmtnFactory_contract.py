@@ -10,6 +10,7 @@ import src.smpUtils as smpUtils
 
 ForgeEmtn = smpUtils.importContract(
     "emtn/ForgeEmtn/ForgeEmtn_contract.py").ForgeEmtn
+AddressIndex = smpUtils.importContract("common/libs/addressIndex/blocks.py")
 
 
 class ForgeEmtnFactory(sp.Contract):
@@ -28,24 +29,42 @@ class ForgeEmtnFactory(sp.Contract):
         )
 
     def newInitialBalances(self, initialSupply, issuer):
-        return sp.map({
+        return sp.big_map({
             issuer: sp.record(balance=initialSupply, locked=sp.nat(0))
         })
 
+    # A registrar that is also the settler holds both roles.
+    def newOperatorsAuthorizations(self, registrar, settler):
+        operatorsAuthorizations = sp.local(
+            "operatorsAuthorizations",
+            sp.big_map({registrar: ROLE.mask(ROLE.REGISTRAR)})
+        )
+        operatorsAuthorizations.value[settler] = operatorsAuthorizations.value.get(
+            settler, sp.nat(0)) | ROLE.mask(ROLE.SETTLER)
+        return operatorsAuthorizations.value
+
+    # The owner holds the initial supply, the registrar and the settler
+    # their roles.
+    def newAccountsIndex(self, owner, registrar, settler):
+        accounts = sp.local("accounts", AddressIndex.newAddressIndex(owner))
+        sp.if registrar != owner:
+            AddressIndex.append(accounts.value, registrar)
+        sp.if (settler != owner) & (settler != registrar):
+            AddressIndex.append(accounts.value, settler)
+        return accounts.value
+
     def createForgeEmtnContract(self, registryAddress, owner, registrar, settler, initialSupply, isinCode, name, symbol, currency):
 
         createdForgeEmtnAddress = sp.create_contract(
             storage=sp.record(
                 settlementTransactionRepository=sp.record(
-                    settlementTransactionById=sp.map(
+                    settlementTransactionById=sp.big_map(
                         tkey=T_settlementTransactionId, tvalue=T_settlementTransaction),
-                    operationTypeByOperationId=sp.map(
+                    operationTypeByOperationId=sp.big_map(
                         tkey=sp.TNat, tvalue=sp.TNat),
                 ),
-                operatorsAuthorizations=sp.map({
-                    registrar: sp.set([ROLE.REGISTRAR]),
-                    settler: sp.set([ROLE.SETTLER])
-                }),
+                operatorsAuthorizations=self.newOperatorsAuthorizations(
+                    registrar, settler),
                 entrypointsBigMap=self.data.entrypointsBigMap,
                 owner=owner,
                 initialSupply=initialSupply,
@@ -55,7 +74,8 @@ class ForgeEmtnFactory(sp.Contract):
                 symbol=symbol,
                 currency=currency,
                 eventSinkContractAddress=self.data.eventSinkContractAddress,
-                balances=self.newInitialBalances(initialSupply, owner)
+                balances=self.newInitialBalances(initialSupply, owner),
+                accounts=self.newAccountsIndex(owner, registrar, settler)
             ),
             contract=self.forgeEmtn
         )
@@ -0,0 +1,475 @@
+import { TezosToolkit } from '@taquito/taquito';
+import { importKey } from '@taquito/signer';
+import { assert, expect } from 'chai';
+import { BigNumber } from 'bignumber.js';
+import {
+  extractAddressFromSecret,
+  getNetworkConfig,
+  getTezosToolkitRegistrar,
+} from '../../../scripts/toolchain/utils';
+import { NetworkConfig } from '../../../scripts/toolchain/type';
+import {
+  buildCustomTokenEMTN,
+  buildSubscriptionArgs,
+  CASH_RECEIVED,
+  CASH_SENT,
+  TOKEN_LOCKED,
+} from '../../utils/tokenUtils';
+import {
+  eventsOf,
+  getEventSinkCalls,
+  settlementIdOf,
+} from '../../utils/eventUtils';
+import * as minimist from 'minimist';
+import * as chai from 'chai';
+import * as chaiAsPromised from 'chai-as-promised';
+
+chai.use(chaiAsPromised);
+
+function getRandomInt(max): number {
+  return Math.floor(Math.random() * Math.floor(max));
+}
+
+// Three consecutive txIds, the first one random.
+const firstTxId = getRandomInt(1000000000);
+const txIds = [firstTxId, firstTxId + 1, firstTxId + 2];
+const unknownTxId = firstTxId + 3;
+
+const subscription = (
+  receiver: string,
+  quantity: number,
+  txId: number,
+  owner: string,
+) => {
+  const [
+    id,
+    operationId,
+    deliverySenderAccountNumber,
+    deliveryReceiverAccountNumber,
+    deliveryQuantity,
+    txHash,
+  ] = buildSubscriptionArgs(receiver, quantity, txId, owner);
+  return {
+    txId: id,
+    operationId,
+    deliverySenderAccountNumber,
+    deliveryReceiverAccountNumber,
+    deliveryQuantity,
+    txHash,
+  };
+};
+
+describe('ForgeToken EMTN: batch settlement and settleDvP', function () {
+  let Tezos: TezosToolkit;
+  let networkConfig: NetworkConfig;
+  let token;
+  let investor: string;
+
+  const createForgeEmtn = async (registrar: string, settler: string) => {
+    const forgeTokenFactoryContract = await Tezos.contract.at(
+      networkConfig.contractConfig.FACTORY_EMTN,
+    );
+    const args = buildCustomTokenEMTN(
+      networkConfig.contractConfig.ADMIN,
+      networkConfig.contractConfig.ADMIN,
+      settler,
+    );
+
+    const createForgeTokenOp = await forgeTokenFactoryContract.methods
+      .createForgeEmtn(
+        args.currency,
+        args.initialSupply,
+        args.isinCode,
+        args.name,
+        args.owner,
+        registrar,
+        networkConfig.contractConfig.REGISTRY,
+        args.settler,
+        args.symbol,
+      )
+      .send();
+    await createForgeTokenOp.confirmation();
+
+    const instrumentRegistryContract = await Tezos.contract.at(
+      networkConfig.contractConfig.REGISTRY,
+    );
+    const registryStorage = (await instrumentRegistryContract.storage()) as any;
+    const bigMapResult = await registryStorage.tokensByIsinCode.get(
+      args.isinCode,
+    );
+    console.log('new tokenContractAddress: ', bigMapResult.address);
+    return { args, contract: await Tezos.contract.at(bigMapResult.address) };
+  };
+
+  const statusOf = async (contract, txId: number): Promise<number> => {
+    const storage = (await contract.storage()) as any;
+    const settlementTransaction =
+      await storage.settlementTransactionRepository.settlementTransactionById.get(
+        txId.toString(),
+      );
+    return new BigNumber(settlementTransaction.status).toNumber();
+  };
+
+  const balanceOf = async (contract, account: string): Promise<number> => {
+    const storage = (await contract.storage()) as any;
+    const balance = await storage.balances.get(account);
+    return new BigNumber(balance.balance).toNumber();
+  };
+
+  const eventSinkCalls = async (contract, operation) => {
+    const storage = (await contract.storage()) as any;
+    return getEventSinkCalls(
+      Tezos,
+      operation,
+      storage.eventSinkContractAddress,
+    );
+  };
+
+  before(async function () {
+    const argv = minimist<{ ['network-folder']: string }>(
+      process.argv.slice(2),
+    );
+    const networkFolder = argv['network-folder'] ?? process.env.NETWORK_FOLDER;
+    networkConfig = getNetworkConfig(networkFolder);
+    Tezos = await getTezosToolkitRegistrar(networkConfig);
+    investor = extractAddressFromSecret(networkConfig.keysConfig.DEALER_1);
+  });
+
+  describe('initiateSubscriptions and confirmPayments', function () {
+    let forgeToken;
+
+    before(async function () {
+      console.log('===== BEGIN BEFORE HOOK =====');
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const created = await createForgeEmtn(
+        extractAddressFromSecret(networkConfig.keysConfig.REGISTRAR),
+        extractAddressFromSecret(networkConfig.keysConfig.ISSUER_1),
+      );
+      token = created.args;
+      forgeToken = created.contract;
+      console.log('===== END BEFORE HOOK =====');
+    });
+
+    it('initiateSubscriptions, should fail with an empty batch', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operationPromise = forgeToken.methodsObject
+        .initiateSubscriptions([])
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*empty subscription batch*/,
+      );
+    });
+
+    it('initiateSubscriptions, should fail when sender has not the registrar role', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = forgeToken.methodsObject
+        .initiateSubscriptions(
+          txIds.map((txId) => subscription(investor, 1, txId, token.owner)),
+        )
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*only operator with registrar role can lock token*/,
+      );
+    });
+
+    it('initiateSubscriptions, should fail when a txId is repeated', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operationPromise = forgeToken.methodsObject
+        .initiateSubscriptions([
+          subscription(investor, 1, txIds[0], token.owner),
+          subscription(investor, 1, txIds[0], token.owner),
+        ])
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*settlementTransactionId already used*/,
+      );
+    });
+
+    it('initiateSubscriptions, should lock every subscription and send their events in one call', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operation = await forgeToken.methodsObject
+        .initiateSubscriptions(
+          txIds.map((txId, i) =>
+            subscription(investor, i + 1, txId, token.owner),
+          ),
+        )
+        .send();
+      await operation.confirmation(1, 1);
+
+      for (const txId of txIds) {
+        assert.equal(await statusOf(forgeToken, txId), TOKEN_LOCKED);
+      }
+
+      const calls = await eventSinkCalls(forgeToken, operation);
+      assert.deepEqual(
+        calls.map((call) => call.entrypoint),
+        ['events'],
+      );
+      const events = eventsOf(calls[0]);
+      assert.deepEqual(
+        events.map(([name]) => name),
+        [
+          'SubscriptionInitiated',
+          'SubscriptionInitiated',
+          'SubscriptionInitiated',
+        ],
+      );
+      assert.deepEqual(
+        events.map(([, value]) => settlementIdOf(value)),
+        txIds,
+      );
+    });
+
+    it('confirmPaymentsReceived, should fail when sender has not the settler role', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsReceived({ txIds, bestEffort: false })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*only operator with settler role can settle token*/,
+      );
+    });
+
+    it('confirmPaymentsReceived, should fail with an empty batch', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsReceived({ txIds: [], bestEffort: true })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*empty confirmation batch*/,
+      );
+    });
+
+    it('confirmPaymentsTransferred, should fail when cash was not received', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsTransferred({ txIds, bestEffort: false })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*Cash Not received*/,
+      );
+    });
+
+    it('confirmPaymentsReceived, should fail on an unknown txId unless in best effort', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsReceived({
+          txIds: [...txIds, unknownTxId],
+          bestEffort: false,
+        })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*unknown settlementTransactionId*/,
+      );
+    });
+
+    it('confirmPaymentsReceived, should deliver every subscription and send their events in one call', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const issuerBalance = await balanceOf(forgeToken, token.owner);
+
+      const operation = await forgeToken.methodsObject
+        .confirmPaymentsReceived({
+          txIds: [...txIds, unknownTxId],
+          bestEffort: true,
+        })
+        .send();
+      await operation.confirmation(1, 1);
+
+      for (const txId of txIds) {
+        assert.equal(await statusOf(forgeToken, txId), CASH_RECEIVED);
+      }
+      assert.equal(
+        await balanceOf(forgeToken, token.owner),
+        issuerBalance - 6,
+      );
+      assert.equal(await balanceOf(forgeToken, investor), 6);
+
+      const calls = await eventSinkCalls(forgeToken, operation);
+      assert.deepEqual(
+        calls.map((call) => call.entrypoint),
+        ['events'],
+      );
+      const events = eventsOf(calls[0]);
+      assert.deepEqual(
+        events.map(([name]) => name),
+        [
+          'Transfer',
+          'PaymentReceived',
+          'Transfer',
+          'PaymentReceived',
+          'Transfer',
+          'PaymentReceived',
+          'SettlementFailed',
+        ],
+      );
+      assert.deepEqual(
+        events
+          .filter(([name]) => name !== 'Transfer')
+          .map(([, value]) => settlementIdOf(value)),
+        [...txIds, unknownTxId],
+      );
+      assert.equal(
+        events[events.length - 1][1].error,
+        'unknown settlementTransactionId',
+      );
+    });
+
+    it('confirmPaymentsReceived, should fail when the subscriptions are not locked', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsReceived({ txIds, bestEffort: false })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*subscription ticket not locked*/,
+      );
+    });
+
+    it('confirmPaymentsTransferred, should fail when sender has not the settler role', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsTransferred({ txIds, bestEffort: false })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*only operator with settler role can settle token*/,
+      );
+    });
+
+    it('confirmPaymentsTransferred, should fail with an empty batch', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = forgeToken.methodsObject
+        .confirmPaymentsTransferred({ txIds: [], bestEffort: false })
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*empty confirmation batch*/,
+      );
+    });
+
+    it('confirmPaymentsTransferred, should close every subscription and send their events in one call', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operation = await forgeToken.methodsObject
+        .confirmPaymentsTransferred({ txIds, bestEffort: false })
+        .send();
+      await operation.confirmation(1, 1);
+
+      for (const txId of txIds) {
+        assert.equal(await statusOf(forgeToken, txId), CASH_SENT);
+      }
+
+      const calls = await eventSinkCalls(forgeToken, operation);
+      assert.deepEqual(
+        calls.map((call) => call.entrypoint),
+        ['events'],
+      );
+      const events = eventsOf(calls[0]);
+      assert.deepEqual(
+        events.map(([name]) => name),
+        ['PaymentTransferred', 'PaymentTransferred', 'PaymentTransferred'],
+      );
+      assert.deepEqual(
+        events.map(([, value]) => settlementIdOf(value)),
+        txIds,
+      );
+    });
+  });
+
+  describe('settleDvP', function () {
+    let forgeToken;
+    let dvpToken;
+    const txId = getRandomInt(1000000000);
+
+    before(async function () {
+      console.log('===== BEGIN BEFORE HOOK =====');
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const registrar = extractAddressFromSecret(
+        networkConfig.keysConfig.REGISTRAR,
+      );
+      // The registrar of forgeToken is not its settler, the one of dvpToken is.
+      forgeToken = (
+        await createForgeEmtn(
+          registrar,
+          extractAddressFromSecret(networkConfig.keysConfig.ISSUER_1),
+        )
+      ).contract;
+      const created = await createForgeEmtn(registrar, registrar);
+      token = created.args;
+      dvpToken = created.contract;
+      console.log('===== END BEFORE HOOK =====');
+    });
+
+    it('should fail when sender has not the settler role', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operationPromise = forgeToken.methodsObject
+        .settleDvP(subscription(investor, 1, txId, token.owner))
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*only operator with settler role can settle token*/,
+      );
+    });
+
+    it('should fail when sender is not an operator', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.ISSUER_1);
+      const operationPromise = dvpToken.methodsObject
+        .settleDvP(subscription(investor, 1, txId, token.owner))
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*undefined operator*/,
+      );
+    });
+
+    it('should settle a subscription in one operation and send DvPSettled', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operation = await dvpToken.methodsObject
+        .settleDvP(subscription(investor, 2, txId, token.owner))
+        .send();
+      await operation.confirmation(1, 1);
+
+      assert.equal(await statusOf(dvpToken, txId), CASH_SENT);
+      assert.equal(await balanceOf(dvpToken, investor), 2);
+      assert.equal(
+        await balanceOf(dvpToken, token.owner),
+        token.initialSupply - 2,
+      );
+
+      const calls = await eventSinkCalls(dvpToken, operation);
+      assert.deepEqual(
+        calls.map((call) => call.entrypoint),
+        ['events'],
+      );
+      const events = eventsOf(calls[0]);
+      assert.deepEqual(
+        events.map(([name]) => name),
+        ['DvPSettled'],
+      );
+      const [[, dvpSettled]] = events;
+      assert.equal(settlementIdOf(dvpSettled.payment), txId);
+      assert.equal(new BigNumber(dvpSettled.transfer._value).toNumber(), 2);
+    });
+
+    it('should fail when the txId is already used', async function () {
+      await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+      const operationPromise = dvpToken.methodsObject
+        .settleDvP(subscription(investor, 1, txId, token.owner))
+        .send();
+      await expect(operationPromise).to.be.rejectedWith(
+        /.*settlementTransactionId already used*/,
+      );
+    });
+  });
+
+  describe('EventSink', function () {
+    it('should take the batch events through events only', async function () {
+      const eventSink = await Tezos.contract.at(
+        networkConfig.contractConfig.SINK,
+      );
+      const entrypoints = Object.keys(eventSink.entrypoints.entrypoints);
+      expect(entrypoints).to.include('events');
+      for (const removed of [
+        'SubscriptionsInitiated',
+        'PaymentsReceived',
+        'PaymentsTransferred',
+      ]) {
+        expect(entrypoints).to.not.include(removed);
+      }
+    });
+  });
+});
@@ -6,7 +6,7 @@ import {
   getTezosToolkitRegistrar,
 } from '../../../scripts/toolchain/utils';
 import { NetworkConfig } from '../../../scripts/toolchain/type';
-import { REGISTRAR_ROLE } from '../../utils/tokenUtils';
+import { REGISTRAR_ROLE, UNKNOWN_ROLE } from '../../utils/tokenUtils';
 import * as minimist from 'minimist';
 import * as chai from 'chai';
 import { expect } from 'chai';
@@ -118,4 +118,34 @@ describe('ForgeToken: authorizeOperator & revokeOperatorAuthozization', function
       /.*undefined operator*/,
     );
   });
+
+  it('should fail when authorizeOperator() is called with an unknown role', async function () {
+    await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+    const authorizeOperatorOp = tokenContract.methods
+      .run(
+        networkConfig.contractConfig.ADMIN,
+        UNKNOWN_ROLE,
+        'callAuthorizeOperator',
+      )
+      .send();
+
+    await expect(authorizeOperatorOp).to.be.rejectedWith(
+      /.*unknown operator role*/,
+    );
+  });
+
+  it('should fail when revokeOperatorAuthorization() is called with an unknown role', async function () {
+    await importKey(Tezos, networkConfig.keysConfig.REGISTRAR);
+    const revokeOperatorAuthorizationOp = tokenContract.methods
+      .run(
+        networkConfig.contractConfig.ADMIN,
+        UNKNOWN_ROLE,
+        'callRevokeOperatorAuthorization',
+      )
+      .send();
+
+    await expect(revokeOperatorAuthorizationOp).to.be.rejectedWith(
+      /.*unknown operator role*/,
+    );
+  });
 });
@@ -1,3 +1,5 @@
+import functools
+
 import smartpy as sp
 import src.smpUtils as SPU
 
@@ -10,6 +12,7 @@ class Signature():
 
 def safeLambda(signature: Signature):
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(params):
             sp.set_type(params, signature.inputType)
 
@@ -4,5 +4,10 @@ import os
 
 def importContract(pathFromRoot):
     (_, contractName) = os.path.splitext(os.path.basename(pathFromRoot))
-    code = open(os.path.join(os.getcwd(), 'src', pathFromRoot), "r").read()
+    path = os.path.join(os.getcwd(), 'src', pathFromRoot)
+    # The SmartPy of the build toolchain (npx smp) has no
+    # import_script_from_file, only the vendored package does.
+    if hasattr(sp.io, "import_script_from_file"):
+        return sp.io.import_script_from_file(path, contractName)
+    code = open(path, "r").read()
     return sp.io.import_script_from_script(contractName, code)
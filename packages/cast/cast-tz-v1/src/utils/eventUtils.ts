@@ -0,0 +1,41 @@
+import { TezosToolkit } from '@taquito/taquito';
+import { ParameterSchema } from '@taquito/michelson-encoder';
+import { BigNumber } from 'bignumber.js';
+
+export type EventSinkCall = {
+  entrypoint: string;
+  value: any;
+};
+
+// The calls an operation made to the event sink, in order, each value
+// decoded with the type of its entry point.
+export const getEventSinkCalls = async (
+  Tezos: TezosToolkit,
+  operation: any,
+  eventSinkAddress: string,
+): Promise<EventSinkCall[]> => {
+  const eventSink = await Tezos.contract.at(eventSinkAddress);
+  const calls: EventSinkCall[] = [];
+  for (const content of operation.operationResults) {
+    for (const internal of content.metadata.internal_operation_results ?? []) {
+      if (
+        internal.kind === 'transaction' &&
+        internal.destination === eventSinkAddress
+      ) {
+        const { entrypoint, value } = internal.parameters;
+        const schema = new ParameterSchema(
+          eventSink.entrypoints.entrypoints[entrypoint],
+        );
+        calls.push({ entrypoint, value: schema.Execute(value) });
+      }
+    }
+  }
+  return calls;
+};
+
+// The events of a call to the events entry point, as [name, value] pairs.
+export const eventsOf = (call: EventSinkCall): [string, any][] =>
+  call.value.map((event) => Object.entries(event)[0]);
+
+export const settlementIdOf = (value: any): number =>
+  new BigNumber(value.settlementId ?? value).toNumber();
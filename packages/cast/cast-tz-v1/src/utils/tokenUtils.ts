@@ -4,6 +4,7 @@ export const TOKEN_LOCKED = 2;
 export const ERROR = 255;
 export const REGISTRAR_ROLE = 1;
 export const SETTLER_ROLE = 2;
+export const UNKNOWN_ROLE = 3;
 export const CASH_RECEIVED = 3;
 export const CASH_SENT = 4;
 
@@ -25,6 +25,8 @@ import { BlockchainService } from '../../shared/services/blockchain.service';
 import {
   ForgeBond,
   ForgeBondAllEvents,
+  ForgeBondEventsEvent,
+  FORGEBOND_CONTRACT_EVENT_EVENTS,
   FORGEBOND_CONTRACT_EVENT_PAYMENT_RECEIVED,
   FORGEBOND_CONTRACT_EVENT_PAYMENT_TRANSFERRED,
   FORGEBOND_CONTRACT_EVENT_REDEMPTION_INITIATED,
@@ -40,6 +42,7 @@ import {
   OPERATION_TYPE_SUBSCRIPTION,
   OPERATION_TYPE_TRADE,
   OPERATION_TYPE_REDEMPTION,
+  splitEvents,
 } from '@castframework/cast-interface-v1';
 
 type EventHandler = (
@@ -263,9 +266,15 @@ export class EventService {
   }
 
   private async executeInstrumentEventHandlers(
-    event: ForgeBondAllEvents,
+    event: ForgeBondAllEvents | ForgeBondEventsEvent,
     LedgerType: Ledger,
   ): Promise<void> {
+    if (event.eventName === FORGEBOND_CONTRACT_EVENT_EVENTS) {
+      for (const single of splitEvents(event)) {
+        await this.executeInstrumentEventHandlers(single, LedgerType);
+      }
+      return;
+    }
     const { eventName } = event;
 
     const handlers: EventHandler[] =